@@ -1,11 +1,149 @@
-from django.contrib import admin
+"""
+Админка для больших таблиц постов, комментариев и лайков.
 
-from .models import Comment
-from .models import Post
-from .models import Like
+- Число строк без фильтров берётся из статистики PostgreSQL (reltuples)
+  вместо COUNT(*) по всей таблице; общий счётчик при фильтрах не считается.
+- Связанные пользователь и пост подгружаются JOIN (list_select_related),
+  внешние ключи редактируются по id, без <select> со всеми строками.
+- Фильтры только по проиндексированным полям.
+- Массовые действия выполняются одним UPDATE/DELETE, без загрузки строк
+  и сигналов Django; счётчики постов и кеш исправляются пачкой.
+"""
+from collections import defaultdict
 
-# Register your models here.
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.utils.functional import cached_property
 
-admin.site.register(Post)
-admin.site.register(Comment)
-admin.site.register(Like)
+from .cache import invalidate_post
+from .models import Comment, Like, Post
+from .purge import delete_without_signals, soft_delete_posts
+
+
+class EstimatedCountPaginator(Paginator):
+    # Меньше этого числа строк оценке не верим: точный COUNT(*) дёшев
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            # -1 — таблицу ещё не анализировали
+            if row is not None and row[0] >= self.estimate_threshold:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице для «показать все» при фильтрах
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_actions(self, request):
+        # Стандартное удаление загружает строки и зависимые объекты в память
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+def _decrement_counters(queryset, field):
+    # Сколько строк удаляется у каждого поста — одним GROUP BY; посты с одинаковым
+    # числом обновляются одним UPDATE
+    by_count = defaultdict(list)
+    for row in queryset.order_by().values('post_id').annotate(count=Count('pk')):
+        by_count[row['count']].append(row['post_id'])
+    for count, post_ids in by_count.items():
+        Post.all_objects.filter(pk__in=post_ids).update(**{field: Greatest(F(field) - count, Value(0))})
+    return [post_id for post_ids in by_count.values() for post_id in post_ids]
+
+
+def _delete_with_counter(modeladmin, request, queryset, field):
+    with transaction.atomic():
+        post_ids = _decrement_counters(queryset, field)
+        deleted = delete_without_signals(queryset.model.objects.filter(pk__in=queryset.values('pk')))
+        for post_id in post_ids:
+            invalidate_post(post_id)
+    modeladmin.message_user(request, f'Удалено: {deleted}', messages.SUCCESS)
+
+
+class DeletedFilter(admin.SimpleListFilter):
+    title = 'удалён'
+    parameter_name = 'deleted'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Да'), ('no', 'Нет')]
+
+    def queryset(self, request, queryset):
+        # Удалённые ищутся по частичному индексу post_deleted_idx
+        if self.value() == 'yes':
+            return queryset.filter(deleted_at__isnull=False)
+        if self.value() == 'no':
+            return queryset.filter(deleted_at__isnull=True)
+        return queryset
+
+
+@admin.register(Post)
+class PostAdmin(LargeTableAdmin):
+    list_display = ['id', 'title', 'user', 'created_at', 'likes_count', 'comments_count', 'deleted_at']
+    list_select_related = ['user']
+    list_filter = [DeletedFilter, 'created_at']
+    raw_id_fields = ['user']
+    readonly_fields = ['likes_count', 'comments_count', 'deleted_at']
+    # Восстановления нет: очистка ставится в очередь сразу при удалении и могла
+    # уже удалить часть лайков и комментариев
+    actions = ['soft_delete']
+
+    def get_queryset(self, request):
+        # Модераторы видят и удалённые посты, пока их не очистил фон
+        return Post.all_objects.all()
+
+    def get_deleted_objects(self, objs, request):
+        # Страница подтверждения не перечисляет все лайки и комментарии поста
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        soft_delete_posts([obj.pk])
+
+    @admin.action(description='Удалить выбранные посты (лайки и комментарии — в фоне)')
+    def soft_delete(self, request, queryset):
+        marked = soft_delete_posts(queryset.values('pk'))
+        self.message_user(request, f'Удалено постов: {marked}', messages.SUCCESS)
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ['id', 'short_text', 'user', 'post', 'created_at']
+    list_select_related = ['user', 'post']
+    list_filter = ['update_at']
+    raw_id_fields = ['user', 'post']
+    actions = ['delete_comments']
+
+    @admin.display(description='Текст')
+    def short_text(self, obj):
+        return obj.text[:80]
+
+    @admin.action(description='Удалить выбранные комментарии')
+    def delete_comments(self, request, queryset):
+        _delete_with_counter(self, request, queryset, 'comments_count')
+
+
+@admin.register(Like)
+class LikeAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'post', 'created_at']
+    list_select_related = ['user', 'post']
+    list_filter = ['created_at']
+    raw_id_fields = ['user', 'post']
+    actions = ['delete_likes']
+
+    @admin.action(description='Удалить выбранные лайки')
+    def delete_likes(self, request, queryset):
+        _delete_with_counter(self, request, queryset, 'likes_count')
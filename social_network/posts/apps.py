@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
+
+    def ready(self):
+        # Подключаем обработчики сигналов: поисковый индекс, счётчик файлов, кеш ответов,
+        # метрики SQL, геометки, кеш токенов
+        from . import authentication, blobs, cache, geo, metrics, search  # noqa: F401
+        from .db_router import check_pin_cache
+        check_pin_cache()
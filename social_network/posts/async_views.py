@@ -0,0 +1,152 @@
+"""
+Асинхронные представления для чтения под ASGI.
+
+Обычные DRF-представления под ASGI выполняются в потоке через
+sync_to_async, а эти работают прямо в цикле событий на async ORM
+(aiterator, aget, aexists). Запросы страницы поста (сам пост, комментарии,
+лайк пользователя) выполняются одновременно, см. run_query. Формат ответов тот же, что у
+/api/posts/..., запись по-прежнему идёт через PostViewSet и соседей.
+
+GET /api/async/posts/
+GET /api/async/posts/{id}/
+GET /api/async/posts/{id}/comments/
+GET /api/async/posts/{id}/likes/
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from .authentication import cached_user, remember_user
+from .models import Comment, Like, Post
+from .pagination import CommentPagination, LikePagination, PostPagination
+from .serializers import CommentSerializer, LikeSerializer, PostSerializer
+from .views import comments_preview_queryset
+
+
+def json_response(data, status=200):
+    # Как JSONRenderer DRF: кириллица без \u-экранирования
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view):
+    """Обёртка: DRF-запрос для пагинации и сериализаторов, ошибки API в JSON."""
+    @require_safe
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except APIException as e:
+            return json_response({'detail': str(e.detail)}, status=e.status_code)
+        except Http404:
+            return json_response({'detail': 'Не найдено.'}, status=404)
+    return wrapper
+
+
+def run_query(func):
+    """
+    Выполняет синхронный запрос из корутины. При POSTS_ASYNC_PARALLEL_QUERIES
+    (по умолчанию) каждый запрос идёт в потоке пула со своим соединением, после
+    запроса соединение закрывается, если истёк CONN_MAX_AGE. Иначе — как async
+    ORM, по очереди в общем потоке запроса.
+    """
+    if not settings.POSTS_ASYNC_PARALLEL_QUERIES:
+        return sync_to_async(func)()
+
+    def run():
+        try:
+            return func()
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def comments_preview(post_ids):
+    # Превью комментариев для всех постов страницы одним запросом, как в PostViewSet
+    preview = {post_id: [] for post_id in post_ids}
+    queryset = comments_preview_queryset().filter(post_id__in=post_ids).order_by('post_id', 'created_at', 'id')
+    async for comment in queryset.aiterator():
+        preview[comment.post_id].append(comment)
+    return preview
+
+
+async def authenticated_user(request):
+    # TokenAuthentication без sync-адаптера; с неверным токеном — как аноним
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    # Общий кеш Django синхронный, здесь только LRU процесса (posts/authentication.py)
+    user = cached_user(header[1], shared=False)
+    if user is not None:
+        return user
+    try:
+        token = await Token.objects.select_related('user').aget(key=header[1])
+    except Token.DoesNotExist:
+        return None
+    if not token.user.is_active:
+        return None
+    remember_user(header[1], token.user, shared=False)
+    return token.user
+
+
+@api_view
+async def post_list(request):
+    paginator = PostPagination()
+    posts = await paginator.apaginate_queryset(Post.objects.all(), request)
+    preview = await comments_preview([post.pk for post in posts])
+    for post in posts:
+        post.preview_comments = preview[post.pk]
+    data = PostSerializer(posts, many=True, context={'request': request}).data
+    return json_response(paginator.get_paginated_data(data))
+
+
+@api_view
+async def post_detail(request, post_id):
+    def load_post():
+        return Post.objects.filter(pk=post_id).first()
+
+    def load_comments():
+        return list(Comment.objects.filter(post_id=post_id).order_by('created_at', 'id'))
+
+    async def load_liked():
+        user = await authenticated_user(request)
+        if user is None:
+            return False
+        return await run_query(lambda: Like.objects.filter(post_id=post_id, user=user).exists())
+
+    post, comments, liked = await asyncio.gather(run_query(load_post), run_query(load_comments), load_liked())
+    if post is None:
+        raise Http404
+    post.preview_comments = []
+    data = PostSerializer(post, context={'request': request}).data
+    data['comments'] = CommentSerializer(comments, many=True, context={'request': request}).data
+    data['liked'] = liked
+    return json_response(data)
+
+
+@api_view
+async def comment_list(request, post_id):
+    if not await Post.objects.filter(pk=post_id).aexists():
+        raise Http404
+    paginator = CommentPagination()
+    comments = await paginator.apaginate_queryset(Comment.objects.filter(post_id=post_id), request)
+    data = CommentSerializer(comments, many=True, context={'request': request}).data
+    return json_response(paginator.get_paginated_data(data))
+
+
+@api_view
+async def like_list(request, post_id):
+    if not await Post.objects.filter(pk=post_id).aexists():
+        raise Http404
+    paginator = LikePagination()
+    likes = await paginator.apaginate_queryset(
+        Like.objects.filter(post_id=post_id).select_related('user', 'post'), request
+    )
+    data = LikeSerializer(likes, many=True, context={'request': request}).data
+    return json_response(paginator.get_paginated_data(data))
@@ -0,0 +1,129 @@
+"""
+TokenAuthentication с кешем токен -> пользователь.
+
+Стандартный класс DRF на каждый запрос делает JOIN Token + User. Здесь
+пользователь берётся из LRU в памяти процесса (POSTS_AUTH_CACHE_SIZE
+записей, не дольше POSTS_AUTH_CACHE_TTL секунд), а при заданном
+POSTS_AUTH_CACHE_ALIAS — ещё и из общего кеша Django, и только при
+промахе из БД.
+
+Удаление или перевыпуск токена и изменение пользователя (в том числе
+деактивация) сбрасывают записи сигналами. В других процессах локальная
+копия живёт не дольше TTL; изменения через QuerySet.update() сигналов не
+вызывают и тоже видны через TTL.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+_entries = OrderedDict()  # ключ токена -> (истекает, пользователь)
+_lock = threading.Lock()
+
+
+def _shared_cache():
+    alias = settings.POSTS_AUTH_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    # Сам токен в ключах общего кеша не храним
+    return 'posts:auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def cached_user(key, shared=True):
+    """Пользователь по ключу токена или None; shared=False — только локальный LRU."""
+    if not settings.POSTS_AUTH_CACHE_TTL:
+        return None
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _entries.move_to_end(key)
+                # Копия: представления могут менять атрибуты request.user
+                return copy.copy(entry[1])
+            del _entries[key]
+
+    cache = _shared_cache() if shared else None
+    user = cache.get(_shared_key(key)) if cache is not None else None
+    if user is None:
+        return None
+    _remember_local(key, user)
+    return copy.copy(user)
+
+
+def remember_user(key, user, shared=True):
+    if not settings.POSTS_AUTH_CACHE_TTL:
+        return
+    _remember_local(key, copy.copy(user))
+    cache = _shared_cache() if shared else None
+    if cache is not None:
+        cache.set(_shared_key(key), user, settings.POSTS_AUTH_CACHE_TTL)
+
+
+def _remember_local(key, user):
+    with _lock:
+        _entries[key] = (time.monotonic() + settings.POSTS_AUTH_CACHE_TTL, user)
+        _entries.move_to_end(key)
+        while len(_entries) > settings.POSTS_AUTH_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+
+def forget_tokens(keys):
+    keys = list(keys)
+
+    def forget():
+        with _lock:
+            for key in keys:
+                _entries.pop(key, None)
+        cache = _shared_cache()
+        if cache is not None:
+            cache.delete_many([_shared_key(key) for key in keys])
+
+    forget()
+    # И после коммита: параллельный запрос мог успеть закешировать старое состояние
+    transaction.on_commit(forget)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Вход обновляет только last_login — это на аутентификацию не влияет
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    forget_tokens(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Замена TokenAuthentication: тот же заголовок "Authorization: Token <ключ>"."""
+
+    def authenticate_credentials(self, key):
+        user = cached_user(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            remember_user(key, user)
+            return user, token
+        # request.auth — несохранённый экземпляр с тем же ключом, без запроса к БД
+        return user, self.get_model()(key=key, user=user)
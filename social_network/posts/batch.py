@@ -0,0 +1,182 @@
+"""
+Пакетное создание комментариев и постов (импорт, инструменты модерации).
+
+Элементы проверяются по отдельности, существование постов и файлов
+изображений — одним запросом на пакет. Корректные элементы вставляются
+bulk_create частями по POSTS_BATCH_CHUNK_SIZE в одной транзакции. bulk_create
+не вызывает сигналы, поэтому счётчики, ссылки на файлы, поисковый индекс,
+геометки и кеш обновляются здесь же, пачками. Для каждого элемента возвращается
+результат: {"status": 201, "id": ...} или {"status": 400, "errors": ...}.
+
+Изображение поста — уже загруженный файл (имя в хранилище или URL) или новый
+файл: в multipart-запросе элементы передаются JSON-строкой в поле items, а
+image элемента называет часть запроса с файлом. Новые файлы проверяются как
+при создании одного поста и сохраняются в хранилище по содержимому; записи
+ImageBlob для них создаются одним INSERT. Если транзакция пакета не удалась,
+новые файлы без записей ImageBlob удаляются из хранилища.
+"""
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from rest_framework import serializers
+
+from . import feed
+from .blobs import delete_unreferenced_file
+from .cache import invalidate_post, invalidate_post_lists
+from .geo import fill_location
+from .models import Comment, ImageBlob, Post
+from .storage import image_storage
+from .renditions import schedule_renditions
+from .search import index_posts
+from .trending import record_activities
+
+
+class BatchCommentSerializer(serializers.Serializer):
+    post = serializers.IntegerField(min_value=1)
+    text = serializers.CharField()
+
+
+class BatchPostSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    # Уже загруженный файл (имя в хранилище или его URL) или имя части multipart-запроса с новым файлом;
+    # длина имени в хранилище проверяется в validate_image
+    image = serializers.CharField(max_length=255)
+    latitude = serializers.FloatField(required=False, allow_null=True, min_value=-90, max_value=90)
+    longitude = serializers.FloatField(required=False, allow_null=True, min_value=-180, max_value=180)
+
+    def validate(self, attrs):
+        if (attrs.get('latitude') is None) != (attrs.get('longitude') is None):
+            raise serializers.ValidationError('Широта и долгота указываются вместе')
+        return attrs
+
+    def validate_image(self, value):
+        path = urlparse(value).path
+        if path.startswith(settings.MEDIA_URL):
+            path = path[len(settings.MEDIA_URL):]
+        path = path.lstrip('/')
+        max_length = Post._meta.get_field('image').max_length
+        if len(path) > max_length:
+            raise serializers.ValidationError(f'Имя файла длиннее {max_length} символов')
+        return path
+
+
+class BatchImageSerializer(serializers.Serializer):
+    # Новый файл элемента: та же проверка, что у PostSerializer
+    image = serializers.ImageField()
+
+
+def _validate(serializer_class, items, limit):
+    """Результаты с ошибками проверки и список (индекс, данные) корректных элементов."""
+    if not isinstance(items, list):
+        raise serializers.ValidationError('Ожидается список')
+    if not 0 < len(items) <= limit:
+        raise serializers.ValidationError(f'Ожидается от 1 до {limit} элементов')
+
+    results, valid = [None] * len(items), []
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = _error(serializer.errors)
+    return results, valid
+
+
+def _error(errors):
+    return {'status': 400, 'errors': errors}
+
+
+def _increment(queryset, key, field, counts):
+    # Ключи с одинаковым приращением обновляются одним UPDATE
+    by_delta = defaultdict(list)
+    for value, delta in counts.items():
+        by_delta[delta].append(value)
+    for delta, values in by_delta.items():
+        queryset.filter(**{f'{key}__in': values}).update(**{field: F(field) + delta})
+
+
+def create_comments(user, items):
+    results, valid = _validate(BatchCommentSerializer, items, settings.POSTS_BATCH_MAX_COMMENTS)
+    existing = set(
+        Post.objects.filter(pk__in={data['post'] for _, data in valid}).values_list('pk', flat=True)
+    )
+
+    created = []
+    for index, data in valid:
+        if data['post'] in existing:
+            created.append((index, Comment(post_id=data['post'], user=user, text=data['text'])))
+        else:
+            results[index] = _error({'post': ['Пост не найден']})
+
+    comments = [comment for _, comment in created]
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments, batch_size=settings.POSTS_BATCH_CHUNK_SIZE)
+        counts = Counter(comment.post_id for comment in comments)
+        _increment(Post.objects, 'pk', 'comments_count', counts)
+        record_activities([(post_id, 0, count) for post_id, count in counts.items()])
+        for post_id in counts:
+            invalidate_post(post_id)
+
+    for index, comment in created:
+        results[index] = {'status': 201, 'id': comment.pk}
+    return results
+
+
+def create_posts(user, items, files=None):
+    """files — новые файлы multipart-запроса; image элемента может ссылаться на них по имени части."""
+    files = files or {}
+    results, valid = _validate(BatchPostSerializer, items, settings.POSTS_BATCH_MAX_POSTS)
+    existing = set(
+        ImageBlob.objects.filter(name__in={data['image'] for _, data in valid}).values_list('name', flat=True)
+    )
+
+    created, uploaded = [], {}
+    for index, data in valid:
+        upload = files.get(data['image'])
+        if upload is not None:
+            serializer = BatchImageSerializer(data={'image': upload})
+            if not serializer.is_valid():
+                results[index] = _error(serializer.errors)
+                continue
+            upload = serializer.validated_data['image']
+            post = Post(user=user, **dict(data, image=None))
+            # Как при создании одного поста: upload_to и хранилище по содержимому
+            post.image.save(upload.name, upload, save=False)
+            uploaded[post.image.name] = upload.size
+        elif data['image'] in existing:
+            post = Post(user=user, **data)
+        else:
+            results[index] = _error({'image': ['Файл не найден, сначала загрузите изображение']})
+            continue
+        fill_location(post)
+        created.append((index, post))
+
+    posts = [post for _, post in created]
+    try:
+        with transaction.atomic():
+            Post.objects.bulk_create(posts, batch_size=settings.POSTS_BATCH_CHUNK_SIZE)
+            index_posts(posts)
+            # Новые файлы (одинаковые по содержимому — одна запись); счётчик ссылок ниже
+            ImageBlob.objects.bulk_create(
+                [ImageBlob(name=name, size=size, ref_count=0) for name, size in uploaded.items()],
+                ignore_conflicts=True,
+            )
+            _increment(ImageBlob.objects, 'name', 'ref_count', Counter(post.image.name for post in posts))
+            if posts:
+                invalidate_post_lists()
+            for post in posts:
+                schedule_renditions(post.pk)
+                feed.schedule_fanout(post.pk)
+    except Exception:
+        # Файл с тем же содержимым мог уже принадлежать другим постам — такие остаются
+        for name in uploaded:
+            delete_unreferenced_file(name)
+        raise
+
+    for index, post in created:
+        results[index] = {'status': 201, 'id': post.pk}
+    return results
@@ -0,0 +1,80 @@
+"""
+Счётчик ссылок на файлы изображений в ContentAddressedStorage.
+
+Один файл может принадлежать нескольким постам, поэтому он удаляется
+с диска только когда на него не осталось ни одной ссылки.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import ImageBlob, Post
+from .storage import image_storage
+
+
+def acquire_blob(name):
+    with transaction.atomic():
+        blob, created = ImageBlob.objects.select_for_update().get_or_create(
+            name=name,
+            defaults={'ref_count': 1, 'size': _file_size(name)},
+        )
+        if not created:
+            ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(name):
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            # Файл загружен до перехода на хранилище по содержимому — не трогаем
+            return
+        if blob.ref_count > 1:
+            ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+        transaction.on_commit(lambda: delete_unreferenced_file(name))
+
+
+def delete_unreferenced_file(name):
+    # Файл мог снова понадобиться, пока транзакция удаления завершалась
+    if not ImageBlob.objects.filter(name=name).exists():
+        image_storage.delete(name)
+
+
+def _file_size(name):
+    try:
+        return image_storage.size(name)
+    except OSError:
+        return 0
+
+
+def _image_name(instance):
+    # Читаем значение напрямую, чтобы не загружать отложенное поле
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Post)
+def remember_image(sender, instance, **kwargs):
+    instance._saved_image_name = _image_name(instance)
+
+
+@receiver(post_save, sender=Post)
+def track_image(sender, instance, created, **kwargs):
+    new_name = _image_name(instance)
+    old_name = '' if created else getattr(instance, '_saved_image_name', '')
+    if new_name == old_name or 'image' not in instance.__dict__:
+        return
+    if new_name:
+        acquire_blob(new_name)
+    if old_name:
+        release_blob(old_name)
+    instance._saved_image_name = new_name
+
+
+@receiver(post_delete, sender=Post)
+def untrack_image(sender, instance, **kwargs):
+    name = getattr(instance, '_saved_image_name', '') or _image_name(instance)
+    if name:
+        release_blob(name)
@@ -0,0 +1,179 @@
+"""
+Кеш ответов списка и деталей постов для анонимных запросов.
+
+Ключи кеша содержат номер версии: глобальной для списка и отдельной для
+каждого поста. Сигналы post_save/post_delete у Post, Like и Comment
+увеличивают версии, и старые записи просто перестают читаться, а затем
+вытесняются по таймауту. Работает с любым бэкендом Django (locmem, файловый).
+
+Первые POSTS_REPLICA_PIN_SECONDS секунд после увеличения версии промахи
+читают основную БД, а не реплику: иначе отстающая реплика закешировала бы
+старые данные под новой версией до конца таймаута.
+
+Last-Modified — не раньше последнего увеличения версии: счётчики лайков и
+комментариев меняются UPDATE без updated_at, и по одному updated_at клиент
+получил бы 304 после лайка.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .db_router import read_from_primary
+from .models import Comment, Like, Post
+
+GLOBAL_VERSION_KEY = 'posts:version:global'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.POSTS_CACHE_ALIAS]
+
+
+def _post_version_key(post_id):
+    return f'posts:version:{post_id}'
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Начальное значение от времени: если ключ версии вытеснен, старые
+        # записи не «оживут» с тем же номером
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bumped_at_key(key):
+    return f'{key}:at'
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    cache.set(_bumped_at_key(key), time.time(), timeout=None)
+
+
+def _bumped_at(key):
+    # Отметка вытеснена — берём текущее время: лишний 200 лучше ложного 304
+    return get_cache().get(_bumped_at_key(key)) or time.time()
+
+
+def invalidate_post(post_id):
+    """Сбрасывает кеш поста и всех списков (после коммита транзакции)."""
+    def bump():
+        _bump(_post_version_key(post_id))
+        _bump(GLOBAL_VERSION_KEY)
+
+    transaction.on_commit(bump)
+
+
+def invalidate_post_lists():
+    """Сбрасывает кеш списков, например после массовой вставки без сигналов."""
+    transaction.on_commit(lambda: _bump(GLOBAL_VERSION_KEY))
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _last_modified(items, bumped_at):
+    timestamps = [parse_datetime(item['updated_at']).timestamp() for item in items if item.get('updated_at')]
+    return int(max(timestamps + [bumped_at]))
+
+
+class CachedPostReadMixin:
+    """
+    Кеширует list/retrieve для анонимных пользователей и отвечает 304
+    на If-None-Match/If-Modified-Since.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        version = _get_version(GLOBAL_VERSION_KEY)
+        return self._cached_response(
+            request, f'posts:list:{version}', GLOBAL_VERSION_KEY, super().list, args, kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        version_key = _post_version_key(pk)
+        version = _get_version(version_key)
+        return self._cached_response(
+            request, f'posts:detail:{pk}:{version}', version_key, super().retrieve, args, kwargs
+        )
+
+    def _cached_response(self, request, prefix, version_key, handler, args, kwargs):
+        url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f'{prefix}:{url_hash}'
+        cache = get_cache()
+
+        entry = cache.get(key)
+        if entry is None:
+            _count('misses')
+            bumped_at = _bumped_at(version_key)
+            if time.time() - bumped_at < settings.POSTS_REPLICA_PIN_SECONDS:
+                # Реплика могла ещё не получить изменение, из-за которого сменилась версия
+                with read_from_primary():
+                    response = handler(request, *args, **kwargs)
+            else:
+                response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            items = data['results'] if 'results' in data else [data]
+            entry = {
+                'data': data,
+                'etag': quote_etag(hashlib.md5(key.encode()).hexdigest()),
+                'last_modified': _last_modified(items, bumped_at),
+            }
+            cache.set(key, entry, settings.POSTS_CACHE_TIMEOUT)
+            cache_status = 'MISS'
+        else:
+            _count('hits')
+            cache_status = 'HIT'
+
+        not_modified = get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified']
+        )
+        response = not_modified or Response(entry['data'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        response['X-Cache'] = cache_status
+        return response
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate_post(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Comment)
+def post_related_changed(sender, instance, **kwargs):
+    invalidate_post(instance.post_id)
@@ -0,0 +1,116 @@
+"""
+Чтение с реплик БД.
+
+GET-запросы к представлениям с ReplicaReadMixin читают со случайной
+реплики из POSTS_DB_REPLICAS, всё остальное (запись, служебные запросы,
+фоновые задачи) идёт в основную БД. После успешной записи пользователь
+на POSTS_REPLICA_PIN_SECONDS секунд закрепляется за основной БД, чтобы
+видеть свои изменения, пока реплика догоняет.
+
+Закрепление хранится в кеше POSTS_REPLICA_PIN_CACHE_ALIAS и должно быть
+видно всем процессам: с репликами и локальным для процесса кешем
+(LocMemCache, DummyCache) приложение не запускается.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# contextvars, а не threading.local: работает и в async-представлениях
+_read_from_replica = contextvars.ContextVar('read_from_replica', default=False)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and settings.POSTS_DB_REPLICAS:
+            return random.choice(settings.POSTS_DB_REPLICAS)
+        # Явно: иначе Django взял бы БД экземпляра из подсказки, а он мог быть прочитан с реплики
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Во всех БД одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.POSTS_DB_REPLICAS
+
+
+@contextlib.contextmanager
+def read_from_primary():
+    """Чтение внутри блока идёт в основную БД, даже в запросе с ReplicaReadMixin."""
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+# Кеши, которые другие процессы не видят
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_pin_cache():
+    """Вызывается при запуске (PostsConfig.ready)."""
+    if not settings.POSTS_DB_REPLICAS:
+        return
+    backend = settings.CACHES[settings.POSTS_REPLICA_PIN_CACHE_ALIAS]['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f'POSTS_REPLICA_PIN_CACHE_ALIAS: кеш {backend} виден одному процессу, '
+            f'при репликах нужен общий кеш'
+        )
+
+
+def pin_cache():
+    return caches[settings.POSTS_REPLICA_PIN_CACHE_ALIAS]
+
+
+def _pin_key(user_id):
+    return f'posts:db-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    pin_cache().set(_pin_key(user.pk), True, settings.POSTS_REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and pin_cache().get(_pin_key(user.pk), False)
+
+
+class PinOnWriteMixin:
+    """Успешный изменяющий запрос закрепляет пользователя за основной БД."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and request.user.is_authenticated):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaReadMixin(PinOnWriteMixin):
+    """Безопасные запросы viewset'а читают с реплики, запись закрепляет пользователя за основной БД."""
+
+    def initial(self, request, *args, **kwargs):
+        # Аутентификация (запрос токена) остаётся в основной БД
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and settings.POSTS_DB_REPLICAS and not is_pinned_to_primary(request.user):
+            self._replica_token = _read_from_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_from_replica.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
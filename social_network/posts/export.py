@@ -0,0 +1,149 @@
+"""
+Выгрузка постов, комментариев и лайков в NDJSON для аналитики.
+
+Каждый раздел (posts, comments, likes) читается по ключу (время изменения,
+id) по возрастанию: окнами по POSTS_EXPORT_BATCH_SIZE строк, каждое окно —
+через .iterator(chunk_size=POSTS_EXPORT_CHUNK_SIZE), так что память не
+зависит от размера таблиц и нет OFFSET. После каждого окна в поток пишется
+строка {"type": "checkpoint", "cursor": ...}, в конце — {"type": "end", ...}.
+
+Курсор хранит позицию в каждом разделе. С ним можно продолжить прерванную
+выгрузку, а курсор из строки end — начало следующей инкрементальной
+выгрузки. Время изменения ставится до коммита, поэтому строка долгой
+транзакции (или ещё не дошедшая до реплики) может появиться уже позади
+курсора. Каждая выгрузка с курсором начинается на POSTS_EXPORT_LAG секунд
+раньше него: доставка «хотя бы раз», записи последних POSTS_EXPORT_LAG
+секунд повторяются, и получатель должен схлопывать их по id (побеждает
+последняя). Транзакции дольше этого запаса могут быть пропущены. Удаления
+в выгрузку не попадают.
+
+Счётчиков likes_count и comments_count в разделе posts нет: они меняются
+без updated_at, и инкрементальная выгрузка отдавала бы устаревшие
+значения. Их считают по разделам likes и comments.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Like, Post
+from .pagination import dump_cursor, load_cursor
+
+# Раздел -> (модель, поле времени изменения, выгружаемые поля, фильтр)
+SECTIONS = {
+    'posts': (Post, 'updated_at', (
+        'id', 'user_id', 'title', 'description', 'image', 'image_width', 'image_height',
+        'latitude', 'longitude', 'place', 'created_at', 'updated_at',
+    ), {}),
+    # Комментарии и лайки удалённых постов живут до фоновой очистки — их не выгружаем
+    'comments': (Comment, 'update_at', ('id', 'post_id', 'user_id', 'text', 'created_at', 'update_at'),
+                 {'post__deleted_at__isnull': True}),
+    'likes': (Like, 'created_at', ('id', 'post_id', 'user_id', 'created_at'), {'post__deleted_at__isnull': True}),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(positions):
+    return dump_cursor([positions.get(section) for section in SECTIONS])
+
+
+def decode_cursor(encoded):
+    """Позиции разделов {раздел: [время, id]}; InvalidCursor, если курсор повреждён."""
+    try:
+        values = load_cursor(encoded)
+        if len(values) != len(SECTIONS):
+            raise ValueError
+        positions = {}
+        for section, position in zip(SECTIONS, values):
+            if position is not None:
+                changed_at, pk = position
+                if parse_datetime(changed_at) is None:
+                    raise ValueError
+                positions[section] = [changed_at, int(pk)]
+        return positions
+    except (TypeError, ValueError):
+        raise InvalidCursor('Неверный курсор')
+
+
+def export_using():
+    # Выгрузка терпит отставание реплики, а основную БД лучше не нагружать
+    if settings.POSTS_DB_REPLICAS:
+        return random.choice(settings.POSTS_DB_REPLICAS)
+    return DEFAULT_DB_ALIAS
+
+
+def section_rows(section, position, since, using):
+    """Строки раздела после position - POSTS_EXPORT_LAG, окнами; после окна — (None, новая позиция)."""
+    model, changed_field, fields, filters = SECTIONS[section]
+    queryset = model.objects.using(using).filter(**filters).order_by(changed_field, 'id').values(*fields)
+    batch_size = settings.POSTS_EXPORT_BATCH_SIZE
+    # Позиция в курсоре не отступает назад, даже пока повторяются строки запаса
+    floor = position
+    if position is not None and settings.POSTS_EXPORT_LAG:
+        changed_at = parse_datetime(position[0]) - timedelta(seconds=settings.POSTS_EXPORT_LAG)
+        position = [changed_at.isoformat(), 0]
+    while True:
+        if position is not None:
+            changed_at, last_id = parse_datetime(position[0]), position[1]
+            window = queryset.filter(
+                Q(**{f'{changed_field}__gt': changed_at}) | Q(**{changed_field: changed_at, 'id__gt': last_id})
+            )
+        elif since is not None:
+            window = queryset.filter(**{f'{changed_field}__gte': since})
+        else:
+            window = queryset
+
+        # Каждое окно — отдельный короткий запрос: серверный курсор на всю
+        # таблицу PostgreSQL в autocommit материализовал бы целиком (WITH HOLD)
+        count = 0
+        for row in window[:batch_size].iterator(chunk_size=settings.POSTS_EXPORT_CHUNK_SIZE):
+            count += 1
+            position = [row[changed_field].isoformat(), row['id']]
+            yield row, None
+        if count:
+            yield None, _later(position, floor)
+        if count < batch_size:
+            return
+
+
+def _later(position, other):
+    if other is None or (parse_datetime(position[0]), position[1]) >= (parse_datetime(other[0]), other[1]):
+        return position
+    return other
+
+
+def export_records(sections=('posts',), positions=None, since=None, using=None):
+    """Записи выбранных разделов, строки checkpoint и end — словарями."""
+    positions = dict(positions or {})
+    using = using or export_using()
+    for section in SECTIONS:
+        if section not in sections:
+            continue
+        record_type = section[:-1]
+        for row, position in section_rows(section, positions.get(section), since, using):
+            if row is None:
+                positions[section] = position
+                yield {'type': 'checkpoint', 'cursor': encode_cursor(positions)}
+            else:
+                yield {'type': record_type, **row}
+    yield {'type': 'end', 'cursor': encode_cursor(positions)}
+
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def encode_line(record):
+    return (_encoder.encode(record) + '\n').encode()
+
+
+def export_lines(*args, **kwargs):
+    """Генератор строк NDJSON (bytes) для StreamingHttpResponse."""
+    for record in export_records(*args, **kwargs):
+        yield encode_line(record)
@@ -0,0 +1,131 @@
+"""
+Быстрый путь сериализации списков только для чтения.
+
+CompiledSerializer один раз разбирает поля сериализатора DRF и превращает
+их в проекцию .values() и список готовых функций «строка -> значение»:
+вместо экземпляров моделей и обхода полей DRF на каждый объект — словарь из
+БД и несколько вызовов на поле. Результат совпадает с serializer.data:
+те же ключи в том же порядке, даты и URL изображений форматируются теми же
+полями DRF.
+
+Поля, которые нельзя вывести из колонок (SerializerMethodField,
+StringRelatedField и т. п.), сериализатор описывает методом
+fast_<поле>(), возвращающим (колонка, функция). Колонка None означает, что
+значение под ключом поля подставляет вызывающий код (например, превью
+комментариев).
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .metrics import timed
+
+# Поля, у которых значение из .values() уже готово для JSON
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.FloatField,
+    serializers.BooleanField, serializers.JSONField, serializers.ReadOnlyField,
+)
+
+
+def fast_serialization_enabled():
+    return settings.POSTS_FAST_SERIALIZATION
+
+
+class CompiledSerializer:
+
+    def __init__(self, serializer_class, context=None, prefix=''):
+        serializer = serializer_class(context=context or {})
+        self.prefix = prefix
+        self.columns = []
+        self.getters = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.getters.append((name, self.compile_field(serializer, name, field)))
+
+    def column(self, name):
+        column = self.prefix + name
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def compile_field(self, serializer, name, field):
+        hook = getattr(serializer, f'fast_{name}', None)
+        if hook is not None:
+            column, convert = hook()
+            if column is None:
+                return itemgetter(name)
+            column = self.column(column)
+            if convert is None:
+                return itemgetter(column)
+            return lambda row: convert(row[column])
+
+        source = field.source
+        if isinstance(field, serializers.BaseSerializer) and not isinstance(field, serializers.ListSerializer):
+            # Вложенный сериализатор по внешнему ключу: колонки через JOIN (user__username)
+            nested = CompiledSerializer(type(field), serializer.context, prefix=f'{self.prefix}{source}__')
+            self.columns += [column for column in nested.columns if column not in self.columns]
+            pk_column = self.column(f'{source}__pk')
+            return lambda row: None if row[pk_column] is None else nested.to_representation(row)
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            return itemgetter(self.column(source))
+        if isinstance(field, serializers.FileField):
+            return self.compile_file_field(serializer, field, self.column(source))
+        if isinstance(field, (serializers.RelatedField, serializers.BaseSerializer,
+                              serializers.SerializerMethodField)):
+            raise ImproperlyConfigured(
+                f'{type(serializer).__name__}.{name}: для быстрого пути нужен метод fast_{name}()'
+            )
+
+        column = self.column(source)
+        if isinstance(field, serializers.DateTimeField):
+            return self.compile_datetime_field(field, column)
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return itemgetter(column)
+        # Даты и прочее — тем же полем DRF (часовой пояс, формат)
+        convert = field.to_representation
+        return lambda row: None if row[column] is None else convert(row[column])
+
+    def compile_file_field(self, serializer, field, column):
+        # Как FileField.to_representation: абсолютный URL файла или None
+        storage = serializer.Meta.model._meta.get_field(field.source).storage
+        request = serializer.context.get('request')
+
+        def to_url(row):
+            name = row[column]
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return to_url
+
+    def compile_datetime_field(self, field, column):
+        # Как DateTimeField.to_representation, но часовой пояс определяется один раз,
+        # а не на каждое значение
+        convert = field.to_representation
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return lambda row: None if row[column] is None else convert(row[column])
+
+        def to_iso(row):
+            value = row[column]
+            if value is None:
+                return None
+            if value.tzinfo is None:
+                return convert(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+        return to_iso
+
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+
+    def many(self, rows):
+        with timed('serialize'):
+            return [self.to_representation(row) for row in rows]
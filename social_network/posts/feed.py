@@ -0,0 +1,164 @@
+"""
+Подписки и домашняя лента с раздачей постов при записи (fan-out on write).
+
+Новый пост в фоне раскладывается пачками по лентам подписчиков
+(TimelineEntry), поэтому чтение ленты — один диапазонный проход по индексу
+(user, created_at, post). Посты авторов, у которых больше
+POSTS_FANOUT_FOLLOWER_LIMIT подписчиков, не раздаются, а подмешиваются
+при чтении (fan-out on read) — по одному индексному запросу на всех таких
+авторов сразу.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.POSTS_FANOUT_WORKERS, thread_name_prefix='fanout')
+    return _executor
+
+
+# --- подписки ---
+
+def follow(follower_id, followee_id):
+    """Подписывает; возвращает False, если подписка уже была."""
+    try:
+        with transaction.atomic():
+            Follow.objects.create(follower_id=follower_id, followee_id=followee_id)
+            UserStats.objects.get_or_create(user_id=followee_id)
+            UserStats.objects.filter(pk=followee_id).update(followers_count=F('followers_count') + 1)
+    except IntegrityError:
+        return False
+
+    if not is_popular(followee_id):
+        # Последние посты автора сразу появляются в ленте
+        recent = (
+            Post.objects.filter(user_id=followee_id).order_by('-created_at', '-id')
+            .values_list('id', 'created_at')[:settings.POSTS_FOLLOW_BACKFILL]
+        )
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=follower_id, post_id=post_id, author_id=followee_id, created_at=created_at)
+             for post_id, created_at in recent],
+            ignore_conflicts=True,
+        )
+    return True
+
+
+def unfollow(follower_id, followee_id):
+    """Отписывает; возвращает False, если подписки не было."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower_id=follower_id, followee_id=followee_id).delete()
+        if not deleted:
+            return False
+        UserStats.objects.filter(pk=followee_id).update(
+            followers_count=Greatest(F('followers_count') - 1, Value(0))
+        )
+        TimelineEntry.objects.filter(user_id=follower_id, author_id=followee_id).delete()
+    return True
+
+
+def is_popular(user_id):
+    return UserStats.objects.filter(
+        pk=user_id, followers_count__gt=settings.POSTS_FANOUT_FOLLOWER_LIMIT
+    ).exists()
+
+
+# --- раздача поста ---
+
+def schedule_fanout(post_id):
+    def submit():
+        if settings.POSTS_FANOUT_WORKERS:
+            _get_executor().submit(_run_fanout_job, post_id)
+        else:
+            fan_out(post_id)
+
+    transaction.on_commit(submit)
+
+
+def _run_fanout_job(post_id):
+    close_old_connections()
+    try:
+        fan_out(post_id)
+    except Exception:
+        logger.exception('Не удалось разослать пост %s по лентам', post_id)
+    finally:
+        close_old_connections()
+
+
+def fan_out(post_id):
+    post = Post.objects.filter(pk=post_id).values('id', 'user_id', 'created_at').first()
+    if post is None:
+        return 0
+
+    def entries(user_ids):
+        return [
+            TimelineEntry(user_id=user_id, post_id=post['id'], author_id=post['user_id'],
+                          created_at=post['created_at'])
+            for user_id in user_ids
+        ]
+
+    # Свой пост автор видит в своей ленте всегда
+    TimelineEntry.objects.bulk_create(entries([post['user_id']]), ignore_conflicts=True)
+    if is_popular(post['user_id']):
+        return 0
+
+    delivered = 0
+    last_id = 0
+    while True:
+        follower_ids = list(
+            Follow.objects.filter(followee_id=post['user_id'], follower_id__gt=last_id)
+            .order_by('follower_id').values_list('follower_id', flat=True)[:settings.POSTS_FANOUT_BATCH_SIZE]
+        )
+        if not follower_ids:
+            break
+        TimelineEntry.objects.bulk_create(entries(follower_ids), ignore_conflicts=True)
+        delivered += len(follower_ids)
+        last_id = follower_ids[-1]
+    return delivered
+
+
+# --- чтение ленты ---
+
+def feed_keys(user, page_size, position=None):
+    """
+    Ключи (created_at, post_id) страницы ленты по убыванию; position —
+    ключ последнего поста предыдущей страницы. Возвращает page_size + 1
+    ключей, чтобы было видно, есть ли следующая страница.
+    """
+    limit = page_size + 1
+
+    def after(field_date, field_id):
+        if position is None:
+            return Q()
+        created_at, post_id = position
+        return Q(**{f'{field_date}__lt': created_at}) | Q(**{field_date: created_at, f'{field_id}__lt': post_id})
+
+    keys = list(
+        TimelineEntry.objects.filter(Q(user=user) & after('created_at', 'post_id'))
+        .order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit]
+    )
+
+    popular = list(
+        UserStats.objects.filter(
+            followers_count__gt=settings.POSTS_FANOUT_FOLLOWER_LIMIT, user__followers__follower=user
+        ).values_list('user_id', flat=True)
+    )
+    if popular:
+        keys += list(
+            Post.objects.filter(Q(user_id__in=popular) & after('created_at', 'id'))
+            .order_by('-created_at', '-id').values_list('created_at', 'id')[:limit]
+        )
+        keys = sorted(set(keys), reverse=True)
+    return keys[:limit]
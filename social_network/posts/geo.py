@@ -0,0 +1,319 @@
+"""
+Геометки постов и поиск «рядом».
+
+У поста с координатами хранится geohash (GEOHASH_PRECISION символов,
+клетка около 5 м) с индексом. Запрос /api/posts/nearby/ покрывает круг
+самыми мелкими клетками, каких нужно не больше MAX_COVER_CELLS (клетки,
+не задевающие круг, отбрасываются): каждая клетка — диапазон по индексу
+geohash, полного просмотра нет. Поверх диапазонов в SQL — рамка круга по
+широте и долготе и сортировка по приближённому расстоянию; кандидаты
+читаются окнами и только до тех пор, пока могут попасть в ответ. Их
+порядок уточняет точное геодезическое расстояние (WGS84, geographiclib),
+перед которым они отсеиваются по быстрой формуле для сферы.
+
+Круг, заходящий за MAX_SEARCH_LATITUDE, не ищется (ValueError): у полюса
+клетки geohash вырождаются, и покрытие стало бы почти полным просмотром.
+
+Название места получаем обратным геокодированием (POSTS_GEOCODER, по
+умолчанию офлайн LocalGeocoder) с кешем по клетке около 1 км.
+"""
+import heapq
+import logging
+from functools import lru_cache, reduce
+from math import asin, cos, floor, radians, sin, sqrt
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.functions import Abs, Least
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from geographiclib.geodesic import Geodesic
+from geopy.exc import GeopyError
+from geopy.geocoders.base import Geocoder
+from geopy.location import Location
+from geopy.point import Point
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+GEOCODE_CACHE_PRECISION = 6
+METERS_PER_DEGREE = 111320
+EARTH_RADIUS = 6371008.8
+# Расстояние на сфере отличается от расстояния на эллипсоиде меньше чем на 1 %
+SPHERE_ERROR = 0.01
+# Не больше стольких диапазонов geohash в одном запросе
+MAX_COVER_CELLS = 16
+# Ближе к полюсу круг поиска заходить не может
+MAX_SEARCH_LATITUDE = 89.0
+# Кандидатов в одном окне, если limit меньше
+NEARBY_BATCH_SIZE = 100
+
+
+# --- geohash ---
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, value, bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Биты долготы и широты чередуются, начиная с долготы
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            value = bits = 0
+    return ''.join(chars)
+
+
+def cell_span(precision):
+    """Размер клетки geohash в градусах: (широта, долгота)."""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def search_box(latitude, longitude, radius):
+    """
+    Рамка круга: (юг, север, запад, восток, косинус самой дальней от экватора
+    широты рамки). Запад и восток не сводятся к ±180 — рамка может пересекать
+    антимеридиан. ValueError, если круг заходит за MAX_SEARCH_LATITUDE.
+    """
+    # METERS_PER_DEGREE — градус на экваторе по долготе; градус широты у экватора
+    # короче (около 110574 м), поэтому рамка расширена на тот же запас, что и отсев по сфере
+    lat_delta = radius * (1 + SPHERE_ERROR) / METERS_PER_DEGREE
+    far_latitude = abs(latitude) + lat_delta
+    if far_latitude > MAX_SEARCH_LATITUDE:
+        raise ValueError(f'Круг поиска заходит за {MAX_SEARCH_LATITUDE}° широты')
+    far_cos = cos(radians(far_latitude))
+    lon_delta = lat_delta / far_cos
+    return latitude - lat_delta, latitude + lat_delta, longitude - lon_delta, longitude + lon_delta, far_cos
+
+
+def covering_cells(latitude, longitude, radius):
+    """Клетки одного размера, покрывающие круг: самые мелкие, каких нужно не больше MAX_COVER_CELLS."""
+    south, north, west, east, _ = search_box(latitude, longitude, radius)
+    for precision in range(GEOHASH_PRECISION, 1, -1):
+        lat_span, lon_span = cell_span(precision)
+        rows = floor((north + 90) / lat_span) - floor((south + 90) / lat_span) + 1
+        columns = floor((east + 180) / lon_span) - floor((west + 180) / lon_span) + 1
+        if rows * columns <= MAX_COVER_CELLS:
+            break
+    # Иначе precision == 1: клетки по 45°, рамка не шире двух по каждой оси
+
+    cells = set()
+    for row in range(floor((south + 90) / lat_span), floor((north + 90) / lat_span) + 1):
+        cell_south = row * lat_span - 90
+        for column in range(floor((west + 180) / lon_span), floor((east + 180) / lon_span) + 1):
+            cell_west = column * lon_span - 180
+            # Ближайшая к центру точка клетки; долготы в той же системе, что и рамка
+            nearest_lat = min(max(latitude, cell_south), cell_south + lat_span)
+            nearest_lon = min(max(longitude, cell_west), cell_west + lon_span)
+            if sphere_distance(latitude, longitude, nearest_lat, nearest_lon) > radius * (1 + SPHERE_ERROR):
+                continue
+            center_lon = (cell_west + lon_span / 2 + 180) % 360 - 180
+            cells.add(geohash_encode(cell_south + lat_span / 2, center_lon, precision))
+    return sorted(cells)
+
+
+def _prefix_range(prefix):
+    # Все geohash с префиксом лежат в [prefix, следующий префикс): диапазон,
+    # в отличие от LIKE, использует индекс в любой СУБД и при любой сортировке
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return Q(geohash__gte=prefix, geohash__lt=''.join(chars))
+        chars.pop()
+    return Q(geohash__gte=prefix)
+
+
+# --- расстояния ---
+
+def sphere_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    return Geodesic.WGS84.Inverse(lat1, lon1, lat2, lon2, Geodesic.DISTANCE)['s12']
+
+
+def nearby_candidates(latitude, longitude, radius, queryset=None):
+    """Посты из клеток, покрывающих круг, в пределах его рамки; без сортировки."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    south, north, west, east, _ = search_box(latitude, longitude, radius)
+    # Условие geohash > '' совпадает с условием частичного индекса; без сортировки,
+    # иначе СУБД может предпочесть обход индекса по дате
+    candidates = queryset.filter(geohash__gt='').order_by()
+    candidates = candidates.filter(reduce(or_, map(_prefix_range, covering_cells(latitude, longitude, radius))))
+    if west < -180:
+        longitudes = Q(longitude__gte=west + 360) | Q(longitude__lte=east)
+    elif east > 180:
+        longitudes = Q(longitude__gte=west) | Q(longitude__lte=east - 360)
+    else:
+        longitudes = Q(longitude__gte=west, longitude__lte=east)
+    return candidates.filter(longitudes, latitude__gte=south, latitude__lte=north)
+
+
+def _approximate_distance(latitude, longitude, far_cos):
+    # Квадрат расстояния в градусах широты по плоской формуле. Долгота сжата
+    # косинусом самой дальней от экватора широты рамки, поэтому это оценка
+    # снизу: по ней можно сортировать в SQL и решать, когда остановиться
+    lat_delta = F('latitude') - Value(latitude)
+    lon_delta = Least(Abs(F('longitude') - Value(longitude)), 360 - Abs(F('longitude') - Value(longitude)))
+    return ExpressionWrapper(lat_delta * lat_delta + lon_delta * lon_delta * Value(far_cos * far_cos),
+                             output_field=FloatField())
+
+
+def nearby_post_ids(latitude, longitude, radius, limit, queryset=None):
+    """До limit пар (расстояние в метрах, id поста) в радиусе radius, ближайшие первыми."""
+    far_cos = search_box(latitude, longitude, radius)[4]
+    candidates = nearby_candidates(latitude, longitude, radius, queryset).annotate(
+        approximate=_approximate_distance(latitude, longitude, far_cos)
+    ).order_by('approximate', 'pk')
+    batch_size = max(limit, NEARBY_BATCH_SIZE)
+
+    # Куча limit ближайших: (-расстояние, -id), в корне самый дальний
+    nearest = []
+    position = None
+    while True:
+        window = candidates
+        if position is not None:
+            window = window.filter(Q(approximate__gt=position[0]) | Q(approximate=position[0], pk__gt=position[1]))
+        rows = list(window.values_list('approximate', 'pk', 'latitude', 'longitude')[:batch_size])
+        for approximate, pk, lat, lon in rows:
+            bound = radius if len(nearest) < limit else -nearest[0][0]
+            # Остальные кандидаты не ближе этого — ни один уже не попадёт в ответ
+            if sqrt(approximate) * METERS_PER_DEGREE * (1 - SPHERE_ERROR) > bound:
+                return sorted((-distance, -pk) for distance, pk in nearest)
+            # Точное расстояние (медленное) — только тем, кто может попасть в первые limit
+            if sphere_distance(latitude, longitude, lat, lon) * (1 - SPHERE_ERROR) > bound:
+                continue
+            distance = geodesic_distance(latitude, longitude, lat, lon)
+            if distance > bound:
+                continue
+            if len(nearest) < limit:
+                heapq.heappush(nearest, (-distance, -pk))
+            else:
+                heapq.heappushpop(nearest, (-distance, -pk))
+        if len(rows) < batch_size:
+            return sorted((-distance, -pk) for distance, pk in nearest)
+        position = rows[-1][:2]
+
+
+# --- обратное геокодирование ---
+
+PLACES = [
+    ('Москва, Россия', 55.7558, 37.6173),
+    ('Санкт-Петербург, Россия', 59.9343, 30.3351),
+    ('Новосибирск, Россия', 55.0084, 82.9357),
+    ('Екатеринбург, Россия', 56.8389, 60.6057),
+    ('Казань, Россия', 55.7961, 49.1064),
+    ('Нижний Новгород, Россия', 56.2965, 43.9361),
+    ('Челябинск, Россия', 55.1644, 61.4368),
+    ('Самара, Россия', 53.1959, 50.1002),
+    ('Омск, Россия', 54.9885, 73.3242),
+    ('Ростов-на-Дону, Россия', 47.2357, 39.7015),
+    ('Уфа, Россия', 54.7388, 55.9721),
+    ('Красноярск, Россия', 56.0153, 92.8932),
+    ('Пермь, Россия', 58.0105, 56.2502),
+    ('Воронеж, Россия', 51.6608, 39.2003),
+    ('Волгоград, Россия', 48.7080, 44.5133),
+    ('Краснодар, Россия', 45.0355, 38.9753),
+    ('Сочи, Россия', 43.5855, 39.7231),
+    ('Калининград, Россия', 54.7104, 20.4522),
+    ('Иркутск, Россия', 52.2870, 104.3050),
+    ('Владивосток, Россия', 43.1155, 131.8855),
+    ('Минск, Беларусь', 53.9006, 27.5590),
+    ('Киев, Украина', 50.4501, 30.5234),
+    ('Алматы, Казахстан', 43.2220, 76.8512),
+    ('Астана, Казахстан', 51.1694, 71.4491),
+    ('Ташкент, Узбекистан', 41.2995, 69.2401),
+    ('Тбилиси, Грузия', 41.7151, 44.8271),
+    ('Ереван, Армения', 40.1792, 44.4991),
+    ('Стамбул, Турция', 41.0082, 28.9784),
+    ('Берлин, Германия', 52.5200, 13.4050),
+    ('Париж, Франция', 48.8566, 2.3522),
+    ('Лондон, Великобритания', 51.5074, -0.1278),
+    ('Рим, Италия', 41.9028, 12.4964),
+    ('Нью-Йорк, США', 40.7128, -74.0060),
+    ('Токио, Япония', 35.6762, 139.6503),
+]
+
+
+class LocalGeocoder(Geocoder):
+    """
+    Офлайн-замена геокодера geopy: ближайший город из списка places не дальше
+    max_distance метров. Интерфейс reverse() как у geopy.geocoders.Nominatim.
+    """
+
+    def __init__(self, places=PLACES, max_distance=100000, **kwargs):
+        super().__init__(**kwargs)
+        self.places = places
+        self.max_distance = max_distance
+
+    def reverse(self, query, *, exactly_one=True, **kwargs):
+        point = Point(query)
+        distance, name, latitude, longitude = min(
+            (sphere_distance(point.latitude, point.longitude, lat, lon), name, lat, lon)
+            for name, lat, lon in self.places
+        )
+        if distance > self.max_distance:
+            return None
+        location = Location(name, Point(latitude, longitude), {'name': name, 'distance': distance})
+        return location if exactly_one else [location]
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    return import_string(settings.POSTS_GEOCODER)(**settings.POSTS_GEOCODER_OPTIONS)
+
+
+def reverse_geocode(latitude, longitude):
+    """Название места по координатам ('' — не найдено); результат кешируется по клетке ~1 км."""
+    cache = caches[settings.POSTS_CACHE_ALIAS]
+    key = f'posts:geocode:{geohash_encode(latitude, longitude, GEOCODE_CACHE_PRECISION)}'
+    place = cache.get(key)
+    if place is None:
+        try:
+            location = get_geocoder().reverse((latitude, longitude), exactly_one=True)
+        except GeopyError:
+            # Недоступный геокодер не мешает сохранить пост; повторим при следующем сохранении
+            logger.warning('Не удалось определить место для %s, %s', latitude, longitude, exc_info=True)
+            return ''
+        place = location.address[:255] if location else ''
+        cache.set(key, place, settings.POSTS_GEOCODE_CACHE_TIMEOUT)
+    return place
+
+
+def fill_location(post):
+    """Заполняет geohash и place по координатам поста (для bulk_create вызывать явно)."""
+    if post.latitude is None or post.longitude is None:
+        post.geohash = post.place = ''
+        return
+    geohash = geohash_encode(post.latitude, post.longitude)
+    if geohash != post.geohash or not post.place:
+        post.geohash = geohash
+        post.place = reverse_geocode(post.latitude, post.longitude)
+
+
+@receiver(pre_save, sender=Post)
+def update_location(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'latitude', 'longitude'} & set(update_fields):
+        return
+    fill_location(instance)
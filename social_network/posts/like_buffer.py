@@ -0,0 +1,320 @@
+"""
+Отложенная запись лайков (write-behind) для «горячих» постов.
+
+Включается настройкой POSTS_LIKE_WRITE_BEHIND. Лайки и снятия лайков
+копятся в памяти процесса, схлопываются по паре (user, post) — побеждает
+последняя операция — и раз в POSTS_LIKE_BUFFER_FLUSH_INTERVAL секунд
+записываются в таблицу лайков пачками, по одной транзакции на пачку.
+
+Каждая операция сначала дописывается в журнал процесса на диске. При
+сбросе журнал переименовывается и удаляется только после коммита, поэтому
+после падения процесса его операции применяются заново при следующем
+запуске. Пока журнал не удалён, процесс держит на нём блокировку flock;
+ОС снимает её, когда процесс завершается, так что незаблокированный
+журнал принадлежит «мёртвому» процессу, даже если его pid уже занят
+другим. Повторное применение безопасно: вставка идёт с ON CONFLICT DO
+NOTHING, удаление идемпотентно.
+
+Журнал записывается на диск (fsync) при каждом сбросе. Он переживает
+падение процесса, но при отключении питания или сбое ОС теряются
+операции, не дошедшие до сброса (не дольше
+POSTS_LIKE_BUFFER_FLUSH_INTERVAL).
+
+Пользователь сразу видит свои лайки (pending_state): операции остаются
+видны и во время сброса, пока пачка не закоммичена. Гарантия
+действует в пределах процесса: буфер у каждого воркера свой, и запрос,
+попавший в другой воркер, увидит лайк только после сброса (не дольше
+POSTS_LIKE_BUFFER_FLUSH_INTERVAL). Если это важно, запросы пользователя
+нужно направлять в один воркер или выключить отложенную запись.
+"""
+import atexit
+import fcntl
+import glob
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import invalidate_post
+from .models import Like, Post
+from .trending import record_activity
+
+logger = logging.getLogger(__name__)
+
+LIKE = Like._meta.db_table
+SQL_CHUNK_SIZE = 500
+
+
+class LikeBuffer:
+
+    def __init__(self, journal_dir, flush_interval):
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        # Сбросы идут строго по очереди, иначе можно удалить чужой журнал
+        self.flush_lock = threading.Lock()
+        # (user_id, post_id) -> True (лайк) / False (снятие лайка)
+        self.pending = {}
+        # Операции сбрасываемой пачки: видны в pending_state до коммита
+        self.in_flight = {}
+        self.sequence = 0
+        self.journal = None
+        # Переименованные журналы сбросов: открыты, пока не удалены, чтобы держать блокировку
+        self.flushed_journals = {}
+        self.flusher = None
+        os.makedirs(journal_dir, exist_ok=True)
+
+    # --- запись ---
+
+    def add(self, user_id, post_id, liked):
+        line = f'{"L" if liked else "U"} {user_id} {post_id}\n'
+        with self.lock:
+            if self.journal is None:
+                self.journal = _open_locked(self._journal_path())
+            self.journal.write(line)
+            self.pending[(user_id, post_id)] = liked
+        self._start_flusher()
+
+    def pending_state(self, user_id, post_ids):
+        """Ещё не записанные операции пользователя: post_id -> liked."""
+        with self.lock:
+            state = {}
+            for post_id in post_ids:
+                key = (user_id, post_id)
+                # Новая операция из pending важнее сбрасываемой
+                for operations in (self.pending, self.in_flight):
+                    if key in operations:
+                        state[post_id] = operations[key]
+                        break
+            return state
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                operations, self.pending = self.pending, {}
+                self.in_flight = operations
+                self.sequence += 1
+                sequence = self.sequence
+                if self.journal is not None:
+                    # Операции после неудачного сброса уже лежат в журнале прошлой попытки
+                    self.journal.flush()
+                    os.fsync(self.journal.fileno())
+                    os.replace(self._journal_path(), self._journal_path(sequence))
+                    self.flushed_journals[sequence] = self.journal
+                    self.journal = None
+
+            try:
+                self.apply(operations)
+            except Exception:
+                # Возвращаем операции в очередь; более новые (уже в pending) важнее
+                logger.exception('Не удалось записать лайки, повторим при следующем сбросе')
+                with self.lock:
+                    for key, liked in operations.items():
+                        self.pending.setdefault(key, liked)
+                    self.in_flight = {}
+                raise
+            # Транзакция закоммичена — теперь операции видны из БД
+            with self.lock:
+                self.in_flight = {}
+            # Журналы этой и всех предыдущих неудачных попыток больше не нужны
+            for number in [number for number in self.flushed_journals if number <= sequence]:
+                _unlink(self._journal_path(number))
+                self.flushed_journals.pop(number).close()
+            return len(operations)
+
+    def apply(self, operations):
+        apply_operations(operations)
+
+    # --- фоновый сброс ---
+
+    def _start_flusher(self):
+        if self.flush_interval <= 0 or self.flusher is not None:
+            return
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, name='like-buffer', daemon=True)
+                self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Уже записано в лог в flush
+                pass
+            finally:
+                close_old_connections()
+
+    # --- восстановление после сбоя ---
+
+    def replay(self):
+        """Применяет журналы завершившихся процессов."""
+        replayed = 0
+        for pid in {_pid(path) for path in glob.glob(os.path.join(self.journal_dir, 'likes.*.journal*'))}:
+            journals = _lock_journals(self._journal_files(pid))
+            if journals is None:
+                # Журналы держит живой процесс
+                continue
+            try:
+                operations = {}
+                for journal in journals:
+                    operations.update(read_journal(journal))
+                if operations:
+                    apply_operations(operations)
+                    replayed += len(operations)
+                for journal in journals:
+                    _unlink(journal.name)
+            finally:
+                for journal in journals:
+                    journal.close()
+        return replayed
+
+    def _journal_path(self, sequence=None, pid=None):
+        name = f'likes.{pid or self.pid}.journal'
+        if sequence is not None:
+            name += f'.{sequence}'
+        return os.path.join(self.journal_dir, name)
+
+    def _journal_files(self, pid):
+        # Сначала сброшенные пачки по порядку, затем текущий журнал
+        flushing = glob.glob(self._journal_path(pid=pid) + '.*')
+        current = self._journal_path(pid=pid)
+        paths = sorted(flushing, key=_sequence)
+        if os.path.exists(current):
+            paths.append(current)
+        return paths
+
+
+def read_journal(journal):
+    operations = {}
+    for line in journal:
+        parts = line.split()
+        if len(parts) != 3 or parts[0] not in ('L', 'U'):
+            # Недописанная строка при падении процесса
+            continue
+        operations[(int(parts[1]), int(parts[2]))] = parts[0] == 'L'
+    return operations
+
+
+def apply_operations(operations):
+    """Записывает схлопнутые операции и корректирует likes_count."""
+    likes, unlikes = defaultdict(list), defaultdict(list)
+    for (user_id, post_id), liked in operations.items():
+        (likes if liked else unlikes)[post_id].append(user_id)
+
+    post_ids = set(likes) | set(unlikes)
+    existing = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+    now = timezone.now()
+
+    with transaction.atomic():
+        for post_id in existing:
+            try:
+                # Точка сохранения на пост: удалённый пользователь не ломает всю пачку
+                with transaction.atomic(), connection.cursor() as cursor:
+                    delta = 0
+                    for users in _chunks(likes.get(post_id, [])):
+                        values = ', '.join(['(%s, %s, %s)'] * len(users))
+                        params = [value for user_id in users for value in (user_id, post_id, now)]
+                        cursor.execute(
+                            f'INSERT INTO {LIKE} (user_id, post_id, created_at) VALUES {values} '
+                            f'ON CONFLICT (user_id, post_id) DO NOTHING',
+                            params,
+                        )
+                        delta += cursor.rowcount
+                    for users in _chunks(unlikes.get(post_id, [])):
+                        placeholders = ', '.join(['%s'] * len(users))
+                        cursor.execute(
+                            f'DELETE FROM {LIKE} WHERE post_id = %s AND user_id IN ({placeholders})',
+                            [post_id] + users,
+                        )
+                        delta -= cursor.rowcount
+                    if delta:
+                        Post.objects.filter(pk=post_id).update(
+                            likes_count=Greatest(F('likes_count') + delta, Value(0))
+                        )
+                        invalidate_post(post_id)
+                        record_activity(post_id, likes=delta)
+            except IntegrityError:
+                logger.exception('Лайки поста %s не записаны', post_id)
+
+
+def _chunks(items):
+    for start in range(0, len(items), SQL_CHUNK_SIZE):
+        yield items[start:start + SQL_CHUNK_SIZE]
+
+
+def _pid(path):
+    return int(os.path.basename(path).split('.')[1])
+
+
+def _sequence(path):
+    suffix = path.rsplit('.', 1)[1]
+    return int(suffix) if suffix.isdigit() else float('inf')
+
+
+def _open_locked(path):
+    # Журнал мог удалить replay другого процесса между open и flock — тогда открываем заново
+    while True:
+        journal = open(path, 'a', buffering=1)
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        if os.fstat(journal.fileno()).st_nlink:
+            return journal
+        journal.close()
+
+
+def _lock_journals(paths):
+    """Открывает и блокирует журналы; None, если какой-то из них занят."""
+    journals = []
+    try:
+        for path in paths:
+            try:
+                journal = open(path)
+            except FileNotFoundError:
+                continue
+            journals.append(journal)
+            fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if not os.fstat(journal.fileno()).st_nlink:
+                # Уже применён и удалён другим процессом
+                journals.pop().close()
+    except BlockingIOError:
+        for journal in journals:
+            journal.close()
+        return None
+    return journals
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    global _buffer
+    with _buffer_lock:
+        if (_buffer is None or _buffer.pid != os.getpid()
+                or _buffer.journal_dir != settings.POSTS_LIKE_BUFFER_DIR):
+            _buffer = LikeBuffer(settings.POSTS_LIKE_BUFFER_DIR, settings.POSTS_LIKE_BUFFER_FLUSH_INTERVAL)
+            _buffer.replay()
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def write_behind_enabled():
+    return settings.POSTS_LIKE_WRITE_BEHIND
@@ -0,0 +1,88 @@
+"""
+Идемпотентные лайк и снятие лайка.
+
+В PostgreSQL вставка/удаление лайка и изменение счётчика likes_count
+выполняются одним запросом (CTE с INSERT ... ON CONFLICT DO NOTHING или
+DELETE). В остальных СУБД это два запроса в одной транзакции. Повторный
+лайк или снятие несуществующего лайка ничего не меняют и не вызывают
+IntegrityError при одновременных запросах.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import invalidate_post
+from .like_buffer import get_like_buffer, write_behind_enabled
+from .models import Like, Post
+from .trending import record_activity
+
+LIKE = Like._meta.db_table
+POST = Post._meta.db_table
+
+INSERT_LIKE = f"""
+    INSERT INTO {LIKE} (user_id, post_id, created_at)
+    SELECT %s, id, %s FROM {POST} WHERE id = %s AND deleted_at IS NULL
+    ON CONFLICT (user_id, post_id) DO NOTHING
+"""
+
+DELETE_LIKE = f'DELETE FROM {LIKE} WHERE post_id = %s AND user_id = %s'
+
+CHANGE_COUNTER = f"""
+    UPDATE {POST} SET likes_count = GREATEST(likes_count + %s, 0)
+    WHERE id IN (SELECT post_id FROM changed)
+    RETURNING likes_count
+"""
+
+
+def like_post(post_id, user_id):
+    """Возвращает (создан ли лайк, likes_count); None, если поста нет."""
+    return _change_like(post_id, INSERT_LIKE, [user_id, timezone.now(), post_id], +1)
+
+
+def unlike_post(post_id, user_id):
+    """Возвращает (удалён ли лайк, likes_count); None, если поста нет."""
+    return _change_like(post_id, DELETE_LIKE, [post_id, user_id], -1)
+
+
+def _change_like(post_id, statement, params, delta):
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'WITH changed AS ({statement} RETURNING post_id) {CHANGE_COUNTER}',
+                params + [delta],
+            )
+            row = cursor.fetchone()
+            changed = row is not None
+        else:
+            cursor.execute(statement, params)
+            changed = cursor.rowcount == 1
+            if changed:
+                Post.objects.filter(pk=post_id).update(likes_count=Greatest(F('likes_count') + delta, Value(0)))
+            row = None
+
+        if changed:
+            invalidate_post(post_id)
+            record_activity(post_id, likes=delta)
+        if row is None:
+            # Ничего не изменилось (или не PostgreSQL) — читаем текущий счётчик
+            row = Post.objects.filter(pk=post_id).values_list('likes_count').first()
+            if row is None:
+                return None
+    return changed, row[0]
+
+
+def liked_post_ids(user, post_ids):
+    """Множество id постов из post_ids, которые лайкнул пользователь (один запрос)."""
+    if not user.is_authenticated or not post_ids:
+        return set()
+    liked = set(
+        Like.objects.filter(user=user, post_id__in=post_ids, post__deleted_at__isnull=True)
+        .values_list('post_id', flat=True)
+    )
+
+    if write_behind_enabled():
+        # Пользователь сразу видит свои ещё не записанные лайки
+        for post_id, state in get_like_buffer().pending_state(user.pk, post_ids).items():
+            (liked.add if state else liked.discard)(post_id)
+    return liked
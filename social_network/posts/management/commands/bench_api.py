@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from posts.models import Post
+
+User = get_user_model()
+
+DEFAULT_BUDGETS = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'bench_budgets.json'))
+
+# Имя -> шаблон URL; {post} — пост, выбранный с учётом популярности
+ENDPOINTS = {
+    'posts_list': '/api/posts/',
+    'posts_list_page': '/api/posts/?page_size=50',
+    'post_detail': '/api/posts/{post}/',
+    'comments': '/api/posts/{post}/comments/',
+    'likes': '/api/posts/{post}/likes/',
+    'search': '/api/posts/?search={word}',
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон API на данных generate_dataset: p50/p99, запросов в секунду и '
+            'SQL-запросов на эндпоинт. Завершается ошибкой при превышении бюджетов из bench_budgets.json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на эндпоинт')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS),
+                            help='Только указанные эндпоинты (можно несколько раз)')
+        parser.add_argument('--budgets', default=DEFAULT_BUDGETS, help='JSON с бюджетами')
+        parser.add_argument('--no-budgets', action='store_true', help='Только отчёт, без проверки бюджетов')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Без токена (анонимные ответы списка и деталей берутся из кеша)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        hot_posts = list(Post.objects.order_by('-likes_count', '-id').values_list('pk', 'likes_count')[:1000])
+        if not hot_posts:
+            raise CommandError('Нет постов, сначала запустите generate_dataset')
+        # Посты для деталей выбираются пропорционально популярности, как настоящий трафик
+        self.post_ids = [pk for pk, _ in hot_posts]
+        self.post_weights = [likes + 1 for _, likes in hot_posts]
+        self.words = [word for title in Post.objects.values_list('title', flat=True)[:100] if title
+                      for word in title.lower().split()] or ['пост']
+
+        client = Client()
+        if not options['anonymous']:
+            user = User.objects.order_by('pk').first()
+            token, _ = Token.objects.get_or_create(user=user)
+            client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+
+        results = {}
+        self.stdout.write(f'{"эндпоинт":<18}{"запр/с":>10}{"p50, мс":>10}{"p99, мс":>10}{"SQL":>6}')
+        for name in options['endpoint'] or ENDPOINTS:
+            results[name] = self.measure(client, ENDPOINTS[name], options['requests'])
+            result = results[name]
+            self.stdout.write(
+                f'{name:<18}{result["rps"]:>10.0f}{result["p50_ms"]:>10.1f}'
+                f'{result["p99_ms"]:>10.1f}{result["queries"]:>6}'
+            )
+
+        if not options['no_budgets']:
+            self.check_budgets(results, options['budgets'])
+
+    def url(self, template):
+        return template.format(
+            post=self.random.choices(self.post_ids, weights=self.post_weights)[0],
+            word=self.random.choice(self.words),
+        )
+
+    def measure(self, client, template, count):
+        latencies, queries = [], 0
+        started = time.perf_counter()
+        for _ in range(count):
+            url = self.url(template)
+            request_started = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+            queries = max(queries, len(captured))
+        elapsed = time.perf_counter() - started
+
+        cuts = statistics.quantiles([latency * 1000 for latency in latencies], n=100) if count > 1 else [0] * 99
+        return {'rps': count / elapsed, 'p50_ms': cuts[49], 'p99_ms': cuts[98], 'queries': queries}
+
+    def check_budgets(self, results, path):
+        with open(path) as file:
+            budgets = json.load(file)
+
+        violations = []
+        for name, result in results.items():
+            budget = budgets.get(name, {})
+            if 'queries' in budget and result['queries'] > budget['queries']:
+                violations.append(f'{name}: SQL-запросов {result["queries"]} > {budget["queries"]}')
+            if 'p99_ms' in budget and result['p99_ms'] > budget['p99_ms']:
+                violations.append(f'{name}: p99 {result["p99_ms"]:.1f} мс > {budget["p99_ms"]} мс')
+        if violations:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('Бюджеты соблюдены'))
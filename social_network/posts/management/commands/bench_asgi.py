@@ -0,0 +1,111 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+
+from posts.models import Comment, Like, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку страницы поста под нагрузкой: WSGI (sync DRF), '
+            'ASGI (sync DRF через адаптер) и ASGI (async-представление)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов')
+        parser.add_argument('--comments', type=int, default=50, help='Комментариев у тестового поста')
+        parser.add_argument('--db-latency', type=float, default=1.0,
+                            help='Задержка сети до БД на запрос, мс (SQLite локален, PostgreSQL — нет)')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_asgi')
+        token, _ = Token.objects.get_or_create(user=user)
+        post = Post.objects.create(user=user, image='images/bench.jpg', title='bench_asgi')
+        Comment.objects.bulk_create(
+            [Comment(post=post, user=user, text=f'Комментарий {i}') for i in range(options['comments'])]
+        )
+        Like.objects.create(post=post, user=user)
+        # С токеном, чтобы не попадать в кеш ответов для анонимов
+        headers = {'Authorization': f'Token {token.key}'}
+        self.simulate_latency(options['db_latency'] / 1000)
+
+        try:
+            scenarios = [
+                ('WSGI, sync DRF', self.measure_wsgi, f'/api/posts/{post.pk}/'),
+                ('ASGI, sync DRF', self.measure_asgi, f'/api/posts/{post.pk}/'),
+                ('ASGI, async', self.measure_asgi, f'/api/async/posts/{post.pk}/'),
+            ]
+            self.stdout.write(f'{"сценарий":<20}{"запр/с":>10}{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}')
+            for title, measure, url in scenarios:
+                latencies, elapsed = measure(url, headers, options['requests'], options['concurrency'])
+                self.report(title, latencies, elapsed)
+        finally:
+            post.delete()
+            user.delete()
+
+    def simulate_latency(self, latency):
+        # Каждый запрос к БД ждёт latency секунд без GIL, как при сетевом обмене
+        def wrapper(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_wrapper(sender, connection, **kwargs):
+            connection.execute_wrappers.append(wrapper)
+
+        if latency > 0:
+            connection_created.connect(add_wrapper, weak=False)
+            connections.close_all()
+
+    def measure_wsgi(self, url, headers, count, concurrency):
+        # Как WSGI-сервер с пулом потоков (gunicorn --threads)
+        def request(_):
+            client = Client()
+            started = time.perf_counter()
+            response = client.get(url, headers=headers)
+            self.check_response(response)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(request, range(count)))
+        return latencies, time.perf_counter() - started
+
+    def measure_asgi(self, url, headers, count, concurrency):
+        # Как ASGI-сервер (uvicorn): один цикл событий, ограничение одновременных запросов.
+        # ThreadSensitiveContext — как в ASGIHandler: sync-код каждого запроса в своём потоке
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore, ThreadSensitiveContext():
+                    started = time.perf_counter()
+                    response = await client.get(url, headers=headers)
+                    self.check_response(response)
+                    return time.perf_counter() - started
+
+            return await asyncio.gather(*(request() for _ in range(count)))
+
+        started = time.perf_counter()
+        latencies = asyncio.run(run())
+        return latencies, time.perf_counter() - started
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f'Ответ {response.status_code}: {response.content[:200]!r}')
+
+    def report(self, title, latencies, elapsed):
+        cuts = statistics.quantiles([latency * 1000 for latency in latencies], n=100)
+        self.stdout.write(
+            f'{title:<20}{len(latencies) / elapsed:>10.0f}{cuts[49]:>10.1f}{cuts[94]:>10.1f}{cuts[98]:>10.1f}'
+        )
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from posts import authentication
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Скорость лайков с аутентификацией по токену: без кеша (как TokenAuthentication) '
+            'и с кешем токен -> пользователь')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на режим (лайк и снятие по очереди)')
+        parser.add_argument('--users', type=int, default=50, help='Сколько пользователей с токенами')
+
+    def handle(self, *args, **options):
+        users = [User.objects.get_or_create(username=f'bench_auth_{i}')[0] for i in range(options['users'])]
+        tokens = [Token.objects.get_or_create(user=user)[0].key for user in users]
+        post = Post.objects.create(user=users[0], image='images/bench.jpg', title='bench_auth')
+        url = f'/api/posts/{post.pk}/likes/'
+
+        try:
+            self.stdout.write(f'{"режим":<24}{"запр/с":>10}{"SQL на запрос":>16}')
+            for title, ttl in [('без кеша', 0), ('кеш токенов', 60)]:
+                authentication.clear()
+                with override_settings(POSTS_AUTH_CACHE_TTL=ttl, POSTS_LIKE_WRITE_BEHIND=False):
+                    rate, queries = self.measure(url, tokens, options['requests'])
+                self.stdout.write(f'{title:<24}{rate:>10.0f}{queries:>16}')
+        finally:
+            post.delete()
+            User.objects.filter(username__startswith='bench_auth_').delete()
+
+    def measure(self, url, tokens, count):
+        client = Client()
+        # Прогрев: первый запрос каждого токена заполняет кеш
+        for key in tokens:
+            client.post(url, headers={'Authorization': f'Token {key}'})
+            client.delete(url, headers={'Authorization': f'Token {key}'})
+
+        with CaptureQueriesContext(connection) as captured:
+            client.post(url, headers={'Authorization': f'Token {tokens[0]}'})
+        queries = len(captured)
+        client.delete(url, headers={'Authorization': f'Token {tokens[0]}'})
+
+        started = time.perf_counter()
+        for i in range(count):
+            headers = {'Authorization': f'Token {tokens[i // 2 % len(tokens)]}'}
+            response = client.post(url, headers=headers) if i % 2 == 0 else client.delete(url, headers=headers)
+            if response.status_code >= 400:
+                raise RuntimeError(f'Ответ {response.status_code}: {response.content[:200]!r}')
+        return count / (time.perf_counter() - started), queries
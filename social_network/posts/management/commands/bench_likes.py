@@ -0,0 +1,63 @@
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.like_buffer import LikeBuffer
+from posts.likes import like_post
+from posts.models import Like, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость записи лайков одного поста: сразу в БД и через буфер write-behind'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--likes', type=int, default=5000, help='Сколько лайков поставить')
+        parser.add_argument('--flush-every', type=int, default=1000,
+                            help='Сколько операций копится в буфере до сброса (имитация интервала)')
+
+    def handle(self, *args, **options):
+        count = options['likes']
+        User.objects.bulk_create(
+            [User(username=f'bench_like_{i}') for i in range(count)], ignore_conflicts=True
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith='bench_like_').values_list('pk', flat=True)[:count]
+        )
+        post = Post.objects.create(user_id=user_ids[0], image='images/bench.jpg', title='bench_likes')
+
+        try:
+            started = time.perf_counter()
+            for user_id in user_ids:
+                like_post(post.pk, user_id)
+            direct = time.perf_counter() - started
+            self.check_count(post, len(user_ids))
+
+            Like.objects.filter(post=post).delete()
+            Post.objects.filter(pk=post.pk).update(likes_count=0)
+
+            with tempfile.TemporaryDirectory() as journal_dir:
+                buffer = LikeBuffer(journal_dir, flush_interval=0)
+                started = time.perf_counter()
+                for i, user_id in enumerate(user_ids, 1):
+                    buffer.add(user_id, post.pk, True)
+                    if i % options['flush_every'] == 0:
+                        buffer.flush()
+                buffer.flush()
+                buffered = time.perf_counter() - started
+            self.check_count(post, len(user_ids))
+        finally:
+            post.delete()
+            User.objects.filter(username__startswith='bench_like_').delete()
+
+        self.stdout.write(f'{"режим":<24}{"лайков/с":>12}')
+        self.stdout.write(f'{"сразу в БД":<24}{len(user_ids) / direct:>12.0f}')
+        self.stdout.write(f'{"write-behind":<24}{len(user_ids) / buffered:>12.0f}')
+
+    def check_count(self, post, expected):
+        post.refresh_from_db()
+        if post.likes_count != expected or post.likes.count() != expected:
+            self.stderr.write(f'Счётчик разошёлся: {post.likes_count} != {expected}')
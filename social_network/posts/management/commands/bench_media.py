@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.views.static import serve
+
+from posts.media import serve_media
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает раздачу медиа через django.views.static.serve и posts.media.serve_media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help='Размер тестового файла, байт')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+
+    def handle(self, *args, **options):
+        name = 'bench_media.bin'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(os.urandom(options['size']))
+
+        try:
+            factory = RequestFactory()
+            probe = serve_media(factory.get('/'), name)
+            etag = probe['ETag']
+            probe.close()
+
+            scenarios = [
+                ('полный GET', {}),
+                ('повторный GET (If-None-Match)', {'HTTP_IF_NONE_MATCH': etag}),
+                ('Range 64 КБ', {'HTTP_RANGE': 'bytes=0-65535'}),
+            ]
+            views = [
+                ('static.serve', lambda request: serve(request, name, document_root=settings.MEDIA_ROOT)),
+                ('serve_media', lambda request: serve_media(request, name)),
+            ]
+
+            self.stdout.write(f'{"сценарий":<32}{"view":<16}{"статус":>8}{"запр/с":>10}{"МБ отдано":>12}')
+            for title, headers in scenarios:
+                for view_name, view in views:
+                    status, rate, sent = self.measure(factory, view, headers, options['requests'])
+                    self.stdout.write(f'{title:<32}{view_name:<16}{status:>8}{rate:>10.0f}{sent / 2 ** 20:>12.1f}')
+        finally:
+            os.unlink(path)
+
+    def measure(self, factory, view, headers, count):
+        sent = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            response = view(factory.get('/', **headers))
+            # Вычитываем тело так же, как это сделал бы WSGI-сервер
+            body = response.streaming_content if response.streaming else [response.content]
+            sent += sum(len(chunk) for chunk in body)
+            response.close()
+        elapsed = time.perf_counter() - started
+        return response.status_code, count / elapsed, sent
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from posts.fast import CompiledSerializer
+from posts.models import Post
+from posts.renderers import FastJSONRenderer
+from posts.serializers import PostSerializer
+from posts.views import attach_comments_preview, with_comments_preview
+
+
+class Command(BaseCommand):
+    help = ('Сериализация страницы постов: сериализаторы DRF и скомпилированный по .values() '
+            '(posts/fast.py), json и orjson; затем весь запрос /api/posts/ в обоих режимах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=200, help='Повторов на режим')
+
+    def handle(self, *args, **options):
+        size, repeat = options['page_size'], options['repeat']
+        request = Request(RequestFactory().get('/api/posts/'))
+        context = {'request': request}
+
+        posts = list(with_comments_preview(Post.objects.all())[:size])
+        if not posts:
+            raise CommandError('Нет постов, сначала запустите generate_dataset')
+        compiled = CompiledSerializer(PostSerializer, context)
+        rows = list(Post.objects.values(*compiled.columns)[:size])
+        attach_comments_preview(rows, context)
+
+        def drf():
+            return PostSerializer(posts, many=True, context=context).data
+
+        def fast():
+            return compiled.many(rows)
+
+        data = drf()
+        self.stdout.write(f'{"режим (" + str(len(posts)) + " постов)":<36}{"страниц/с":>12}{"мс":>10}')
+        for title, func in [
+            ('DRF', drf),
+            ('скомпилированный', fast),
+            ('рендеринг json', lambda: JSONRenderer().render(data)),
+            ('рендеринг orjson', lambda: FastJSONRenderer().render(data)),
+            ('DRF + json', lambda: JSONRenderer().render(drf())),
+            ('скомпилированный + orjson', lambda: FastJSONRenderer().render(fast())),
+        ]:
+            self.report(title, func, repeat)
+
+        # С токеном: анонимные списки отдаются из кеша ответов
+        client = Client(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=posts[0].user)[0].key}')
+        url = f'/api/posts/?page_size={size}'
+        for title, enabled in [('запрос, DRF', False), ('запрос, быстрый путь', True)]:
+            with override_settings(POSTS_FAST_SERIALIZATION=enabled):
+                self.report(title, lambda: client.get(url, HTTP_ACCEPT='application/json'), max(repeat // 4, 1))
+
+    def report(self, title, func, repeat):
+        func()  # прогрев
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - started) / repeat
+        self.stdout.write(f'{title:<36}{1 / elapsed:>12.0f}{elapsed * 1000:>10.2f}')
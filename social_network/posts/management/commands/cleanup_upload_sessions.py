@@ -0,0 +1,41 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import UploadSession
+from posts.uploads import delete_session_file
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные и завершённые сессии загрузки вместе с временными файлами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=settings.POSTS_UPLOAD_SESSION_TTL,
+                            help='Через сколько секунд без активности сессия считается брошенной')
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(seconds=options['ttl'])
+        stale = UploadSession.objects.filter(updated_at__lt=deadline)
+
+        deleted = 0
+        for session in stale.iterator():
+            delete_session_file(session)
+            session.delete()
+            deleted += 1
+
+        # Временные файлы без сессии (например, после сбоя при создании)
+        known = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+        orphans = 0
+        if os.path.isdir(settings.POSTS_UPLOAD_DIR):
+            for filename in os.listdir(settings.POSTS_UPLOAD_DIR):
+                path = os.path.join(settings.POSTS_UPLOAD_DIR, filename)
+                if filename not in known and os.path.getmtime(path) < deadline.timestamp():
+                    os.unlink(path)
+                    orphans += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено сессий: {deleted}, файлов без сессии: {orphans}'
+        ))
@@ -0,0 +1,76 @@
+import hashlib
+import re
+
+from django.core.management.base import BaseCommand
+
+from posts.blobs import acquire_blob, release_blob
+from posts.cache import invalidate_post
+from posts.models import Post
+from posts.storage import HASH_ALGORITHM, image_storage
+
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class Command(BaseCommand):
+    help = 'Переносит изображения постов в хранилище по содержимому и удаляет дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки постов')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько места освободится')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        # старое имя -> новое имя (или хеш в режиме --dry-run)
+        moved = {}
+        missing = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_id).exclude(image='')
+                .order_by('pk').values_list('pk', 'image')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            for pk, name in batch:
+                if CONTENT_ADDRESSED_NAME.search(name):
+                    continue
+                if name not in moved:
+                    if not image_storage.exists(name):
+                        self.stderr.write(f'Файл не найден: {name} (пост {pk})')
+                        missing += 1
+                        continue
+                    moved[name] = self.digest(name) if dry_run else self.move(name)
+                if not dry_run:
+                    Post.objects.filter(pk=pk).update(image=moved[name])
+                    acquire_blob(moved[name])
+                    release_blob(name)
+                    invalidate_post(pk)
+
+        freed = 0
+        seen = set()
+        for old_name, new_name in moved.items():
+            if new_name in seen:
+                freed += image_storage.size(old_name)
+            seen.add(new_name)
+            if not dry_run and not Post.objects.filter(image=old_name).exists():
+                image_storage.delete(old_name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов перенесено: {len(moved)}, уникальных: {len(seen)}, '
+            f'дубликаты занимали: {freed} байт, не найдено: {missing}'
+            + (' (пробный запуск)' if dry_run else '')
+        ))
+
+    def move(self, name):
+        with image_storage.open(name, 'rb') as file:
+            return image_storage.save(name, file)
+
+    def digest(self, name):
+        hasher = hashlib.new(HASH_ALGORITHM)
+        with image_storage.open(name, 'rb') as file:
+            for chunk in file.chunks():
+                hasher.update(chunk)
+        return hasher.hexdigest()
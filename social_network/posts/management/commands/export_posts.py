@@ -0,0 +1,60 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты (и при необходимости комментарии и лайки) в NDJSON. '
+            'С --state продолжает с места прошлой выгрузки: повторный запуск выгружает только изменения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--include', action='append', choices=['comments', 'likes'], default=[],
+                            help='Добавить раздел (можно несколько раз)')
+        parser.add_argument('--since', help='Только записи, изменённые начиная с даты (ISO 8601)')
+        parser.add_argument('--cursor', help='Курсор из строки checkpoint/end прошлой выгрузки')
+        parser.add_argument('--state', help='Файл с курсором: читается при старте и обновляется по ходу выгрузки')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('--since: ожидается дата и время в ISO 8601')
+
+        cursor = options['cursor']
+        if not cursor and options['state'] and os.path.exists(options['state']):
+            with open(options['state']) as file:
+                cursor = file.read().strip()
+        try:
+            positions = export.decode_cursor(cursor) if cursor else None
+        except export.InvalidCursor as e:
+            raise CommandError(str(e))
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'ab')
+        records = 0
+        try:
+            for record in export.export_records(['posts', *options['include']], positions, since):
+                output.write(export.encode_line(record))
+                if 'cursor' in record:
+                    # Курсор сохраняем только после того, как строки до него записаны
+                    output.flush()
+                    self.save_state(options['state'], record['cursor'])
+                else:
+                    records += 1
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        self.stderr.write(f'Выгружено записей: {records}')
+
+    def save_state(self, path, cursor):
+        if not path:
+            return
+        # Через временный файл, чтобы прерванная запись не испортила курсор
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(cursor)
+        os.replace(f'{path}.tmp', path)
@@ -0,0 +1,192 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from posts.cache import invalidate_post_lists
+from posts.models import Comment, ImageBlob, Like, Post
+from posts.search import index_posts
+from posts.storage import image_storage
+
+User = get_user_model()
+
+WORDS = (
+    'закат рассвет море горы лес город улица кот собака кофе завтрак поездка отпуск друзья '
+    'семья праздник осень зима весна лето дождь снег солнце река озеро парк музей концерт '
+    'выставка архитектура мост портрет пейзаж цветы сад дача велосипед поход пляж небо облака'
+).split()
+
+PLACEHOLDER_SIZE = (64, 48)
+
+
+def zipf_weights(count, exponent):
+    # Вес ранга r пропорционален 1 / r^s: немногие объекты собирают большую часть активности
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def allocate(total, weights, limit):
+    """Делит total между объектами пропорционально весам, не больше limit на объект."""
+    scale = total / sum(weights)
+    return [min(limit, round(weight * scale)) for weight in weights]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    # bulk_create вызывает pre_save, и auto_now/auto_now_add затёрли бы сгенерированные даты
+    flags = [(field, field.auto_now, field.auto_now_add) for model in models
+             for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', None) is not None]
+    for field, _, _ in flags:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Генерирует тестовые данные для нагрузочных замеров: пользователи, посты, лайки и '
+            'комментарии с популярностью по закону Ципфа (можно миллионы)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--likes', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения Ципфа')
+        parser.add_argument('--images', type=int, default=16, help='Сколько разных картинок-заглушек')
+        parser.add_argument('--days', type=int, default=365, help='За какой период распределить посты')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days']).total_seconds()
+
+        with explicit_timestamps(Post, Like, Comment):
+            user_ids = self.create_users(options['users'])
+            images = self.create_images(options['images'])
+            # Ранг 1 — самый популярный пост; ранги раздаются постам случайно
+            weights = zipf_weights(options['posts'], options['zipf'])
+            self.random.shuffle(weights)
+            likes = allocate(options['likes'], weights, len(user_ids))
+            comments = allocate(options['comments'], weights, options['comments'])
+            posts = self.create_posts(user_ids, images, likes, comments, options['zipf'])
+            total_likes = self.create_likes(posts, likes, user_ids)
+            total_comments = self.create_comments(posts, comments, user_ids)
+        invalidate_post_lists()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(user_ids)}, постов: {len(posts)}, '
+            f'лайков: {total_likes}, комментариев: {total_comments}'
+        ))
+
+    def timestamp(self, after=None):
+        start = after or self.now - timedelta(seconds=self.period)
+        return start + (self.now - start) * self.random.random()
+
+    def create_users(self, count):
+        start = User.objects.count()
+        password = make_password('password')
+        user_ids = []
+        for offset in range(0, count, self.batch_size):
+            batch = [
+                User(username=f'gen_user_{start + number}', password=password)
+                for number in range(offset, min(offset + self.batch_size, count))
+            ]
+            user_ids += [user.pk for user in User.objects.bulk_create(batch)]
+        self.stdout.write(f'Пользователи: {len(user_ids)}')
+        return user_ids
+
+    def create_images(self, count):
+        names = []
+        for number in range(count):
+            buffer = BytesIO()
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            Image.new('RGB', PLACEHOLDER_SIZE, color).save(buffer, 'JPEG')
+            name = image_storage.save(f'images/placeholder_{number}.jpg', ContentFile(buffer.getvalue()))
+            ImageBlob.objects.get_or_create(name=name, defaults={'size': buffer.tell(), 'ref_count': 0})
+            names.append(name)
+        return names
+
+    def create_posts(self, user_ids, images, likes, comments, exponent):
+        # Активность авторов тоже неравномерная
+        author_weights = list(accumulate(zipf_weights(len(user_ids), exponent)))
+        width, height = PLACEHOLDER_SIZE
+        posts = []
+        image_refs = dict.fromkeys(images, 0)
+        for offset in range(0, len(likes), self.batch_size):
+            batch = []
+            for number in range(offset, min(offset + self.batch_size, len(likes))):
+                image = self.random.choice(images)
+                image_refs[image] += 1
+                created_at = self.timestamp()
+                batch.append(Post(
+                    user_id=self.random.choices(user_ids, cum_weights=author_weights)[0],
+                    title=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                    description=' '.join(self.random.choices(WORDS, k=12)),
+                    image=image,
+                    image_width=width,
+                    image_height=height,
+                    created_at=created_at,
+                    updated_at=created_at,
+                    likes_count=likes[number],
+                    comments_count=comments[number],
+                ))
+            with transaction.atomic():
+                batch = Post.objects.bulk_create(batch)
+                index_posts(batch)
+            posts += [(post.pk, post.created_at) for post in batch]
+            self.stdout.write(f'Посты: {len(posts)}/{len(likes)}')
+
+        # Ссылки на файлы, которые обычно ведут сигналы (posts/blobs.py)
+        for name, refs in image_refs.items():
+            ImageBlob.objects.filter(name=name).update(ref_count=F('ref_count') + refs)
+        return posts
+
+    def create_likes(self, posts, likes, user_ids):
+        batch, total = [], 0
+        for (post_id, created_at), count in zip(posts, likes):
+            # Разные пользователи: пара (user, post) уникальна
+            for user_id in self.random.sample(user_ids, count):
+                batch.append(Like(user_id=user_id, post_id=post_id, created_at=self.timestamp(created_at)))
+            if len(batch) >= self.batch_size:
+                total += self.flush(Like, batch)
+        total += self.flush(Like, batch)
+        return total
+
+    def create_comments(self, posts, comments, user_ids):
+        batch, total = [], 0
+        for (post_id, created_at), count in zip(posts, comments):
+            for _ in range(count):
+                batch.append(Comment(
+                    post_id=post_id,
+                    user_id=self.random.choice(user_ids),
+                    text=' '.join(self.random.choices(WORDS, k=self.random.randint(2, 10))),
+                    created_at=(commented_at := self.timestamp(created_at)),
+                    update_at=commented_at,
+                ))
+            if len(batch) >= self.batch_size:
+                total += self.flush(Comment, batch)
+        total += self.flush(Comment, batch)
+        return total
+
+    def flush(self, model, batch):
+        count = len(batch)
+        if count:
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: +{count}')
+            batch.clear()
+        return count
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.renditions import generate_renditions, run_rendition_job
+
+
+class Command(BaseCommand):
+    help = 'Генерирует превью изображений для существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перегенерировать превью у всех постов')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки постов')
+        parser.add_argument('--workers', type=int, default=4, help='Количество потоков (0 — в текущем потоке)')
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.exclude(image='')
+        if not options['all']:
+            queryset = queryset.filter(renditions={})
+
+        last_id = 0
+        total = 0
+        workers = options['workers']
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            while True:
+                ids = list(
+                    queryset.filter(pk__gt=last_id).order_by('pk')
+                    .values_list('pk', flat=True)[:options['batch_size']]
+                )
+                if not ids:
+                    break
+                last_id = ids[-1]
+                if workers > 0:
+                    # Ждём пачку целиком, чтобы очередь не росла без ограничений
+                    list(executor.map(run_rendition_job, ids))
+                else:
+                    for pk in ids:
+                        generate_renditions(pk)
+                total += len(ids)
+                self.stdout.write(f'Обработано постов: {total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово, обработано постов: {total}'))
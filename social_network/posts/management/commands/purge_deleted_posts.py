@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import Post
+from posts.purge import purge_post
+
+
+class Command(BaseCommand):
+    help = ('Окончательно удаляет помеченные удалёнными посты, чья фоновая очистка не завершилась '
+            '(например, из-за перезапуска)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=300,
+                            help='Не трогать посты, удалённые менее N секунд назад (их ещё чистит фон)')
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(seconds=options['min_age'])
+        pending = Post.all_objects.filter(deleted_at__lte=deadline).values_list('pk', flat=True)
+
+        posts = rows = 0
+        for post_id in list(pending):
+            rows += purge_post(post_id)
+            posts += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено постов: {posts}, строк всего: {rows}'))
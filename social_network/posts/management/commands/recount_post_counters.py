@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from posts.cache import invalidate_post
+from posts.models import Post, Like, Comment
+
+
+def _count_subquery(model):
+    # Подзапрос COUNT(*) по post_id без GROUP BY по основной таблице
+    return Coalesce(
+        Subquery(
+            model.objects.filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает likes_count и comments_count у постов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки постов')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        checked = fixed = 0
+
+        while True:
+            # Идём по первичному ключу, чтобы не использовать OFFSET
+            batch = list(
+                Post.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .annotate(
+                    real_likes=_count_subquery(Like),
+                    real_comments=_count_subquery(Comment),
+                )
+                .values_list('pk', 'likes_count', 'comments_count', 'real_likes', 'real_comments')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            checked += len(batch)
+
+            with transaction.atomic():
+                for pk, likes, comments, real_likes, real_comments in batch:
+                    if likes == real_likes and comments == real_comments:
+                        continue
+                    # Пересчитываем в UPDATE, чтобы не затереть параллельные изменения
+                    Post.objects.filter(pk=pk).update(
+                        likes_count=_count_subquery(Like),
+                        comments_count=_count_subquery(Comment),
+                    )
+                    invalidate_post(pk)
+                    fixed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Проверено постов: {checked}, исправлено: {fixed}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import rerank
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг популярных постов (для cron; иначе его пересчитывает /api/posts/trending/)'
+
+    def handle(self, *args, **options):
+        ranked = rerank()
+        self.stdout.write(self.style.SUCCESS(f'Постов в рейтинге: {ranked}'))
@@ -0,0 +1,146 @@
+"""
+Раздача медиафайлов (MEDIA_URL) с поддержкой кеширования и докачки.
+
+- сильный ETag и Last-Modified, ответ 304 на If-None-Match/If-Modified-Since;
+- запросы Range (один диапазон) с ответом 206 и проверкой If-Range;
+- передача файла фронт-прокси через X-Accel-Redirect (nginx) или
+  X-Sendfile (Apache, lighttpd), если задан POSTS_MEDIA_ACCEL.
+
+Файлы и каталоги, начинающиеся с точки (например, .incoming хранилища
+по содержимому), не раздаются.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import HASH_ALGORITHM
+
+STREAM_CHUNK_SIZE = 64 * 1024
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_ADDRESSED_NAME = re.compile(r'(?:^|/)([0-9a-f]{64})(?:\.\w+)?$')
+
+
+def file_etag(path, stat):
+    # Для файлов из хранилища по содержимому ETag — это хеш из имени
+    match = CONTENT_ADDRESSED_NAME.search(path)
+    if match:
+        return quote_etag(f'{HASH_ALGORITHM}-{match.group(1)}')
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def parse_range(header, size):
+    """Возвращает (start, end) включительно, None — отдать файл целиком."""
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Несколько диапазонов и прочие единицы не поддерживаем — RFC 9110
+        # разрешает в этом случае ответить 200 с полным файлом
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-N — последние N байт
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError('Диапазон за пределами файла')
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(STREAM_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+@require_safe
+def serve_media(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    # Служебные каталоги хранилища (.incoming — недописанные загрузки) не раздаются
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404('Файл не найден')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+
+    stat = os.stat(full_path)
+    etag = file_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        _set_cache_headers(not_modified, path, etag, last_modified)
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    size = stat.st_size
+
+    accel = settings.POSTS_MEDIA_ACCEL
+    if accel:
+        # Файл отдаёт прокси (он же обрабатывает Range), Django только проверяет доступ
+        response = HttpResponse(content_type=content_type)
+        if accel == 'nginx':
+            response['X-Accel-Redirect'] = settings.POSTS_MEDIA_ACCEL_PREFIX + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if range_header and (if_range is None or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = size
+        elif byte_range is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(full_path, start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    _set_cache_headers(response, path, etag, last_modified)
+    return response
+
+
+def _set_cache_headers(response, path, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if CONTENT_ADDRESSED_NAME.search(path):
+        # Содержимое по этому адресу никогда не меняется
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.POSTS_MEDIA_CACHE_MAX_AGE}'
@@ -0,0 +1,304 @@
+"""
+Метрики запросов в формате Prometheus (GET /metrics).
+
+MetricsMiddleware для каждого запроса собирает время ответа, число и
+длительность SQL-запросов (обёртка execute у каждого соединения), время
+сериализации (TimedSerializerMixin) и рендеринга, размер ответа, и
+складывает их в гистограммы и счётчики по представлению. Агрегаты живут
+в памяти процесса: при нескольких воркерах Prometheus опрашивает каждый.
+Медленные запросы пишутся в лог вместе с самыми долгими SQL-запросами.
+
+/metrics отдаётся администраторам и по заголовку Authorization: Bearer
+<POSTS_METRICS_TOKEN>. Адреса из POSTS_METRICS_ALLOWED_IPS (по умолчанию
+пусто) имеют смысл, только если приложение не стоит за прокси на том же
+хосте: иначе REMOTE_ADDR у всех запросов 127.0.0.1.
+"""
+import heapq
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TOP_QUERIES = 5
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Метрики одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.timings = defaultdict(float)
+        self.active = set()
+        # Самые долгие запросы: куча (длительность, порядковый номер, sql)
+        self.slowest = []
+        # Запросы одного HTTP-запроса могут идти из нескольких потоков (асинхронные представления)
+        self.lock = threading.Lock()
+
+    def add_query(self, sql, duration):
+        with self.lock:
+            self.queries += 1
+            self.db_seconds += duration
+            item = (duration, self.queries, sql)
+            if len(self.slowest) < TOP_QUERIES:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timings[name] += seconds
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к метрике name текущего запроса (вложенные блоки не суммируются)."""
+    metrics = _current.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - started)
+        metrics.active.discard(name)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class ViewStats:
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses = Counter()
+        self.db_seconds = 0.0
+        self.timings = Counter()
+        self.response_bytes = 0
+
+
+_stats = defaultdict(ViewStats)
+_stats_lock = threading.Lock()
+
+
+def record(view, method, status, duration, metrics, response_bytes):
+    with _stats_lock:
+        stats = _stats[(view, method)]
+        stats.latency.observe(duration)
+        stats.queries.observe(metrics.queries)
+        stats.statuses[status] += 1
+        stats.db_seconds += metrics.db_seconds
+        stats.timings.update(metrics.timings)
+        stats.response_bytes += response_bytes
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+
+# --- SQL ---
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Сигнал приходит при каждом переподключении, обёртка нужна одна
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# --- сериализаторы ---
+
+class TimedListSerializer(serializers.ListSerializer):
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Время .data попадает в метрику serialize; для many=True укажите TimedListSerializer в Meta."""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+# --- middleware ---
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics, started)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics, started)
+        return response
+
+    def start(self):
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после представления
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.add_time('render', time.perf_counter() - started)
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics, started):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else 'unmatched'
+        if view == 'metrics':
+            return
+        size = len(response.content) if not response.streaming else int(response.get('Content-Length') or 0)
+        record(view, request.method, response.status_code, duration, metrics, size)
+
+        if duration >= settings.POSTS_SLOW_REQUEST_SECONDS:
+            top = sorted(metrics.slowest, reverse=True)
+            logger.warning(
+                'Медленный запрос %s %s: %.3f с, SQL: %d запросов за %.3f с, сериализация %.3f с%s',
+                request.method, request.path, duration, metrics.queries, metrics.db_seconds,
+                metrics.timings.get('serialize', 0),
+                ''.join(f'\n  {seconds * 1000:.1f} мс: {sql[:500]}' for seconds, _, sql in top),
+            )
+
+
+# --- экспорт ---
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels.items()) + '}'
+
+
+def _histogram(lines, name, histogram, labels):
+    total = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        total += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {total}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum}')
+    lines.append(f'{name}_count{_labels(**labels)} {total}')
+
+
+def render_metrics():
+    with _stats_lock:
+        lines = [
+            '# HELP posts_http_requests_total Запросы по представлению, методу и статусу',
+            '# TYPE posts_http_requests_total counter',
+        ]
+        for (view, method), stats in _stats.items():
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'posts_http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+        lines += [
+            '# HELP posts_http_request_duration_seconds Время ответа',
+            '# TYPE posts_http_request_duration_seconds histogram',
+        ]
+        for (view, method), stats in _stats.items():
+            _histogram(lines, 'posts_http_request_duration_seconds', stats.latency, {'view': view, 'method': method})
+
+        lines += [
+            '# HELP posts_http_request_db_queries SQL-запросов на HTTP-запрос',
+            '# TYPE posts_http_request_db_queries histogram',
+        ]
+        for (view, method), stats in _stats.items():
+            _histogram(lines, 'posts_http_request_db_queries', stats.queries, {'view': view, 'method': method})
+
+        counters = [
+            ('posts_http_db_duration_seconds_total', 'Время SQL-запросов', lambda stats: stats.db_seconds),
+            ('posts_http_serialize_duration_seconds_total', 'Время сериализации',
+             lambda stats: stats.timings['serialize']),
+            ('posts_http_render_duration_seconds_total', 'Время рендеринга ответа',
+             lambda stats: stats.timings['render']),
+            ('posts_http_response_bytes_total', 'Размер ответов', lambda stats: stats.response_bytes),
+        ]
+        for name, help_text, value in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (view, method), stats in _stats.items():
+                lines.append(f'{name}{_labels(view=view, method=method)} {value(stats)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _has_metrics_token(request):
+    token = settings.POSTS_METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    return bool(token) and len(header) == 2 and header[0].lower() == 'bearer' and hmac.compare_digest(
+        header[1].encode(), token.encode()
+    )
+
+
+def metrics_view(request):
+    allowed = (
+        request.user.is_staff
+        or _has_metrics_token(request)
+        or request.META.get('REMOTE_ADDR') in settings.POSTS_METRICS_ALLOWED_IPS
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:54
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_SETUP = [
+    """
+    CREATE OR REPLACE FUNCTION posts_post_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER posts_post_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON posts_post
+    FOR EACH ROW EXECUTE FUNCTION posts_post_search_vector_update()
+    """,
+    """
+    UPDATE posts_post SET search_vector =
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    """,
+    'CREATE INDEX posts_post_search_vector_idx ON posts_post USING gin (search_vector)',
+]
+
+POSTGRESQL_TEARDOWN = [
+    'DROP INDEX IF EXISTS posts_post_search_vector_idx',
+    'DROP TRIGGER IF EXISTS posts_post_search_vector_trigger ON posts_post',
+    'DROP FUNCTION IF EXISTS posts_post_search_vector_update()',
+]
+
+# Для локальной разработки: FTS5-таблица, её синхронизирует posts/search.py
+SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5(title, description, tokenize='unicode61')",
+    "INSERT INTO posts_post_fts(rowid, title, description) SELECT id, title, description FROM posts_post",
+]
+
+SQLITE_TEARDOWN = [
+    'DROP TABLE IF EXISTS posts_post_fts',
+]
+
+
+def setup_search(apps, schema_editor):
+    statements = {'postgresql': POSTGRESQL_SETUP, 'sqlite': SQLITE_SETUP}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def teardown_search(apps, schema_editor):
+    statements = {'postgresql': POSTGRESQL_TEARDOWN, 'sqlite': SQLITE_TEARDOWN}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(setup_search, teardown_search),
+    ]
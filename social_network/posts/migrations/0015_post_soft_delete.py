@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Внешние ключи на posts_post с действием при удалении на стороне БД: (таблица, колонка, действие).
+# Только PostgreSQL; в SQLite это потребовало бы пересоздания таблиц.
+# Если Django пересоздаст ограничение (AlterField), действие нужно вернуть новой миграцией
+POST_FOREIGN_KEYS = [
+    ('posts_like', 'post_id', 'CASCADE'),
+    ('posts_comment', 'post_id', 'CASCADE'),
+    ('posts_timelineentry', 'post_id', 'CASCADE'),
+    ('posts_uploadsession', 'post_id', 'SET NULL'),
+]
+
+
+def set_on_delete(schema_editor, forward):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    for table, column, action in POST_FOREIGN_KEYS:
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if info['foreign_key'] and info['columns'] == [column]:
+                schema_editor.execute(
+                    f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}, '
+                    f'ADD CONSTRAINT {quote(name)} FOREIGN KEY ({quote(column)}) REFERENCES posts_post (id) '
+                    f'ON DELETE {action if forward else "NO ACTION"} DEFERRABLE INITIALLY DEFERRED'
+                )
+
+
+def add_on_delete(apps, schema_editor):
+    set_on_delete(schema_editor, forward=True)
+
+
+def remove_on_delete(apps, schema_editor):
+    set_on_delete(schema_editor, forward=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_location'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Удалён'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='post_deleted_idx'),
+        ),
+        migrations.RunPython(add_on_delete, remove_on_delete),
+    ]
@@ -1,35 +1,198 @@
+import uuid
 
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import ValidationError
 
+from .storage import image_storage
+
 User = get_user_model()
 
 
+class PostManager(models.Manager):
+    # Удалённые посты (deleted_at) скрыты, пока posts/purge.py не удалит их окончательно
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+def post_title(title):
+    # Подпись поста; LikeSerializer.fast_post вызывает её без создания Post
+    return title or 'Без заголовка'
+
+
 class Post(models.Model):
 
     title = models.CharField(max_length=200, verbose_name='Заголовок', null=True, blank=True)
-    image = models.ImageField(upload_to='images/', verbose_name='Изображение')
+    image = models.ImageField(upload_to='images/', storage=image_storage, verbose_name='Изображение')
     description = models.TextField(verbose_name='Описание', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
+    # Денормализованные счётчики: обновляются через F() во вьюхах,
+    # расхождения исправляет команда recount_post_counters
+    likes_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество лайков')
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев')
+    # Метаданные изображения и пути превью заполняет posts/renditions.py
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина изображения')
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Высота изображения')
+    image_blurhash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Blurhash изображения')
+    renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Превью изображения')
+    # Заполняется триггером PostgreSQL (см. posts/search.py), GIN-индекс создаёт миграция
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Необязательная геометка; geohash и название места заполняет posts/geo.py
+    latitude = models.FloatField(null=True, blank=True, verbose_name='Широта',
+                                 validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, verbose_name='Долгота',
+                                  validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, verbose_name='Geohash')
+    place = models.CharField(max_length=255, blank=True, default='', editable=False, verbose_name='Место')
+    # Время мягкого удаления: пост уже не виден, лайки и комментарии удаляются в фоне
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Удалён')
+
+    objects = PostManager()
+    all_objects = models.Manager()
 
     def __str__(self):
-        return self.title or 'Без заголовка'
+        return post_title(self.title)
 
     def clean(self):
         if not self.image:
             raise ValidationError({'image': 'Изображение не должно быть пустым'})
 
     def get_likes_count(self):
-        # Возвращает количество лайков для поста
-        return self.likes.count()
+        # Возвращает количество лайков для поста (хранимый счётчик)
+        return self.likes_count
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-created_at']
+        indexes = [
+            # Ключ курсорной пагинации ленты
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # Посты автора по времени: лента для популярных авторов (fan-out on read)
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_created_id_idx'),
+            # Инкрементальная выгрузка (posts/export.py)
+            models.Index(fields=['updated_at', 'id'], name='post_updated_id_idx'),
+            # Поиск рядом: только посты с геометкой
+            models.Index(fields=['geohash'], name='post_geohash_idx', condition=models.Q(geohash__gt='')),
+            # Незавершённая очистка удалённых постов (purge_deleted_posts)
+            models.Index(fields=['deleted_at'], name='post_deleted_idx', condition=models.Q(deleted_at__isnull=False)),
+        ]
+
+
+class PostActivity(models.Model):
+    # Лайки и комментарии поста за интервал времени, из них считается рейтинг (posts/trending.py)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    bucket = models.DateTimeField(verbose_name='Начало интервала')
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'bucket')
+        indexes = [
+            models.Index(fields=['bucket'], name='activity_bucket_idx'),
+        ]
+
+
+class TrendingPost(models.Model):
+    # Последний пересчитанный рейтинг популярных постов
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', 'post'], name='trending_score_idx'),
+        ]
+
+
+class ImageBlob(models.Model):
+    # Файл в хранилище по содержимому и число постов, которые на него ссылаются
+    name = models.CharField(max_length=255, unique=True, verbose_name='Имя файла')
+    size = models.PositiveBigIntegerField(default=0, verbose_name='Размер')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+
+
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.follower_id} -> {self.followee_id}'
+
+    class Meta:
+        verbose_name = 'Подписка'
+        verbose_name_plural = 'Подписки'
+        unique_together = ('follower', 'followee')
+        indexes = [
+            # Обход подписчиков автора при раздаче поста
+            models.Index(fields=['followee', 'follower'], name='follow_followee_follower_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    # Денормализованное число подписчиков: по нему автор считается популярным
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    followers_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='Подписчиков')
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+
+class TimelineEntry(models.Model):
+    # Материализованная домашняя лента: пост автора, на которого подписан user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Копия Post.created_at, чтобы лента читалась без JOIN
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    # Загрузка изображения по частям, см. posts/uploads.py
+    STATUS_ACTIVE = 'active'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Идёт загрузка'),
+        (STATUS_COMPLETED, 'Завершена'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.PositiveBigIntegerField(verbose_name='Размер файла')
+    checksum = models.CharField(max_length=64, verbose_name='SHA-256')
+    received = models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    post = models.ForeignKey(Post, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.received}/{self.size})'
+
+    class Meta:
+        verbose_name = 'Сессия загрузки'
+        verbose_name_plural = 'Сессии загрузки'
 
 
 # для доп. задания
@@ -44,6 +207,10 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='like_post_created_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='like_created_id_idx'),
+        ]
 
 
 
@@ -62,3 +229,7 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_id_idx'),
+            models.Index(fields=['update_at', 'id'], name='comment_updated_id_idx'),
+        ]
@@ -0,0 +1,162 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def dump_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def load_cursor(encoded):
+    """Список значений из курсора; ValueError/TypeError, если курсор повреждён."""
+    values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+    if not isinstance(values, list):
+        raise ValueError('Неверный курсор')
+    return values
+
+
+class LegacyPageNumberPagination(PageNumberPagination):
+    # Старый режим ?page=N для клиентов, которые ещё не перешли на курсоры
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по ключу (поле сортировки, id).
+
+    Следующая страница выбирается условием WHERE (field, id) < (value, last_id)
+    вместо OFFSET, поэтому глубокие страницы стоят столько же, сколько первая,
+    и не нужен COUNT(*). Если в запросе есть ?page=, работает старая
+    постраничная пагинация.
+    """
+    ordering = '-created_at'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+        self.legacy = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if LegacyPageNumberPagination.page_query_param in request.query_params:
+            self.legacy = LegacyPageNumberPagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Для async-представлений (posts/async_views.py); режима ?page= здесь нет
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page([obj async for obj in queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, last_id = position
+            try:
+                value = self.to_python(queryset, value)
+            except (ValidationError, FieldDoesNotExist):
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value})
+                | Q(**{self.field: value, f'id__{lookup}': last_id})
+            )
+
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+        # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ])
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        # Сортировку, заданную фильтрами (?ordering=, релевантность поиска),
+        # сохраняем; id добавляется всегда
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        field = (ordering or [self.ordering])[0]
+        return field.lstrip('-'), field.startswith('-')
+
+    def to_python(self, queryset, value):
+        name = self.field
+        if name in queryset.query.annotations:
+            # Аннотации (например, search_rank) хранятся в курсоре как есть
+            return value
+        return queryset.model._meta.get_field(name).to_python(value)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, last_id = load_cursor(encoded)
+            return value, int(last_id)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        # Строки .values() быстрого пути (posts/fast.py) — словари
+        if isinstance(obj, dict):
+            value, pk = obj[self.field], obj['id']
+        else:
+            value, pk = getattr(obj, self.field), obj.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, dump_cursor([value, pk]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        return None
+
+
+class PostPagination(KeysetPagination):
+    ordering = '-created_at'
+
+
+class CommentPagination(KeysetPagination):
+    ordering = 'created_at'
+
+
+class LikePagination(KeysetPagination):
+    ordering = '-created_at'
@@ -0,0 +1,126 @@
+"""
+Удаление постов с большим числом лайков и комментариев.
+
+Каскад Django сначала загружает в память все зависимые строки, поэтому
+удаление поста со 100 тыс. лайков занимало бы запрос на секунды. Здесь
+DELETE /api/posts/{id}/ только помечает пост deleted_at (он сразу пропадает
+из Post.objects), а лайки, комментарии и записи лент удаляются в фоне
+пачками по POSTS_PURGE_BATCH_SIZE, каждая в своей транзакции: память и
+время блокировок не зависят от числа строк. Последним удаляется сам пост —
+под блокировкой строки и только если он всё ещё помечен; его сигналы
+освобождают файл изображения и убирают пост из поиска и кеша, после
+коммита удаляются файлы превью.
+
+Очистку, прерванную перезапуском, доделывает команда purge_deleted_posts.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import invalidate_post, invalidate_post_lists
+from .models import Comment, Like, Post, PostActivity, TimelineEntry, TrendingPost, UploadSession
+from .renditions import delete_renditions
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, ссылающиеся на пост (у первых трёх в PostgreSQL ещё и ON DELETE CASCADE, миграция 0015)
+DEPENDENT_MODELS = [Like, Comment, TimelineEntry, PostActivity, TrendingPost]
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.POSTS_PURGE_WORKERS, thread_name_prefix='purge')
+    return _executor
+
+
+def soft_delete_post(post):
+    """Скрывает пост сразу и ставит окончательное удаление в очередь."""
+    soft_delete_posts([post.pk])
+
+
+def soft_delete_posts(post_ids):
+    """То же для нескольких постов одним UPDATE (модерация); возвращает число помеченных."""
+    now = timezone.now()
+    with transaction.atomic():
+        marked = list(
+            Post.all_objects.filter(pk__in=post_ids, deleted_at__isnull=True).values_list('pk', flat=True)
+        )
+        Post.all_objects.filter(pk__in=marked).update(deleted_at=now, updated_at=now)
+        for post_id in marked:
+            invalidate_post(post_id)
+            schedule_purge(post_id)
+        if marked:
+            invalidate_post_lists()
+    return len(marked)
+
+
+def schedule_purge(post_id):
+    def submit():
+        if settings.POSTS_PURGE_WORKERS:
+            _get_executor().submit(_run_purge_job, post_id)
+        else:
+            # 0 воркеров — синхронно (тесты, отладка)
+            purge_post(post_id)
+
+    transaction.on_commit(submit)
+
+
+def _run_purge_job(post_id):
+    close_old_connections()
+    try:
+        purge_post(post_id)
+    except Exception:
+        logger.exception('Не удалось удалить пост %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def purge_post(post_id):
+    """Удаляет помеченный пост и всё, что на него ссылается; возвращает число удалённых строк."""
+    if not Post.all_objects.filter(pk=post_id, deleted_at__isnull=False).exists():
+        return 0
+
+    deleted = 0
+    for model in DEPENDENT_MODELS:
+        deleted += _delete_in_batches(model.objects.filter(post_id=post_id))
+    UploadSession.objects.filter(post_id=post_id).update(post=None)
+
+    with transaction.atomic():
+        # Проверка под блокировкой: пост могли восстановить или уже удалить
+        post = Post.all_objects.select_for_update().filter(pk=post_id, deleted_at__isnull=False).first()
+        if post is None:
+            return deleted
+        # Зависимых строк уже нет, каскаду Django загружать нечего
+        post.delete()
+        transaction.on_commit(lambda: delete_renditions(post_id))
+    return deleted + 1
+
+
+def _delete_in_batches(queryset):
+    batch_size = settings.POSTS_PURGE_BATCH_SIZE
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        # Счётчики и кеш удаляемого поста обновлять незачем
+        deleted += delete_without_signals(queryset.model.objects.filter(pk__in=ids))
+
+
+def delete_without_signals(queryset):
+    """
+    Один DELETE без сборщика Django и сигналов по строке; возвращает число строк.
+
+    Только для моделей, на которые не ссылаются внешние ключи. QuerySet._raw_delete —
+    приватный API, проверен на Django 5.2.6; при обновлении Django сверить его
+    сигнатуру. Если метода нет, удаление идёт обычным delete() с сигналами.
+    """
+    if not hasattr(queryset, '_raw_delete'):
+        return queryset.delete()[0]
+    return queryset._raw_delete(queryset.db)
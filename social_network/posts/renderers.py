@@ -0,0 +1,41 @@
+"""
+JSONRenderer на orjson.
+
+Вывод совпадает с rest_framework.renderers.JSONRenderer при настройках по
+умолчанию (компактный JSON без ensure_ascii): даты, Decimal, ленивые
+строки и прочие типы, которых нет в orjson, форматирует тот же
+encoders.JSONEncoder, U+2028/U+2029 экранируются так же. Отличия:
+числа с плавающей точкой в экспоненциальной записи (1e16 вместо 1e+16,
+1e-05 вместо 0.00001 — значения те же) и NaN/Infinity, которые становятся
+null, а не ошибкой.
+
+Без orjson, с отступами (?indent=, браузерный API) и если orjson не
+справился с данными (например, целое больше 64 бит), работает обычный
+JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как JSONRenderer: эти символы допустимы в JSON, но не в JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
@@ -0,0 +1,183 @@
+"""
+Превью изображений постов: несколько размеров в WebP и JPEG.
+
+Файлы генерируются в фоновом пуле потоков после коммита транзакции,
+а размеры исходника и blurhash сохраняются в модели, чтобы сериализаторам
+не приходилось открывать файлы.
+"""
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_post
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+RENDITION_QUALITY = 80
+RENDITIONS_DIR = 'renditions'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POSTS_RENDITION_WORKERS,
+            thread_name_prefix='renditions',
+        )
+    return _executor
+
+
+def schedule_renditions(post_id):
+    """Ставит генерацию превью в очередь после успешного коммита."""
+    def submit():
+        if settings.POSTS_RENDITION_WORKERS:
+            _get_executor().submit(run_rendition_job, post_id)
+        else:
+            # 0 воркеров — синхронный режим (тесты, отладка)
+            generate_renditions(post_id)
+
+    transaction.on_commit(submit)
+
+
+def run_rendition_job(post_id):
+    close_old_connections()
+    try:
+        generate_renditions(post_id)
+    except Exception:
+        logger.exception('Не удалось построить превью для поста %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def generate_renditions(post_id):
+    post = Post.objects.filter(pk=post_id).only('id', 'image', 'renditions').first()
+    if post is None or not post.image:
+        return None
+
+    with post.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert('RGB')
+
+    _delete_files(post.renditions)
+
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    renditions = {}
+    for name, width in settings.POSTS_IMAGE_RENDITIONS.items():
+        resized = image
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+        renditions[name] = {'width': resized.width, 'height': resized.height}
+        for extension, pil_format in RENDITION_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, quality=RENDITION_QUALITY, optimize=True)
+            path = f'{RENDITIONS_DIR}/{post.pk}/{stem}_{name}.{extension}'
+            renditions[name][extension] = default_storage.save(path, ContentFile(buffer.getvalue()))
+
+    Post.objects.filter(pk=post.pk).update(
+        image_width=image.width,
+        image_height=image.height,
+        image_blurhash=blurhash_encode(image),
+        renditions=renditions,
+    )
+    invalidate_post(post.pk)
+    return renditions
+
+
+def delete_renditions(post_id):
+    """Удаляет все превью поста, включая файлы прерванной генерации."""
+    directory = f'{RENDITIONS_DIR}/{post_id}'
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        default_storage.delete(f'{directory}/{name}')
+
+
+def _delete_files(renditions):
+    for variants in (renditions or {}).values():
+        for extension in RENDITION_FORMATS:
+            if variants.get(extension):
+                default_storage.delete(variants[extension])
+
+
+# --- blurhash (https://blurha.sh), компактная реализация кодировщика ---
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _encode83(value, length):
+    return ''.join(_BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value):
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exp):
+    return math.copysign(abs(value) ** exp, value)
+
+
+def blurhash_encode(image, x_components=4, y_components=3):
+    small = image.copy()
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(_srgb_to_linear(c) for c in pixel) for pixel in small.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            norm = 1 if i == j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pr, pg, pb = pixels[y * width + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = norm / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, math.floor(max(abs(v) for f in ac for v in f) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _encode83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _encode83(0, 1)
+
+    result += _encode83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+    for factor in ac:
+        r, g, b = (
+            max(0, min(18, math.floor(_sign_pow(v / max_value, 0.5) * 9 + 9.5))) for v in factor
+        )
+        result += _encode83(r * 19 * 19 + g * 19 + b, 2)
+    return result
@@ -0,0 +1,108 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Post
+
+# Словарь PostgreSQL для стемминга: LANGUAGE_CODE = 'ru-ru'
+SEARCH_CONFIG = 'russian'
+
+# Таблица FTS5 и триггеры PostgreSQL создаются миграцией 0008_post_search_vector.
+# В PostgreSQL search_vector обновляет триггер, в SQLite индекс ведут сигналы ниже
+# (триггеры SQLite пропали бы при пересоздании таблицы миграциями)
+FTS_TABLE = 'posts_post_fts'
+
+
+def _sqlite_connection(using):
+    connection = connections[using]
+    return connection if connection.vendor == 'sqlite' else None
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, using, **kwargs):
+    connection = _sqlite_connection(using)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (%s, %s, %s)',
+            [instance.pk, instance.title, instance.description],
+        )
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, using, **kwargs):
+    connection = _sqlite_connection(using)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+
+
+def index_posts(posts, using='default'):
+    """Индексирует посты, созданные через bulk_create (сигналы не вызываются)."""
+    connection = _sqlite_connection(using)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (%s, %s, %s)',
+            [(post.pk, post.title, post.description) for post in posts],
+        )
+
+
+def fts5_match_expression(term):
+    # Каждое слово — префиксный запрос в кавычках: так спецсимволы FTS5
+    # не ломают выражение, а префикс частично заменяет стемминг
+    words = re.findall(r'\w+', term)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+class PostSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск постов по ?search=.
+
+    PostgreSQL: tsvector-колонка с GIN-индексом и ранжированием ts_rank,
+    SQLite: индекс FTS5 и bm25. Результаты сортируются по релевантности
+    (поле search_rank), если клиент не передал ?ordering=.
+    Для прочих СУБД остаётся обычный поиск SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+
+        vendor = connections[queryset.db].vendor
+        if vendor == 'postgresql':
+            query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+            return (
+                queryset.filter(search_vector=query)
+                .annotate(search_rank=SearchRank(F('search_vector'), query))
+                .order_by('-search_rank')
+            )
+        if vendor == 'sqlite':
+            match = fts5_match_expression(term)
+            if not match:
+                return queryset.none()
+            table = queryset.model._meta.db_table
+            # Соединение с таблицей FTS5: MATCH выполняется один раз на запрос,
+            # а не коррелированным подзапросом для каждой строки постов.
+            # bm25 тем меньше, чем выше релевантность, поэтому меняем знак
+            return (
+                queryset.extra(
+                    tables=[FTS_TABLE],
+                    where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+                    params=[match],
+                )
+                .annotate(search_rank=RawSQL(f'-bm25({FTS_TABLE})', []))
+                .order_by('-search_rank')
+            )
+        return super().filter_queryset(request, queryset, view)
@@ -1,31 +1,101 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
-from .models import Post, Comment, Like
+from . import geo
+from .metrics import TimedListSerializer, TimedSerializerMixin
+from .models import Post, Comment, Like, UploadSession, post_title
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'post', 'user', 'text', 'created_at']
         read_only_fields = ['user', 'created_at']
         extra_kwargs = {'post': {'required': False }}
 
 
-class PostSerializer(serializers.ModelSerializer):
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
-    comments = CommentSerializer(many=True, read_only=True)
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    likes_count = serializers.IntegerField(read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
+    # В списке отдаём только несколько последних комментариев,
+    # полный список есть в PostDetailSerializer и /api/posts/{id}/comments/
+    comments = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'image', 'description', 'created_at', 'updated_at', 'user', 'likes_count', 'comments_count', 'comments']
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'title', 'image', 'image_width', 'image_height', 'image_blurhash', 'renditions',
+                  'description', 'latitude', 'longitude', 'place', 'created_at', 'updated_at', 'user',
+                  'likes_count', 'comments_count', 'comments']
         read_only_fields = ['created_at', 'updated_at', 'user']
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+    def validate(self, attrs):
+        # Координаты задаются парой (при PATCH вторая может остаться от поста)
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError('Широта и долгота указываются вместе')
+        return attrs
+
+    def get_renditions(self, obj):
+        return self.renditions_representation(obj.renditions)
+
+    def renditions_representation(self, renditions):
+        # {"small": {"width": 320, "height": 240, "webp": url, "jpeg": url}, ...}
+        request = self.context.get('request')
+        result = {}
+        for name, variant in (renditions or {}).items():
+            result[name] = dict(variant)
+            for key, value in variant.items():
+                if isinstance(value, str):
+                    url = default_storage.url(value)
+                    result[name][key] = request.build_absolute_uri(url) if request else url
+        return result
+
+    def get_comments(self, obj):
+        comments = getattr(obj, 'preview_comments', None)
+        if comments is None:
+            # Пост без prefetch (например, ответ на создание/обновление)
+            size = settings.POSTS_COMMENTS_PREVIEW_SIZE
+            comments = reversed(obj.comments.order_by('-created_at', '-id')[:size])
+        return CommentSerializer(comments, many=True, context=self.context).data
+
+    # Быстрый путь списков (posts/fast.py): колонка .values() и преобразование
+    def fast_renditions(self):
+        return 'renditions', self.renditions_representation
+
+    def fast_comments(self):
+        # Превью подставляет представление
+        return None, None
+
+
+class NearbyQuerySerializer(serializers.Serializer):
+    # Параметры /api/posts/nearby/, радиус в метрах
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(required=False, min_value=1)
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=100)
+
+    def validate_radius(self, value):
+        if value > settings.POSTS_NEARBY_MAX_RADIUS:
+            raise serializers.ValidationError(f'Не больше {settings.POSTS_NEARBY_MAX_RADIUS} м')
+        return value
+
+    def validate(self, attrs):
+        radius = attrs.get('radius', settings.POSTS_NEARBY_DEFAULT_RADIUS)
+        try:
+            geo.search_box(attrs['lat'], attrs['lon'], radius)
+        except ValueError as error:
+            raise serializers.ValidationError({'lat': str(error)})
+        return attrs
+
+
+class TrendingQuerySerializer(serializers.Serializer):
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=100)
 
-    def get_comments_count(self, obj):
-        return obj.comments.count()
 
 class PostDetailSerializer(PostSerializer):
     comments = CommentSerializer(many=True, read_only=True)
@@ -38,21 +108,36 @@ class UserSerializer(serializers.ModelSerializer):
         model = get_user_model()
         fields = ['id', 'username', 'first_name', 'last_name']  # добавьте нужные поля
 
-class LikeSerializer(serializers.ModelSerializer):
+class LikeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)  # используем отдельный сериализатор для пользователя
     post = serializers.StringRelatedField(read_only=True)  # если нужно только название поста
 
     class Meta:
         model = Like
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'user', 'post', 'created_at']
         read_only_fields = ['created_at']
 
-    def validate(self, data):
-        # Проверяем уникальность лайка
-        if Like.objects.filter(
-            user=self.context['request'].user,
-            post_id=self.context['view'].kwargs['post_id']
-        ).exists():
-            raise serializers.ValidationError("Вы уже поставили лайк этому посту")
-        return data
+    def fast_post(self):
+        # Как StringRelatedField: str(пост)
+        return 'post__title', post_title
+
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'checksum', 'received', 'status', 'post', 'created_at']
+        read_only_fields = ['received', 'status', 'post', 'created_at']
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.POSTS_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Размер файла должен быть от 1 до {settings.POSTS_UPLOAD_MAX_SIZE} байт'
+            )
+        return value
 
+    def validate_checksum(self, value):
+        return value.lower()
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_ALGORITHM = 'sha256'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с адресацией по содержимому.
+
+    Файл хешируется по мере записи на диск и сохраняется один раз под
+    именем <каталог>/<2 символа хеша>/<хеш>.<расширение>. Повторная
+    загрузка тех же байтов возвращает уже существующее имя, поэтому
+    дубликаты не создаются. Удалять файлы нужно через счётчик ссылок
+    (posts/blobs.py), а не напрямую.
+    """
+    incoming_dir = '.incoming'
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяет хеш, переименование при коллизии не нужно
+        return name
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+
+        incoming = self.path(self.incoming_dir)
+        os.makedirs(incoming, exist_ok=True)
+        # Временный файл в том же разделе, чтобы os.replace был атомарным
+        fd, tmp_path = tempfile.mkstemp(dir=incoming, suffix=extension)
+        hasher = hashlib.new(HASH_ALGORITHM)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+
+            digest = hasher.hexdigest()
+            final_name = posixpath.join(directory, digest[:2], digest + extension)
+            final_path = self.path(final_name)
+            if os.path.exists(final_path):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return final_name
+
+
+image_storage = ContentAddressedStorage()
@@ -1,3 +1,1609 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import Post, Like, Comment, ImageBlob, UploadSession, Follow, TimelineEntry, UserStats, PostActivity
+from .cache import cache_stats, get_cache
+from .db_router import ReplicaRouter, _read_from_replica, check_pin_cache, is_pinned_to_primary, pin_cache
+from .feed import fan_out
+from .like_buffer import LikeBuffer, get_like_buffer
+from .management.commands import bench_api
+from .purge import purge_post
+from . import authentication, export, geo, metrics, trending, uploads
+from .storage import image_storage
+
+User = get_user_model()
+
+
+# Реплика-зеркало не видит данные из транзакции TestCase, поэтому без реплик
+@override_settings(POSTS_DB_REPLICAS=[])
+class BaseAPITestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='pass')
+        self.other = User.objects.create_user(username='reader', password='pass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+    def create_post(self, **kwargs):
+        kwargs.setdefault('user', self.user)
+        kwargs.setdefault('image', 'images/test.jpg')
+        return Post.objects.create(**kwargs)
+
+
+def make_image(name='photo.jpg', size=(800, 600), color=(200, 30, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaTestCase(BaseAPITestCase):
+    # Медиафайлы тестов пишутся во временный каталог
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            POSTS_RENDITION_WORKERS=0,
+            POSTS_FANOUT_WORKERS=0,
+            POSTS_PURGE_WORKERS=0,
+            POSTS_UPLOAD_DIR=os.path.join(media_root, 'uploads'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class PostCountersTests(BaseAPITestCase):
+
+    def test_like_and_unlike_update_counter(self):
+        post = self.create_post()
+
+        self.client.post(f'/api/posts/{post.id}/likes/')
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+
+        self.client.delete(f'/api/posts/{post.id}/likes/')
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+
+    def test_comment_create_and_delete_update_counter(self):
+        post = self.create_post()
+
+        response = self.client.post(f'/api/posts/{post.id}/comments/', {'text': 'Круто'})
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+        self.client.delete(f'/api/posts/{post.id}/comments/{response.data["id"]}/')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_serializer_reads_stored_counters(self):
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(likes_count=7, comments_count=3)
+
+        response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.data['likes_count'], 7)
+        self.assertEqual(response.data['comments_count'], 3)
+
+    def test_recount_command_repairs_drift(self):
+        post = self.create_post()
+        Like.objects.create(post=post, user=self.other)
+        Comment.objects.create(post=post, user=self.other, text='Привет')
+        Post.objects.filter(pk=post.pk).update(likes_count=10, comments_count=0)
+
+        call_command('recount_post_counters', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.comments_count), (1, 1))
+
+
+@override_settings(POSTS_COMMENTS_PREVIEW_SIZE=2)
+class PostListPreviewTests(BaseAPITestCase):
+
+    def fill(self, posts_count):
+        for _ in range(posts_count):
+            post = self.create_post()
+            for i in range(3):
+                Comment.objects.create(post=post, user=self.other, text=f'Комментарий {i}')
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/posts/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_embeds_only_recent_comments(self):
+        self.fill(1)
+        _, response = self.list_queries()
+
+        comments = response.data['results'][0]['comments']
+        self.assertEqual([c['text'] for c in comments], ['Комментарий 1', 'Комментарий 2'])
+
+    def test_detail_returns_all_comments(self):
+        self.fill(1)
+        response = self.client.get(f'/api/posts/{Post.objects.get().id}/')
+        self.assertEqual(len(response.data['comments']), 3)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.fill(2)
+        # Первый запрос кеширует токен (posts/authentication.py)
+        self.list_queries()
+        small, _ = self.list_queries()
+
+        self.fill(8)
+        full, response = self.list_queries()
+
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(small, full)
+
+
+class KeysetPaginationTests(BaseAPITestCase):
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_posts_pages_follow_feed_order(self):
+        posts = [self.create_post() for _ in range(7)]
+        # Одинаковое время создания проверяет разрешение ничьих по id
+        Post.objects.filter(pk__in=[p.pk for p in posts[2:5]]).update(created_at=posts[2].created_at)
+
+        ids = self.walk('/api/posts/?page_size=2')
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_ordering_param_is_respected(self):
+        for _ in range(5):
+            self.create_post()
+        ids = self.walk('/api/posts/?page_size=2&ordering=created_at')
+        self.assertEqual(ids, list(Post.objects.order_by('created_at', 'id').values_list('id', flat=True)))
+
+    def test_comments_and_likes_are_paginated(self):
+        post = self.create_post()
+        for i in range(5):
+            Comment.objects.create(post=post, user=self.other, text=str(i))
+        Like.objects.create(post=post, user=self.other)
+        Like.objects.create(post=post, user=self.user)
+
+        comments = self.walk(f'/api/posts/{post.id}/comments/?page_size=2')
+        self.assertEqual(comments, list(post.comments.order_by('created_at', 'id').values_list('id', flat=True)))
+        self.assertEqual(len(self.walk(f'/api/posts/{post.id}/likes/?page_size=1')), 2)
+
+    def test_page_number_mode_is_opt_in(self):
+        for _ in range(3):
+            self.create_post()
+        response = self.client.get('/api/posts/?page=1&page_size=2')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/posts/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class PostSearchTests(BaseAPITestCase):
+
+    def search(self, term):
+        response = self.client.get('/api/posts/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_search_by_title_and_description(self):
+        sea = self.create_post(title='Море', description='Закат на побережье')
+        self.create_post(title='Горы', description='Снег')
+
+        self.assertEqual(self.search('побережье'), [sea.id])
+        self.assertEqual(self.search('мор'), [sea.id])
+        self.assertEqual(self.search('пустыня'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = self.create_post(title='Старое')
+        post.title = 'Новое'
+        post.save()
+        self.assertEqual(self.search('старое'), [])
+        self.assertEqual(self.search('новое'), [post.id])
+
+        post.delete()
+        self.assertEqual(self.search('новое'), [])
+
+    def test_results_are_ranked_and_paginated(self):
+        weak = self.create_post(title='Кот', description='Собака')
+        strong = self.create_post(title='Кот кот', description='Кот')
+
+        self.assertEqual(self.search('кот'), [strong.id, weak.id])
+        response = self.client.get('/api/posts/', {'search': 'кот', 'page_size': 1})
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in next_page.data['results']], [weak.id])
+
+    def test_special_characters_are_safe(self):
+        self.create_post(title='Море')
+        self.assertEqual(self.search('"*('), [])
+
+
+@override_settings(POSTS_IMAGE_RENDITIONS={'small': 320, 'large': 1280})
+class RenditionTests(MediaTestCase):
+
+    def test_renditions_are_built_after_create(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'title': 'Фото', 'image': make_image()})
+        self.assertEqual(response.status_code, 201)
+
+        post = Post.objects.get(pk=response.data['id'])
+        self.assertEqual((post.image_width, post.image_height), (800, 600))
+        self.assertEqual(len(post.image_blurhash), 28)
+        self.assertEqual((post.renditions['small']['width'], post.renditions['small']['height']), (320, 240))
+        # Исходник меньше 1280 — не увеличиваем
+        self.assertEqual(post.renditions['large']['width'], 800)
+
+        data = self.client.get(f'/api/posts/{post.id}/').data
+        self.assertTrue(data['renditions']['small']['webp'].endswith('.webp'))
+        self.assertTrue(data['renditions']['small']['jpeg'].startswith('http://testserver/images/renditions/'))
+
+    def test_backfill_command(self):
+        response = self.client.post('/api/posts/', {'image': make_image()})
+        self.assertEqual(Post.objects.get(pk=response.data['id']).renditions, {})
+
+        call_command('generate_renditions', workers=0, stdout=StringIO())
+        self.assertEqual(set(Post.objects.get(pk=response.data['id']).renditions), {'small', 'large'})
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+
+    def upload(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'image': make_image(**kwargs)})
+        self.assertEqual(response.status_code, 201)
+        return Post.objects.get(pk=response.data['id'])
+
+    def delete(self, post):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/posts/{post.id}/')
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(name='Перваков.jpg')
+        second = self.upload(name='Перваков_UzItKpf.jpg')
+        other = self.upload(color=(0, 0, 255))
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).ref_count, 2)
+
+        self.delete(first)
+        self.assertTrue(image_storage.exists(second.image.name))
+        self.delete(second)
+        self.assertFalse(image_storage.exists(second.image.name))
+        self.assertFalse(ImageBlob.objects.filter(name=second.image.name).exists())
+
+    def test_dedupe_media_command(self):
+        content = make_image().read()
+        for name in ['images/Перваков.jpg', 'images/Перваков_UzItKpf.jpg']:
+            path = image_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+            self.create_post(image=name)
+
+        call_command('dedupe_media', stdout=StringIO())
+
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(ImageBlob.objects.get(name=names.pop()).ref_count, 2)
+        self.assertFalse(image_storage.exists('images/Перваков.jpg'))
+        self.assertFalse(image_storage.exists('images/Перваков_UzItKpf.jpg'))
+
+
+class UploadSessionTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = make_image().read()
+
+    def start(self, checksum=None):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'photo.jpg',
+            'size': len(self.content),
+            'checksum': checksum or hashlib.sha256(self.content).hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put(self, session_id, start, end):
+        return self.client.put(
+            f'/api/uploads/{session_id}/',
+            self.content[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.content)}',
+        )
+
+    def test_chunked_upload_creates_post(self):
+        session_id = self.start()
+        middle = len(self.content) // 2
+
+        self.assertEqual(self.put(session_id, 0, middle - 1).data['received'], middle)
+        # Повтор уже полученной части — конфликт с текущим смещением
+        response = self.put(session_id, 0, middle - 1)
+        self.assertEqual((response.status_code, response.data['received']), (409, middle))
+        self.put(session_id, middle, len(self.content) - 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/uploads/{session_id}/finalize/', {'title': 'Частями'})
+        self.assertEqual(response.status_code, 201)
+
+        post = Post.objects.get(pk=response.data['id'])
+        with post.image.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.STATUS_COMPLETED)
+        self.assertEqual(os.listdir(os.path.join(image_storage.location, 'uploads')), [])
+
+    def test_offset_is_rechecked_after_body_is_read(self):
+        session_id = self.start()
+        spool_chunk = uploads.spool_chunk
+
+        def concurrent_part(session, stream, length):
+            # Пока тело читалось, другая часть уже принята
+            path = spool_chunk(session, stream, length)
+            UploadSession.objects.filter(pk=session.pk).update(received=10)
+            return path
+
+        with mock.patch.object(uploads, 'spool_chunk', concurrent_part):
+            response = self.put(session_id, 0, 9)
+        self.assertEqual((response.status_code, response.data['received']), (409, 10))
+        # Файл сессии и временные файлы частей
+        self.assertEqual(os.listdir(settings.POSTS_UPLOAD_DIR), [f'{session_id}.part'])
+
+    def test_checksum_mismatch(self):
+        session_id = self.start(checksum='0' * 64)
+        self.put(session_id, 0, len(self.content) - 1)
+
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        session_id = self.start()
+        self.put(session_id, 0, 9)
+        self.assertEqual(self.client.post(f'/api/uploads/{session_id}/finalize/').status_code, 400)
+
+    def test_stale_sessions_are_collected(self):
+        self.start()
+        UploadSession.objects.update(updated_at='2000-01-01T00:00:00Z')
+
+        call_command('cleanup_upload_sessions', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class MediaServingTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = bytes(range(256)) * 40
+        self.path = 'images/file.bin'
+        os.makedirs(image_storage.path('images'))
+        with open(image_storage.path(self.path), 'wb') as file:
+            file.write(self.content)
+
+    def get(self, **headers):
+        return self.client.get('/images/' + self.path, **headers)
+
+    def test_staging_dir_is_not_served(self):
+        os.makedirs(image_storage.path(image_storage.incoming_dir))
+        with open(image_storage.path(f'{image_storage.incoming_dir}/tmp.jpg'), 'wb') as file:
+            file.write(self.content)
+        self.assertEqual(self.client.get(f'/images/{image_storage.incoming_dir}/tmp.jpg').status_code, 404)
+        self.assertEqual(self.client.get(f'/images/images/../{image_storage.incoming_dir}/tmp.jpg').status_code, 404)
+
+    def test_full_response_has_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_conditional_get(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range_requests(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        suffix = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-5:])
+        self.assertEqual(self.get(HTTP_RANGE='bytes=999999-').status_code, 416)
+        # If-Range с устаревшим ETag — отдаём файл целиком
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_content_addressed_files_are_immutable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'image': make_image()})
+        name = Post.objects.get(pk=response.data['id']).image.name
+
+        response = self.client.get('/images/' + name)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(os.path.splitext(os.path.basename(name))[0], response['ETag'])
+
+    @override_settings(POSTS_MEDIA_ACCEL='nginx')
+    def test_accel_redirect(self):
+        response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.path)
+        self.assertEqual(response.content, b'')
+
+    def test_path_traversal(self):
+        self.assertEqual(self.client.get('/images/../manage.py').status_code, 404)
+
+
+class ResponseCacheTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.anonymous = APIClient()
+        self.post = self.create_post(title='Кеш')
+
+    def test_anonymous_reads_are_cached(self):
+        misses = cache_stats()['misses']
+        self.assertEqual(self.anonymous.get('/api/posts/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.anonymous.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['title'], 'Кеш')
+        self.assertEqual(cache_stats()['misses'], misses + 1)
+
+    def test_like_invalidates_list_and_detail(self):
+        self.anonymous.get('/api/posts/')
+        self.anonymous.get(f'/api/posts/{self.post.id}/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{self.post.id}/likes/')
+
+        response = self.anonymous.get('/api/posts/')
+        self.assertEqual((response['X-Cache'], response.data['results'][0]['likes_count']), ('MISS', 1))
+        response = self.anonymous.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual((response['X-Cache'], response.data['likes_count']), ('MISS', 1))
+
+    def test_other_post_change_keeps_detail_cached(self):
+        self.anonymous.get(f'/api/posts/{self.post.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_post()
+        self.assertEqual(self.anonymous.get(f'/api/posts/{self.post.id}/')['X-Cache'], 'HIT')
+
+    def test_conditional_requests(self):
+        response = self.anonymous.get(f'/api/posts/{self.post.id}/')
+        self.assertIn('Last-Modified', response)
+
+        revalidated = self.anonymous.get(f'/api/posts/{self.post.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_like_changes_last_modified(self):
+        # Пост и версия его кеша изменены давно
+        old = timezone.now() - timedelta(minutes=5)
+        Post.objects.filter(pk=self.post.pk).update(updated_at=old)
+        get_cache().set(f'posts:version:{self.post.pk}:at', old.timestamp(), timeout=None)
+        response = self.anonymous.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response['Last-Modified'], http_date(old.timestamp()))
+
+        # Счётчик меняется без updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{self.post.id}/likes/')
+        response = self.anonymous.get(f'/api/posts/{self.post.id}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual((response.status_code, response.data['likes_count']), (200, 1))
+
+    def test_authenticated_reads_bypass_cache(self):
+        self.assertNotIn('X-Cache', self.client.get('/api/posts/'))
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.anonymous.get('/api/posts/cache-stats/').status_code, 401)
+        admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(set(self.client.get('/api/posts/cache-stats/').data), {'hits', 'misses'})
+
+
+class IdempotentLikeTests(BaseAPITestCase):
+
+    def test_repeated_like_and_unlike(self):
+        post = self.create_post()
+        url = f'/api/posts/{post.id}/likes/'
+
+        first = self.client.post(url)
+        self.assertEqual((first.status_code, first.data['liked'], first.data['likes_count']), (201, True, 1))
+        again = self.client.post(url)
+        self.assertEqual((again.status_code, again.data['likes_count']), (200, 1))
+        self.assertEqual(Like.objects.count(), 1)
+
+        removed = self.client.delete(url)
+        self.assertEqual((removed.status_code, removed.data['liked'], removed.data['likes_count']), (200, False, 0))
+        self.assertEqual(self.client.delete(url).data['likes_count'], 0)
+
+    def test_missing_post(self):
+        self.assertEqual(self.client.post('/api/posts/999/likes/').status_code, 404)
+        self.assertEqual(self.client.delete('/api/posts/999/likes/').status_code, 404)
+
+    def test_batch_liked_by_me(self):
+        liked = self.create_post()
+        other = self.create_post()
+        Like.objects.create(post=liked, user=self.user)
+
+        with self.assertNumQueries(2):  # токен + лайки
+            response = self.client.get('/api/posts/liked/', {'ids': f'{liked.id},{other.id}'})
+        self.assertEqual(response.data, {str(liked.id): True, str(other.id): False})
+        self.assertEqual(APIClient().get('/api/posts/liked/', {'ids': str(liked.id)}).data, {str(liked.id): False})
+        self.assertEqual(self.client.get('/api/posts/liked/', {'ids': 'x'}).status_code, 400)
+
+        Post.all_objects.filter(pk=liked.pk).update(deleted_at=timezone.now())
+        response = self.client.get('/api/posts/liked/', {'ids': str(liked.id)})
+        self.assertEqual(response.data, {str(liked.id): False})
+
+
+class LikeWriteBehindTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir, ignore_errors=True)
+        settings_override = override_settings(
+            POSTS_LIKE_WRITE_BEHIND=True,
+            POSTS_LIKE_BUFFER_DIR=journal_dir,
+            POSTS_LIKE_BUFFER_FLUSH_INTERVAL=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.journal_dir = journal_dir
+        self.post = self.create_post()
+
+    def test_operations_are_deduplicated_and_flushed(self):
+        buffer = LikeBuffer(self.journal_dir, flush_interval=0)
+        buffer.add(self.user.pk, self.post.pk, True)
+        buffer.add(self.other.pk, self.post.pk, True)
+        buffer.add(self.other.pk, self.post.pk, False)
+        buffer.add(self.user.pk, self.post.pk, True)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(list(self.post.likes.values_list('user_id', flat=True)), [self.user.pk])
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_journal_is_replayed_after_crash(self):
+        # Журнал завершившегося процесса, последняя строка недописана
+        with open(os.path.join(self.journal_dir, 'likes.999999999.journal'), 'w') as journal:
+            journal.write(f'L {self.user.pk} {self.post.pk}\nL {self.other.pk} {self.post.pk}\nU 1')
+
+        self.assertEqual(LikeBuffer(self.journal_dir, flush_interval=0).replay(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_replay_uses_locks_not_pids(self):
+        # pid 1 жив, но журнал никто не держит: процесс, писавший его, завершился
+        with open(os.path.join(self.journal_dir, 'likes.1.journal'), 'w') as journal:
+            journal.write(f'L {self.user.pk} {self.post.pk}\n')
+        live = LikeBuffer(self.journal_dir, flush_interval=0)
+        live.add(self.other.pk, self.post.pk, True)
+
+        # Журнал работающего буфера заблокирован и не применяется повторно
+        self.assertEqual(LikeBuffer(self.journal_dir, flush_interval=0).replay(), 1)
+        self.assertEqual(list(Like.objects.values_list('user_id', flat=True)), [self.user.pk])
+        self.assertEqual(os.listdir(self.journal_dir), [f'likes.{os.getpid()}.journal'])
+
+        self.assertEqual(live.flush(), 1)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_read_your_writes(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/likes/')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Like.objects.exists())
+
+        liked = self.client.get('/api/posts/liked/', {'ids': str(self.post.id)})
+        self.assertEqual(liked.data, {str(self.post.id): True})
+
+        get_like_buffer().flush()
+        self.assertTrue(Like.objects.filter(user=self.user, post=self.post).exists())
+
+    def test_like_is_visible_during_flush(self):
+        test = self
+        seen = []
+
+        class ObservedBuffer(LikeBuffer):
+            def apply(self, operations):
+                # Пачка уже вынута из pending, но ещё не закоммичена
+                seen.append(self.pending_state(test.user.pk, [test.post.pk]))
+                super().apply(operations)
+
+        buffer = ObservedBuffer(self.journal_dir, flush_interval=0)
+        buffer.add(self.user.pk, self.post.pk, True)
+        buffer.flush()
+        self.assertEqual(seen, [{self.post.pk: True}])
+        self.assertEqual(buffer.pending_state(self.user.pk, [self.post.pk]), {})
+        self.assertTrue(Like.objects.filter(user=self.user, post=self.post).exists())
+
+    def test_failed_flush_keeps_operations(self):
+        class FailingBuffer(LikeBuffer):
+            def apply(self, operations):
+                raise DatabaseError('недоступна')
+
+        buffer = FailingBuffer(self.journal_dir, flush_interval=0)
+        buffer.add(self.user.pk, self.post.pk, True)
+        with self.assertRaises(DatabaseError), self.assertLogs('posts.like_buffer', 'ERROR'):
+            buffer.flush()
+        self.assertEqual(buffer.pending, {(self.user.pk, self.post.pk): True})
+        self.assertEqual(buffer.in_flight, {})
+
+
+@override_settings(POSTS_FANOUT_WORKERS=0, POSTS_FANOUT_BATCH_SIZE=2)
+class FeedTests(MediaTestCase):
+
+    def follow(self, follower, followee):
+        client = APIClient()
+        client.force_authenticate(follower)
+        return client.post(f'/api/users/{followee.pk}/follow/')
+
+    def test_post_is_fanned_out_to_followers_in_batches(self):
+        readers = [User.objects.create_user(username=f'r{i}', password='pass') for i in range(5)]
+        for reader in readers:
+            self.follow(reader, self.user)
+        self.assertEqual(UserStats.objects.get(pk=self.user.pk).followers_count, 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'title': 'Новый', 'image': make_image()})
+        self.assertEqual(response.status_code, 201)
+
+        post_id = response.data['id']
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post_id=post_id).values_list('user_id', flat=True)),
+            {self.user.pk} | {reader.pk for reader in readers},
+        )
+
+    def test_follow_backfills_and_unfollow_cleans_timeline(self):
+        posts = [self.create_post(title=str(i)) for i in range(3)]
+        response = self.follow(self.other, self.user)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.follow(self.other, self.user).status_code, 200)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.other).count(), len(posts))
+
+        client = APIClient()
+        client.force_authenticate(self.other)
+        client.delete(f'/api/users/{self.user.pk}/follow/')
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(TimelineEntry.objects.filter(user=self.other).exists())
+        self.assertEqual(UserStats.objects.get(pk=self.user.pk).followers_count, 0)
+
+    def test_feed_pages_merge_popular_authors(self):
+        celebrity = User.objects.create_user(username='star', password='pass')
+        self.follow(self.other, self.user)
+        self.follow(self.other, celebrity)
+        UserStats.objects.filter(pk=celebrity.pk).update(followers_count=10 ** 6)
+
+        expected = []
+        for i in range(5):
+            post = self.create_post(user=celebrity if i % 2 else self.user, title=str(i))
+            fan_out(post.pk)
+            expected.append(post.pk)
+        # Посты популярного автора в ленты подписчиков не раздаются
+        self.assertFalse(TimelineEntry.objects.filter(author=celebrity, user=self.other).exists())
+
+        client = APIClient()
+        client.force_authenticate(self.other)
+        seen, url = [], '/api/feed/?page_size=2'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected[::-1])
+
+    def test_feed_requires_auth(self):
+        self.assertEqual(APIClient().get('/api/feed/').status_code, 401)
+
+
+# Соединения других потоков не видят данные незавершённой транзакции TestCase,
+# параллельные запросы проверяет AsyncParallelQueryTests
+@override_settings(POSTS_ASYNC_PARALLEL_QUERIES=False)
+class AsyncReadTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.posts = [self.create_post(title=f'Пост {i}') for i in range(3)]
+        for i in range(4):
+            Comment.objects.create(post=self.posts[0], user=self.other, text=f'Комментарий {i}')
+        Like.objects.create(post=self.posts[0], user=self.user)
+
+    def test_post_list_matches_sync_endpoint(self):
+        expected = APIClient().get('/api/posts/', {'page_size': 2}).json()
+        response = self.client.get('/api/async/posts/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], expected['results'])
+        self.assertEqual(response.json()['next'], expected['next'].replace('/api/posts/', '/api/async/posts/'))
+
+        page = self.client.get(response.json()['next']).json()
+        self.assertEqual([item['id'] for item in page['results']], [self.posts[0].id])
+
+    def test_post_detail(self):
+        post = self.posts[0]
+        response = self.client.get(f'/api/async/posts/{post.id}/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['title'], post.title)
+        self.assertEqual([item['text'] for item in data['comments']], [f'Комментарий {i}' for i in range(4)])
+        self.assertTrue(data['liked'])
+        self.assertFalse(APIClient().get(f'/api/async/posts/{post.id}/').json()['liked'])
+        self.assertEqual(self.client.get('/api/async/posts/999999/').status_code, 404)
+
+    def test_comments_and_likes_lists(self):
+        post = self.posts[0]
+        comments = self.client.get(f'/api/async/posts/{post.id}/comments/', {'page_size': 3}).json()
+        self.assertEqual(len(comments['results']), 3)
+        self.assertIsNotNone(comments['next'])
+
+        likes = self.client.get(f'/api/async/posts/{post.id}/likes/').json()
+        self.assertEqual(likes['results'][0]['user']['username'], self.user.username)
+        self.assertEqual(self.client.get(f'/api/async/posts/{post.id}/likes/', {'cursor': '!!'}).status_code, 404)
+
+    def test_writes_are_rejected(self):
+        self.assertEqual(self.client.post('/api/async/posts/').status_code, 405)
+
+    def test_token_keyword_case_insensitive(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'token {Token.objects.get(user=self.user).key}')
+        self.assertTrue(client.get(f'/api/async/posts/{self.posts[0].id}/').json()['liked'])
+
+
+@override_settings(POSTS_ASYNC_PARALLEL_QUERIES=True)
+class AsyncParallelQueryTests(TransactionTestCase):
+
+    def test_post_detail(self):
+        user = User.objects.create_user(username='author', password='pass')
+        post = Post.objects.create(user=user, title='Пост', image='images/test.jpg')
+        Comment.objects.create(post=post, user=user, text='Комментарий')
+        Like.objects.create(post=post, user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+        data = client.get(f'/api/async/posts/{post.id}/').json()
+        self.assertEqual(data['title'], 'Пост')
+        self.assertEqual([item['text'] for item in data['comments']], ['Комментарий'])
+        self.assertTrue(data['liked'])
+
+
+class ReplicaRoutingTests(BaseAPITestCase):
+
+    @override_settings(POSTS_DB_REPLICAS=['replica'])
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        token = _read_from_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post), 'default')
+        finally:
+            _read_from_replica.reset(token)
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+
+    @override_settings(POSTS_DB_REPLICAS=['replica'])
+    def test_write_pins_user_to_primary(self):
+        pin_cache().clear()
+        post = self.create_post()
+        self.assertFalse(is_pinned_to_primary(self.user))
+        self.client.post(f'/api/posts/{post.id}/comments/', {'text': 'Круто'})
+        self.assertTrue(is_pinned_to_primary(self.user))
+        self.assertFalse(is_pinned_to_primary(self.other))
+
+    @override_settings(POSTS_DB_REPLICAS=['replica'])
+    def test_follow_pins_user_to_primary(self):
+        pin_cache().clear()
+        self.client.post(f'/api/users/{self.other.pk}/follow/')
+        self.assertTrue(is_pinned_to_primary(self.user))
+
+    def test_process_local_pin_cache_rejected(self):
+        with override_settings(POSTS_DB_REPLICAS=['replica'], POSTS_REPLICA_PIN_CACHE_ALIAS='default'):
+            with self.assertRaises(ImproperlyConfigured):
+                check_pin_cache()
+        with override_settings(POSTS_DB_REPLICAS=[], POSTS_REPLICA_PIN_CACHE_ALIAS='default'):
+            check_pin_cache()
+
+
+@skipUnless(settings.POSTS_DB_REPLICAS, 'Реплики не настроены')
+class ReplicaReadTests(TransactionTestCase):
+    # Реплика — зеркало основной БД; видно, через какое соединение шли запросы
+    databases = '__all__'
+    replica = settings.POSTS_DB_REPLICAS[0] if settings.POSTS_DB_REPLICAS else None
+
+    def setUp(self):
+        get_cache().clear()
+        pin_cache().clear()
+        self.user = User.objects.create_user(username='author', password='pass')
+        self.post = Post.objects.create(user=self.user, image='images/test.jpg')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def replica_queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connections[self.replica]) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+
+    @override_settings(POSTS_DB_REPLICAS=[])
+    def test_reads_go_to_primary_without_replicas(self):
+        self.assertEqual(self.replica_queries('get', '/api/posts/'), 0)
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertGreater(self.replica_queries('get', '/api/posts/'), 0)
+        self.assertGreater(self.replica_queries('get', f'/api/posts/{self.post.id}/comments/'), 0)
+
+        self.assertEqual(self.replica_queries('post', f'/api/posts/{self.post.id}/likes/'), 0)
+        # Сразу после записи — только основная БД
+        self.assertEqual(self.replica_queries('get', f'/api/posts/{self.post.id}/likes/'), 0)
+
+    def test_cache_miss_after_change_is_filled_from_primary(self):
+        self.client.force_authenticate(None)
+        url = f'/api/posts/{self.post.id}/'
+        self.client.get(url)
+        Like.objects.create(post=self.post, user=self.user)  # увеличивает версию поста
+
+        # Реплика могла отстать: кеш под новой версией заполняется из основной БД
+        self.assertEqual(self.replica_queries('get', url), 0)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        # Версия давно не менялась — промахи снова читают реплику
+        get_cache().set(f'posts:version:{self.post.id}:at', time.time() - 60, timeout=None)
+        self.assertGreater(self.replica_queries('get', url + '?fresh=1'), 0)
+
+
+class BenchmarkCommandsTests(MediaTestCase):
+
+    def test_generate_dataset(self):
+        call_command('generate_dataset', users=20, posts=50, likes=300, comments=100, images=3,
+                     batch_size=40, stdout=StringIO())
+
+        self.assertEqual(Post.objects.count(), 50)
+        posts = Post.objects.all()
+        for post in posts:
+            self.assertEqual(post.likes_count, post.likes.count())
+            self.assertEqual(post.comments_count, post.comments.count())
+        # Популярность неравномерная: самый популярный пост заметно выше медианы
+        likes = sorted(post.likes_count for post in posts)
+        self.assertGreater(likes[-1], 3 * max(likes[len(likes) // 2], 1))
+        self.assertEqual(sum(ImageBlob.objects.values_list('ref_count', flat=True)), 50)
+
+        word = posts[0].title.split()[0]
+        response = self.client.get('/api/posts/', {'search': word})
+        self.assertIn(posts[0].id, [item['id'] for item in response.data['results']])
+
+    def test_bench_api_budgets(self):
+        call_command('generate_dataset', users=10, posts=20, likes=50, comments=30, images=1, stdout=StringIO())
+        # Время ответа в тестах зависит от машины — проверяем только число SQL-запросов
+        with open(bench_api.DEFAULT_BUDGETS) as file:
+            query_budgets = {name: {'queries': budget['queries']}
+                             for name, budget in json.load(file).items() if 'queries' in budget}
+        budgets = os.path.join(settings.MEDIA_ROOT, 'budgets.json')
+        with open(budgets, 'w') as file:
+            json.dump(query_budgets, file)
+        output = StringIO()
+        call_command('bench_api', requests=3, budgets=budgets, stdout=output)
+        self.assertIn('Бюджеты соблюдены', output.getvalue())
+
+        with open(budgets, 'w') as file:
+            file.write('{"comments": {"queries": 0}}')
+        with self.assertRaisesMessage(CommandError, 'comments: SQL-запросов'):
+            call_command('bench_api', requests=3, endpoint=['comments'], budgets=budgets, stdout=StringIO())
+
+
+class MetricsTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_request_metrics_exported(self):
+        self.create_post(title='Пост')
+        self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+        self.client.credentials()
+        with override_settings(POSTS_METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('posts_http_requests_total{view="post-list",method="GET",status="200"} 1', body)
+        self.assertIn('posts_http_request_db_queries_count{view="post-list",method="GET"} 1', body)
+        self.assertIn('posts_http_serialize_duration_seconds_total{view="post-list",method="GET"}', body)
+        # Сам /metrics не учитывается
+        self.assertNotIn('view="metrics"', body)
+
+    @override_settings(POSTS_METRICS_TOKEN='secret')
+    def test_metrics_forbidden_for_others(self):
+        self.client.credentials()
+        # За прокси на том же хосте REMOTE_ADDR всегда 127.0.0.1
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(POSTS_METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(POSTS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_logged_with_queries(self):
+        self.create_post(title='Пост')
+        with self.assertLogs('posts.metrics', 'WARNING') as logs:
+            self.client.get('/api/posts/')
+        self.assertIn('/api/posts/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+@override_settings(POSTS_EXPORT_BATCH_SIZE=2, POSTS_EXPORT_CHUNK_SIZE=1, POSTS_EXPORT_LAG=0)
+class ExportTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.posts = [self.create_post(title=f'Пост {i}') for i in range(3)]
+        Comment.objects.create(post=self.posts[0], user=self.other, text='Комментарий')
+        Like.objects.create(post=self.posts[1], user=self.other)
+
+    def export(self, **params):
+        response = self.client.get('/api/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_stream_with_comments_and_likes(self):
+        records = self.export(include='comments,likes')
+        types = [record['type'] for record in records]
+        self.assertEqual(types, ['post', 'post', 'checkpoint', 'post', 'checkpoint',
+                                 'comment', 'checkpoint', 'like', 'checkpoint', 'end'])
+        self.assertEqual([record['id'] for record in records if record['type'] == 'post'],
+                         [post.id for post in self.posts])
+        self.assertEqual(records[5]['text'], 'Комментарий')
+        self.assertNotIn('likes_count', records[0])
+
+    def test_resume_is_incremental(self):
+        cursor = self.export(include='likes')[-1]['cursor']
+        self.assertEqual([record['type'] for record in self.export(cursor=cursor, include='likes')], ['end'])
+
+        self.posts[0].title = 'Изменён'
+        self.posts[0].save()
+        Like.objects.create(post=self.posts[2], user=self.other)
+        records = self.export(cursor=cursor, include='likes')
+        changed = [(record['type'], record['id']) for record in records if record['type'] in ('post', 'like')]
+        self.assertEqual(changed, [('post', self.posts[0].id), ('like', Like.objects.latest('id').id)])
+
+    def test_resume_repeats_lag_window(self):
+        cursor = self.export(include='likes')[-1]['cursor']
+        # Транзакция лайка закоммичена после выгрузки, но время у неё раньше курсора
+        late = Like.objects.create(post=self.posts[2], user=self.user)
+        Like.objects.filter(pk=late.pk).update(created_at=timezone.now() - timedelta(seconds=30))
+        self.assertNotIn(late.id, [record['id'] for record in self.export(cursor=cursor, include='likes')
+                                   if record['type'] == 'like'])
+
+        with override_settings(POSTS_EXPORT_LAG=60):
+            records = self.export(cursor=cursor, include='likes')
+            likes = [record['id'] for record in records if record['type'] == 'like']
+            self.assertIn(late.id, likes)
+            # Повторы окна не сдвигают курсор назад
+            self.assertEqual(export.decode_cursor(records[-1]['cursor'])['likes'],
+                             export.decode_cursor(cursor)['likes'])
+
+    def test_since_and_errors(self):
+        Post.objects.filter(pk=self.posts[0].pk).update(updated_at=timezone.now() - timedelta(days=2))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertEqual(len([record for record in self.export(since=since) if record['type'] == 'post']), 2)
+
+        self.assertEqual(self.client.get('/api/export/', {'cursor': 'bad'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/export/', {'include': 'users'}).status_code, 400)
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/export/').status_code, 401)
+
+    def test_deleted_post_dependents_are_not_exported(self):
+        Post.all_objects.filter(pk__in=[self.posts[0].pk, self.posts[1].pk]).update(deleted_at=timezone.now())
+        records = self.export(include='comments,likes')
+        self.assertEqual([record['type'] for record in records if record['type'] != 'checkpoint'], ['post', 'end'])
+
+    def test_command_keeps_state(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output, state = os.path.join(directory, 'export.ndjson'), os.path.join(directory, 'state')
+
+        call_command('export_posts', output=output, state=state, include=['comments'], stderr=StringIO())
+        call_command('export_posts', output=output, state=state, include=['comments'], stderr=StringIO())
+        with open(output) as file:
+            records = [json.loads(line) for line in file]
+        # Второй запуск ничего не выгрузил: дописана только строка end
+        self.assertEqual(len([record for record in records if record['type'] in ('post', 'comment')]), 4)
+        self.assertEqual(records[-1]['type'], 'end')
+
+
+class BatchWriteTests(MediaTestCase):
+
+    def test_comments_batch(self):
+        post, other_post = self.create_post(), self.create_post()
+        items = [
+            {'post': post.id, 'text': 'Первый'},
+            {'post': other_post.id, 'text': 'Второй'},
+            {'post': post.id, 'text': 'Третий'},
+            {'post': 999999, 'text': 'Нет поста'},
+            {'post': post.id},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/comments/batch/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 201, 201, 400, 400])
+        self.assertIn('post', response.data['results'][3]['errors'])
+        self.assertIn('text', response.data['results'][4]['errors'])
+        # Число запросов не зависит от размера пакета
+        self.assertLessEqual(len(queries), 8)
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(Comment.objects.get(pk=response.data['results'][2]['id']).text, 'Третий')
+
+    @override_settings(POSTS_BATCH_MAX_COMMENTS=2)
+    def test_batch_limits(self):
+        post = self.create_post()
+        response = self.client.post('/api/comments/batch/', [{'post': post.id, 'text': 'x'}] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/comments/batch/', {}, format='json').status_code, 400)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/comments/batch/', [], format='json').status_code, 401)
+
+    def test_posts_batch_with_uploaded_images(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            uploaded = self.client.post('/api/posts/', {'image': make_image()})
+        name = Post.objects.get(pk=uploaded.data['id']).image.name
+
+        items = [
+            {'title': 'Импорт', 'image': name},
+            {'title': 'По URL', 'image': uploaded.data['image']},
+            {'title': 'Без файла', 'image': 'images/missing.jpg'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/batch/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 201, 400])
+
+        self.assertEqual(ImageBlob.objects.get(name=name).ref_count, 3)
+        post = Post.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual((post.user, post.image.name), (self.user, name))
+        self.assertTrue(post.renditions)
+        search = self.client.get('/api/posts/', {'search': 'Импорт'})
+        self.assertEqual([item['id'] for item in search.data['results']], [post.id])
+
+    def test_posts_batch_with_new_files(self):
+        items = [
+            {'title': 'Красный', 'image': 'red'},
+            {'title': 'Тот же файл', 'image': 'red_copy'},
+            {'title': 'Синий', 'image': 'blue', 'latitude': 55.76, 'longitude': 37.62},
+            {'title': 'Не картинка', 'image': 'text'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/batch/', {
+                'items': json.dumps(items),
+                'red': make_image('red.jpg'),
+                'red_copy': make_image('copy.jpg'),
+                'blue': make_image('blue.jpg', color=(0, 0, 200)),
+                'text': SimpleUploadedFile('notes.jpg', b'not an image', content_type='image/jpeg'),
+            })
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [201, 201, 201, 400])
+
+        red, copy, blue = (Post.objects.get(pk=result['id']) for result in results[:3])
+        # Одинаковое содержимое — один файл в хранилище с двумя ссылками
+        self.assertEqual(red.image.name, copy.image.name)
+        self.assertTrue(red.image.name.startswith('images/'))
+        self.assertEqual(ImageBlob.objects.get(name=red.image.name).ref_count, 2)
+        self.assertEqual(ImageBlob.objects.get(name=blue.image.name).ref_count, 1)
+        self.assertEqual(blue.place, 'Москва, Россия')
+        self.assertTrue(blue.renditions)
+
+        response = self.client.post('/api/posts/batch/', {'items': 'не JSON'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_posts_batch_removes_new_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            uploaded = self.client.post('/api/posts/', {'image': make_image()})
+        existing = Post.objects.get(pk=uploaded.data['id']).image.name
+
+        items = [{'image': 'same'}, {'image': 'blue'}]
+        with mock.patch('posts.batch.index_posts', side_effect=DatabaseError('недоступна')), \
+                self.assertRaises(DatabaseError):
+            self.client.post('/api/posts/batch/', {
+                'items': json.dumps(items),
+                'same': make_image('same.jpg'),
+                'blue': make_image('blue.jpg', color=(0, 0, 200)),
+            })
+        # Файл, на который уже ссылается пост, остаётся
+        files = [name for _, _, names in os.walk(image_storage.path('images')) for name in names]
+        self.assertEqual(files, [os.path.basename(existing)])
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_posts_batch_image_name_fits_model_field(self):
+        url = f'http://testserver{settings.MEDIA_URL}images/{"x" * 100}.jpg'
+        response = self.client.post('/api/posts/batch/', [{'image': url}], format='json')
+        self.assertEqual(response.data['results'][0]['status'], 400)
+        self.assertIn('image', response.data['results'][0]['errors'])
+
+
+class GeoTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+
+    def test_geohash(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        cells = geo.covering_cells(55.7558, 37.6173, 5000)
+        self.assertLessEqual(len(cells), geo.MAX_COVER_CELLS)
+        # Клетки мельче круга: не берём район в десятки километров
+        self.assertLess(geo.cell_span(len(cells[0]))[0] * geo.METERS_PER_DEGREE, 5000)
+        for lat, lon in [(55.7558, 37.6173), (55.80, 37.6173), (55.7558, 37.69), (55.73, 37.58)]:
+            self.assertIn(geo.geohash_encode(lat, lon, len(cells[0])), cells)
+        # Через антимеридиан
+        self.assertIn(geo.geohash_encode(0, -179.99, len(geo.covering_cells(0, 179.99, 5000)[0])),
+                      geo.covering_cells(0, 179.99, 5000))
+        with self.assertRaises(ValueError):
+            geo.covering_cells(89.9, 0, 5000)
+
+    def test_nearby_matches_full_scan(self):
+        # Несколько окон кандидатов и точки у края круга и за антимеридианом
+        points = [(55.7558 + 0.001 * (i % 17) - 0.008, 37.6173 + 0.0017 * (i // 17) - 0.02) for i in range(250)]
+        points += [(0.01 * i, 179.99 - 0.005 * i) for i in range(-3, 4)] + [(0.01, -179.995)]
+        posts = Post.objects.bulk_create(
+            Post(user=self.user, image='images/test.jpg', latitude=lat, longitude=lon,
+                 geohash=geo.geohash_encode(lat, lon))
+            for lat, lon in points
+        )
+        for center, radius in [((55.7558, 37.6173), 1500), ((0, 179.995), 5000)]:
+            expected = sorted(
+                (geo.geodesic_distance(*center, post.latitude, post.longitude), post.pk) for post in posts
+            )
+            expected = [item for item in expected if item[0] <= radius]
+            for limit in (5, 150):
+                self.assertEqual(geo.nearby_post_ids(*center, radius, limit), expected[:limit])
+
+    def test_nearby_box_near_equator(self):
+        # Градус широты у экватора короче 111320 м: точка у края круга не должна выпасть из рамки
+        center, radius = (0.06229, 179.87101), 5000
+        rng = random.Random(19)
+        points = [(0.10745, 179.87205)] + [
+            (center[0] + rng.uniform(-0.05, 0.05), center[1] + rng.uniform(-0.05, 0.05)) for _ in range(300)
+        ]
+        posts = Post.objects.bulk_create(
+            Post(user=self.user, image='images/test.jpg', latitude=lat, longitude=lon,
+                 geohash=geo.geohash_encode(lat, lon))
+            for lat, lon in points
+        )
+        found = {pk for _, pk in geo.nearby_post_ids(*center, radius, len(posts))}
+        self.assertIn(posts[0].pk, found)
+        # Всё, что заведомо внутри круга по сфере, найдено
+        inside = {post.pk for post in posts
+                  if geo.sphere_distance(*center, post.latitude, post.longitude) <= radius * (1 - geo.SPHERE_ERROR)}
+        self.assertLessEqual(inside, found)
+
+    @skipUnless(connection.vendor == 'sqlite', 'План запроса SQLite')
+    def test_candidates_use_index(self):
+        plan = geo.nearby_candidates(55.7558, 37.6173, 5000).explain()
+        self.assertIn('post_geohash_idx', plan)
+
+    def test_location_and_place(self):
+        response = self.client.patch(
+            f'/api/posts/{self.create_post().id}/', {'latitude': 55.76, 'longitude': 37.62}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['place'], 'Москва, Россия')
+        post = Post.objects.get(pk=response.data['id'])
+        self.assertEqual(post.geohash, geo.geohash_encode(55.76, 37.62))
+
+        response = self.client.patch(f'/api/posts/{post.id}/', {'latitude': 10}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        post.refresh_from_db()
+        self.assertEqual(post.place, '')
+        post2 = self.create_post()
+        response = self.client.patch(f'/api/posts/{post2.id}/', {'latitude': 10}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_reverse_geocode_cached(self):
+        self.assertEqual(geo.reverse_geocode(59.94, 30.31), 'Санкт-Петербург, Россия')
+        key = f'posts:geocode:{geo.geohash_encode(59.9401, 30.3101, geo.GEOCODE_CACHE_PRECISION)}'
+        self.assertEqual(get_cache().get(key), 'Санкт-Петербург, Россия')
+        self.assertEqual(geo.reverse_geocode(0, -150), '')
+
+    def test_nearby(self):
+        near = self.create_post(title='Рядом', latitude=55.7560, longitude=37.6180)
+        nearer = self.create_post(title='Совсем рядом', latitude=55.7558, longitude=37.6175)
+        self.create_post(title='В другом районе', latitude=55.80, longitude=37.70)
+        self.create_post(title='Без геометки')
+
+        response = self.client.get('/api/posts/nearby/', {'lat': 55.7558, 'lon': 37.6173, 'radius': 500})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [nearer.id, near.id])
+        self.assertLess(response.data['results'][0]['distance'], 20)
+
+        response = self.client.get('/api/posts/nearby/', {'lat': 55.7558, 'lon': 37.6173, 'radius': 20000})
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get('/api/posts/nearby/', {'lat': 55.7558, 'lon': 37.6173, 'page_size': 1})
+        self.assertEqual([item['id'] for item in response.data['results']], [nearer.id])
+        self.assertEqual(self.client.get('/api/posts/nearby/', {'lat': 91, 'lon': 0}).status_code, 400)
+        # У полюса поиск не выполняется
+        self.assertEqual(self.client.get('/api/posts/nearby/', {'lat': 89.9, 'lon': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/nearby/', {'lat': 0, 'lon': 0, 'radius': 10 ** 6}).status_code,
+                         400)
+
+
+class CachedTokenAuthenticationTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        authentication.clear()
+        self.addCleanup(authentication.clear)
+        self.post = self.create_post()
+        self.url = f'/api/posts/{self.post.id}/likes/'
+
+    def token_queries(self, method='post'):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(self.url)
+        return response, sum('authtoken_token' in query['sql'] for query in queries.captured_queries)
+
+    def test_token_lookup_cached(self):
+        response, queries = self.token_queries()
+        self.assertEqual((response.status_code, queries), (201, 1))
+        response, queries = self.token_queries('delete')
+        self.assertEqual((response.status_code, queries), (200, 0))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_deleted_token_and_inactive_user_rejected(self):
+        self.token_queries()
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.post(self.url).status_code, 401)
+
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.delete(self.url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.post(self.url).status_code, 401)
+
+    @override_settings(POSTS_AUTH_CACHE_SIZE=1)
+    def test_lru_is_bounded(self):
+        self.token_queries()
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.other).key}')
+        other.post(self.url)
+        # Запись первого токена вытеснена
+        self.assertEqual(self.token_queries('delete')[1], 1)
+
+    @override_settings(POSTS_AUTH_CACHE_ALIAS='default')
+    def test_shared_cache(self):
+        self.token_queries()
+        # Другой процесс: локального LRU нет, пользователь берётся из общего кеша
+        authentication.clear()
+        self.assertEqual(self.token_queries('delete')[1], 0)
+        Token.objects.filter(user=self.user).delete()
+        authentication.clear()
+        self.assertEqual(self.client.post(self.url).status_code, 401)
+
+
+class FastSerializationTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        renditions = {'small': {'width': 320, 'height': 240, 'webp': 'renditions/a.webp', 'jpeg': 'renditions/a.jpg'}}
+        self.post = self.create_post(title='Море', description='Строка\u2028вторая', renditions=renditions,
+                                     image_width=800, image_height=600, latitude=43.58, longitude=39.72)
+        self.create_post(title=None, image='')
+        for i in range(4):
+            Comment.objects.create(post=self.post, user=self.other, text=f'Комментарий {i}')
+        Like.objects.create(post=self.post, user=self.user)
+        Like.objects.create(post=self.post, user=self.other)
+
+    def assert_same_as_drf(self, url):
+        fast = self.client.get(url)
+        with override_settings(POSTS_FAST_SERIALIZATION=False):
+            drf = self.client.get(url)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, drf.content)
+
+    def test_lists_match_drf_serializers(self):
+        for url in ['/api/posts/', '/api/posts/?page_size=1', '/api/posts/?ordering=updated_at',
+                    '/api/posts/?page=1', '/api/posts/?search=Море',
+                    f'/api/posts/{self.post.id}/comments/?page_size=2',
+                    f'/api/posts/{self.post.id}/likes/']:
+            with self.subTest(url=url):
+                self.assert_same_as_drf(url)
+
+    def test_renderer_matches_json_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+
+        data = {'date': timezone.now(), 1: [None, True, 1.5, 'тест '], 'items': Post.objects.values('id')}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+
+
+class PostDeletionTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(title='Удаляемый')
+        for i in range(5):
+            user = User.objects.create_user(username=f'liker{i}')
+            Like.objects.create(post=self.post, user=user)
+            Comment.objects.create(post=self.post, user=user, text=f'Комментарий {i}')
+
+    def test_post_hidden_before_purge(self):
+        response = self.client.delete(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.status_code, 204)
+
+        # Фоновая очистка ещё не выполнялась
+        self.assertEqual(Like.objects.filter(post_id=self.post.id).count(), 5)
+        self.assertFalse(Post.objects.filter(pk=self.post.id).exists())
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/posts/').data['results'], [])
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/comments/').data['results'], [])
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/likes/').status_code, 404)
+        self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/likes/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/posts/{self.post.id}/').status_code, 404)
+
+    @override_settings(POSTS_PURGE_BATCH_SIZE=2)
+    def test_purge_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(f'/api/posts/{self.post.id}/')
+
+        self.assertFalse(Post.all_objects.filter(pk=self.post.id).exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        # 5 лайков пачками по 2 — три DELETE по id
+        like_deletes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('DELETE FROM "posts_like"')]
+        self.assertEqual(len(like_deletes), 3)
+
+    def test_purge_command_finishes_interrupted_purge(self):
+        # Очередь фоновых задач потеряна: on_commit не выполнялся
+        self.client.delete(f'/api/posts/{self.post.id}/')
+        output = StringIO()
+        call_command('purge_deleted_posts', min_age=0, stdout=output)
+
+        self.assertIn('Удалено постов: 1', output.getvalue())
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_purge_removes_rendition_files(self):
+        # В том числе файл, которого нет в post.renditions (прерванная генерация)
+        orphan = default_storage.save(f'renditions/{self.post.pk}/orphan_small.webp', ContentFile(b'webp'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/posts/{self.post.id}/')
+        self.assertFalse(default_storage.exists(orphan))
+
+    def test_purge_skips_post_that_is_not_deleted(self):
+        self.assertEqual(purge_post(self.post.pk), 0)
+        self.assertTrue(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 5)
+
+
+@override_settings(POSTS_TRENDING_WORKERS=0, POSTS_TRENDING_FLUSH_INTERVAL=0)
+class TrendingTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        self.addCleanup(get_cache().clear)
+        self.quiet, self.liked, self.discussed = [self.create_post(title=f'Пост {i}') for i in range(3)]
+
+    def test_events_recorded_and_ranked(self):
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.other).key}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{self.liked.id}/likes/')
+            other.post(f'/api/posts/{self.liked.id}/likes/')
+            self.client.post(f'/api/posts/{self.discussed.id}/comments/', {'text': 'Первый'})
+            self.client.post(f'/api/posts/{self.discussed.id}/comments/', {'text': 'Второй'})
+            # Снятие лайка вычитается из интервала
+            other.delete(f'/api/posts/{self.liked.id}/likes/')
+
+        activity = {row.post_id: (row.likes, row.comments) for row in PostActivity.objects.all()}
+        self.assertEqual(activity, {self.liked.id: (1, 0), self.discussed.id: (0, 2)})
+
+        response = self.client.get('/api/posts/trending/')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [self.discussed.id, self.liked.id])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    @override_settings(POSTS_TRENDING_FLUSH_INTERVAL=60)
+    def test_events_are_buffered_until_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                trending.record_activity(self.liked.pk, likes=1)
+            trending.record_activity(self.liked.pk, comments=1)
+            trending.record_activity(self.discussed.pk, likes=1)
+        # Запрос события не трогает PostActivity
+        self.assertFalse(PostActivity.objects.exists())
+
+        self.assertEqual(trending.get_activity_buffer().flush(), 2)
+        activity = {row.post_id: (row.likes, row.comments) for row in PostActivity.objects.all()}
+        self.assertEqual(activity, {self.liked.id: (3, 1), self.discussed.id: (1, 0)})
+
+        # Пост удалён, пока события ждали записи
+        with self.captureOnCommitCallbacks(execute=True):
+            trending.record_activity(self.quiet.pk, likes=1)
+        Post.all_objects.filter(pk=self.quiet.pk).delete()
+        self.assertEqual(trending.get_activity_buffer().flush(), 0)
+
+    def test_scores_decay_and_window(self):
+        now = timezone.now()
+        PostActivity.objects.create(post=self.liked, bucket=trending.current_bucket(now), likes=10)
+        # Больше лайков, но два периода полураспада назад: 20 / 4 < 10
+        PostActivity.objects.create(post=self.discussed, bucket=now - timedelta(hours=12), likes=20)
+        PostActivity.objects.create(post=self.quiet, bucket=now - timedelta(days=2), likes=1000)
+
+        self.assertEqual(trending.rerank(now), 2)
+        self.assertEqual([pk for _, pk in trending.top_post_ids(10)], [self.liked.id, self.discussed.id])
+        # Интервалы вне окна удалены
+        self.assertFalse(PostActivity.objects.filter(post=self.quiet).exists())
+
+    def test_endpoint_reads_ranked_table(self):
+        for post, likes in [(self.quiet, 1), (self.liked, 5)]:
+            PostActivity.objects.create(post=post, bucket=trending.current_bucket(), likes=likes)
+        self.client.get('/api/posts/trending/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/trending/?page_size=1')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.liked.id])
+        self.assertFalse(any('posts_postactivity' in query['sql'] for query in queries.captured_queries))
+
+
+class TrendingWriteTests(TransactionTestCase):
+    # Внешний ключ проверяется при коммите, поэтому без транзакции TestCase
+
+    def test_post_deleted_before_write_keeps_other_rows(self):
+        user = User.objects.create_user(username='author', password='pass')
+        post = Post.objects.create(user=user, image='images/test.jpg')
+        deleted_id = Post.objects.create(user=user, image='images/test.jpg').pk
+        # Проверка существования видит пост, который удаляют до записи
+        stale = mock.Mock()
+        stale.values_list.return_value = [post.pk, deleted_id]
+        fresh = Post.all_objects.filter(pk__in=[post.pk, deleted_id])
+        Post.all_objects.filter(pk=deleted_id).delete()
+
+        bucket = trending.current_bucket()
+        with mock.patch.object(Post.all_objects, 'filter', side_effect=[stale, fresh]):
+            written = trending.write_activities([(post.pk, bucket, 1, 0), (deleted_id, bucket, 1, 0)])
+        self.assertEqual(written, 1)
+        self.assertEqual(list(PostActivity.objects.values_list('post_id', 'likes')), [(post.pk, 1)])
+
+
+class LikeListTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(title='Пост')
+        self.url = f'/api/posts/{self.post.id}/likes/'
+
+    def add_likes(self, count):
+        for _ in range(count):
+            user = User.objects.create_user(username=f'liker{User.objects.count()}')
+            Like.objects.create(post=self.post, user=user)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=self.post.likes.count())
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(POSTS_FAST_SERIALIZATION=fast):
+                Like.objects.all().delete()
+                self.add_likes(1)
+                self.list_queries()
+                small, _ = self.list_queries()
+                self.add_likes(9)
+                full, response = self.list_queries()
+                self.assertEqual(len(response.data['results']), 10)
+                self.assertEqual(response.data['results'][0]['post'], 'Пост')
+                self.assertEqual(small, full)
+
+    def test_summary(self):
+        self.add_likes(5)
+        response = self.client.get(self.url, {'summary': 1})
+        latest = self.post.likes.order_by('-created_at', '-id')[:3]
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([user['id'] for user in response.data['users']], [like.user_id for like in latest])
+
+    def test_retrieve_and_delete_by_id(self):
+        mine = Like.objects.create(post=self.post, user=self.user)
+        theirs = Like.objects.create(post=self.post, user=self.other)
+
+        response = self.client.get(f'{self.url}{mine.id}/')
+        self.assertEqual((response.data['id'], response.data['user']['username']), (mine.id, 'author'))
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id + 1}/likes/{mine.id}/').status_code, 404)
+
+        self.assertEqual(self.client.delete(f'{self.url}{theirs.id}/').status_code, 403)
+        self.assertEqual(self.client.delete(f'{self.url}{mine.id}/').status_code, 200)
+        self.assertEqual(list(Like.objects.values_list('pk', flat=True)), [theirs.id])
+
+
+class AdminTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='moderator', password='pass')
+        self.client.force_login(self.admin)
+        self.post = self.create_post(title='Пост')
+
+    def fill(self, count):
+        for i in range(count):
+            user = User.objects.create_user(username=f'user{User.objects.count()}')
+            Comment.objects.create(post=self.post, user=user, text=f'Комментарий {i}')
+            Like.objects.create(post=self.post, user=user)
+
+    def test_changelists_query_count_does_not_depend_on_rows(self):
+        for url in ['/admin/posts/post/', '/admin/posts/comment/', '/admin/posts/like/']:
+            with self.subTest(url=url):
+                self.fill(1)
+                with CaptureQueriesContext(connection) as small:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                self.fill(5)
+                with CaptureQueriesContext(connection) as full:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(len(small), len(full))
+
+    def test_bulk_delete_actions_fix_counters(self):
+        self.fill(3)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=3, likes_count=3)
+        comments = Comment.objects.order_by('id')[:2]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/posts/comment/', {
+                'action': 'delete_comments', '_selected_action': [c.pk for c in comments],
+            })
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(sum(q['sql'].startswith('DELETE') for q in queries.captured_queries), 1)
+
+        self.client.post('/admin/posts/like/', {
+            'action': 'delete_likes', '_selected_action': list(Like.objects.values_list('pk', flat=True)),
+        })
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comments_count, self.post.likes_count), (1, 0))
+
+    def test_post_soft_delete(self):
+        self.fill(2)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post('/admin/posts/post/', {'action': 'soft_delete', '_selected_action': [self.post.pk]})
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.client.get('/admin/posts/post/?deleted=yes').context['cl'].result_count, 1)
+
+        # Восстановления нет: очистка уже в очереди
+        actions = self.client.get('/admin/posts/post/').context['action_form'].fields['action'].choices
+        self.assertNotIn('restore', [name for name, _ in actions])
@@ -0,0 +1,240 @@
+"""
+Популярные посты: рейтинг по лайкам и комментариям с экспоненциальным затуханием.
+
+Каждый лайк, снятие лайка и комментарий увеличивает счётчик поста в текущем
+интервале (PostActivity, POSTS_TRENDING_BUCKET_SECONDS), без подсчётов по
+таблицам лайков и комментариев. После коммита события складываются в
+памяти процесса (ActivityBuffer), и раз в POSTS_TRENDING_FLUSH_INTERVAL
+секунд фоновый поток пишет их одним upsert на пачку: строка «горячего»
+поста не блокируется в транзакции каждого лайка. События, не успевшие
+записаться до падения процесса, теряются — рейтинг и так приблизительный. Раз в
+POSTS_TRENDING_RERANK_INTERVAL секунд фоновая задача (или команда
+update_trending) суммирует интервалы за окно POSTS_TRENDING_WINDOW:
+
+    score = Σ (лайки · вес + комментарии · вес) · 0.5 ^ (возраст / POSTS_TRENDING_HALF_LIFE)
+
+и перезаписывает таблицу TrendingPost с первыми POSTS_TRENDING_SIZE постами.
+/api/posts/trending/ читает её по индексу score — стоимость не зависит
+от числа лайков, комментариев и постов.
+"""
+import atexit
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Post, PostActivity, TrendingPost
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY = PostActivity._meta.db_table
+RANKED_KEY = 'posts:trending:ranked'
+SQL_CHUNK_SIZE = 500
+
+# Счётчики складываются в одном запросе, без чтения строки
+RECORD_ACTIVITY = f"""
+    INSERT INTO {ACTIVITY} (post_id, bucket, likes, comments) VALUES {{values}}
+    ON CONFLICT (post_id, bucket) DO UPDATE
+    SET likes = {ACTIVITY}.likes + excluded.likes, comments = {ACTIVITY}.comments + excluded.comments
+"""
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.POSTS_TRENDING_WORKERS, thread_name_prefix='trending')
+    return _executor
+
+
+def current_bucket(now=None):
+    now = now or timezone.now()
+    size = settings.POSTS_TRENDING_BUCKET_SECONDS
+    return datetime.fromtimestamp(now.timestamp() // size * size, tz=dt_timezone.utc)
+
+
+def record_activity(post_id, likes=0, comments=0):
+    """Учитывает события поста в текущем интервале после коммита транзакции события."""
+    record_activities([(post_id, likes, comments)])
+
+
+def record_activities(changes):
+    """То же для нескольких постов: [(id поста, лайки, комментарии), ...]."""
+    changes = [change for change in changes if change[1] or change[2]]
+    if not changes:
+        return
+    # Интервал — по времени события, а не записи
+    bucket = current_bucket()
+    transaction.on_commit(lambda: get_activity_buffer().add(changes, bucket))
+
+
+def write_activities(rows, retry=True):
+    """Прибавляет счётчики к интервалам: [(id поста, интервал, лайки, комментарии), ...]; возвращает число строк."""
+    # Пост могли удалить, пока события ждали записи
+    existing = set(Post.all_objects.filter(pk__in={row[0] for row in rows}).values_list('pk', flat=True))
+    existing_rows = [row for row in rows if row[0] in existing]
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(existing_rows), SQL_CHUNK_SIZE):
+                chunk = existing_rows[start:start + SQL_CHUNK_SIZE]
+                values = ', '.join(['(%s, %s, %s, %s)'] * len(chunk))
+                params = [
+                    value for post_id, bucket, likes, comments in chunk
+                    for value in (post_id, connection.ops.adapt_datetimefield_value(bucket), likes, comments)
+                ]
+                cursor.execute(RECORD_ACTIVITY.format(values=values), params)
+    except IntegrityError:
+        if not retry:
+            raise
+        # Пост удалили между проверкой и записью: фильтруем заново, остальные строки не теряем
+        return write_activities(rows, retry=False)
+    return len(existing_rows)
+
+
+class ActivityBuffer:
+    """Счётчики событий, ещё не записанные в PostActivity; flush_interval 0 — запись сразу."""
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        # (id поста, интервал) -> [лайки, комментарии]
+        self.pending = defaultdict(lambda: [0, 0])
+        self.flusher = None
+
+    def add(self, changes, bucket):
+        if self.flush_interval <= 0:
+            write_activities([(post_id, bucket, likes, comments) for post_id, likes, comments in changes])
+            return
+        with self.lock:
+            for post_id, likes, comments in changes:
+                counters = self.pending[(post_id, bucket)]
+                counters[0] += likes
+                counters[1] += comments
+        self._start_flusher()
+
+    def flush(self):
+        """Записывает накопленное; возвращает число строк."""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, defaultdict(lambda: [0, 0])
+            rows = [(post_id, bucket, likes, comments)
+                    for (post_id, bucket), (likes, comments) in pending.items() if likes or comments]
+            if not rows:
+                return 0
+            try:
+                return write_activities(rows)
+            except IntegrityError:
+                # write_activities уже повторил запись без удалённых постов
+                logger.exception('Счётчики популярности отброшены')
+                return 0
+            except Exception:
+                logger.exception('Не удалось записать счётчики популярности, повторим при следующем сбросе')
+                with self.lock:
+                    for key, (likes, comments) in pending.items():
+                        counters = self.pending[key]
+                        counters[0] += likes
+                        counters[1] += comments
+                raise
+
+    def _start_flusher(self):
+        if self.flusher is not None:
+            return
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, name='trending-buffer', daemon=True)
+                self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Ошибка уже записана в flush, счётчики вернулись в очередь
+                logger.debug('Сброс счётчиков популярности не удался', exc_info=True)
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_activity_buffer():
+    global _buffer
+    with _buffer_lock:
+        if (_buffer is None or _buffer.pid != os.getpid()
+                or _buffer.flush_interval != settings.POSTS_TRENDING_FLUSH_INTERVAL):
+            if _buffer is not None and _buffer.pid == os.getpid():
+                _buffer.flush()
+            _buffer = ActivityBuffer(settings.POSTS_TRENDING_FLUSH_INTERVAL)
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def rerank(now=None):
+    """Пересчитывает рейтинг за окно и удаляет устаревшие интервалы; возвращает число постов в рейтинге."""
+    now = now or timezone.now()
+    # Свои ещё не записанные события; буферы других процессов догонят к следующему пересчёту
+    get_activity_buffer().flush()
+    window_start = now - timedelta(seconds=settings.POSTS_TRENDING_WINDOW)
+    half_life = settings.POSTS_TRENDING_HALF_LIFE
+    like_weight, comment_weight = settings.POSTS_TRENDING_LIKE_WEIGHT, settings.POSTS_TRENDING_COMMENT_WEIGHT
+
+    scores = defaultdict(float)
+    rows = PostActivity.objects.filter(bucket__gte=window_start, post__deleted_at__isnull=True).values_list(
+        'post_id', 'bucket', 'likes', 'comments'
+    )
+    for post_id, bucket, likes, comments in rows.iterator(chunk_size=10000):
+        age = max((now - bucket).total_seconds(), 0)
+        scores[post_id] += (likes * like_weight + comments * comment_weight) * 0.5 ** (age / half_life)
+    top = heapq.nlargest(
+        settings.POSTS_TRENDING_SIZE,
+        ((score, post_id) for post_id, score in scores.items() if score > 0),
+    )
+
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create([TrendingPost(post_id=post_id, score=score) for score, post_id in top])
+    PostActivity.objects.filter(bucket__lt=window_start).delete()
+    return len(top)
+
+
+def refresh_if_stale():
+    """Ставит пересчёт в очередь, если рейтинг старше POSTS_TRENDING_RERANK_INTERVAL."""
+    # add() атомарен: пересчёт запускает только один запрос за интервал
+    cache = caches[settings.POSTS_CACHE_ALIAS]
+    if not cache.add(RANKED_KEY, True, settings.POSTS_TRENDING_RERANK_INTERVAL):
+        return
+    if settings.POSTS_TRENDING_WORKERS:
+        _get_executor().submit(_run_rerank_job)
+    else:
+        rerank()
+
+
+def _run_rerank_job():
+    close_old_connections()
+    try:
+        rerank()
+    except Exception:
+        logger.exception('Не удалось пересчитать популярные посты')
+        caches[settings.POSTS_CACHE_ALIAS].delete(RANKED_KEY)
+    finally:
+        close_old_connections()
+
+
+def top_post_ids(limit):
+    """До limit пар (score, id поста) по убыванию рейтинга."""
+    return list(TrendingPost.objects.order_by('-score', 'post_id').values_list('score', 'post_id')[:limit])
@@ -0,0 +1,116 @@
+"""
+Загрузка изображений по частям (сессии загрузки).
+
+Часть сначала читается из сети в отдельный файл (spool_chunk) без
+блокировок, затем под блокировкой сессии копируется с локального диска в
+файл сессии. Всё — порциями по COPY_CHUNK_SIZE, поэтому расход памяти не
+зависит от размера файла. Контрольная сумма проверяется при завершении
+сессии, тоже потоково.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+COPY_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadError(Exception):
+    pass
+
+
+def session_path(session):
+    return os.path.join(settings.POSTS_UPLOAD_DIR, f'{session.pk}.part')
+
+
+def create_session_file(session):
+    os.makedirs(settings.POSTS_UPLOAD_DIR, exist_ok=True)
+    open(session_path(session), 'wb').close()
+
+
+def delete_session_file(session):
+    try:
+        os.unlink(session_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def parse_content_range(header, length):
+    """Возвращает (start, end) включительно из заголовка Content-Range."""
+    match = CONTENT_RANGE.match(header.strip())
+    if not match:
+        raise UploadError('Неверный заголовок Content-Range')
+    start, end = int(match.group(1)), int(match.group(2))
+    if end < start or (length is not None and end - start + 1 != length):
+        raise UploadError('Content-Range не совпадает с размером тела запроса')
+    return start, end
+
+
+def spool_chunk(session, stream, length):
+    """Читает length байт из stream во временный файл рядом с файлом сессии; возвращает его путь."""
+    fd, path = tempfile.mkstemp(prefix=f'{session.pk}.', suffix='.chunk', dir=settings.POSTS_UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            copied = _copy(stream, file, length)
+        if copied != length:
+            raise UploadError('Часть получена не полностью')
+    except BaseException:
+        discard_chunk(path)
+        raise
+    return path
+
+
+def discard_chunk(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _copy(stream, file, length):
+    written = 0
+    while written < length:
+        data = stream.read(min(COPY_CHUNK_SIZE, length - written))
+        if not data:
+            break
+        file.write(data)
+        written += len(data)
+    return written
+
+
+def write_chunk(session, stream, start, length):
+    """Пишет length байт из stream в файл сессии с позиции start."""
+    with open(session_path(session), 'r+b') as file:
+        file.seek(start)
+        written = _copy(stream, file, length)
+    if written != length:
+        raise UploadError('Часть получена не полностью')
+    return written
+
+
+def file_checksum(session):
+    hasher = hashlib.sha256()
+    with open(session_path(session), 'rb') as file:
+        for data in iter(lambda: file.read(COPY_CHUNK_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+class SessionFile(UploadedFile):
+    """
+    Файл сессии в виде загруженного файла.
+
+    temporary_file_path() позволяет валидатору изображений открыть файл
+    с диска, не читая его целиком в память.
+    """
+
+    def __init__(self, session):
+        self.path = session_path(session)
+        super().__init__(open(self.path, 'rb'), name=session.filename, size=session.size)
+
+    def temporary_file_path(self):
+        return self.path
@@ -1,19 +1,42 @@
+import json
+
 from rest_framework import viewsets, permissions, status, exceptions
 from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
-from .models import Post, Like, Comment
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.urls import replace_query_param
+from .models import Post, Comment, Like, UploadSession
 from .serializers import (
     PostSerializer,
     LikeSerializer,
     CommentSerializer,
-    PostDetailSerializer
+    PostDetailSerializer,
+    NearbyQuerySerializer,
+    TrendingQuerySerializer,
+    UserSerializer,
+    UploadSessionSerializer
 )
 from django.contrib.auth import get_user_model
 from .permissions import IsAuthorOrReadOnly
-from rest_framework.pagination import PageNumberPagination
+from .pagination import PostPagination, CommentPagination, LikePagination, dump_cursor, load_cursor
+from .search import PostSearchFilter
+from .renditions import schedule_renditions
+from .cache import CachedPostReadMixin, cache_stats as get_cache_stats
+from .db_router import PinOnWriteMixin, ReplicaReadMixin
+from . import uploads
+from .likes import like_post, unlike_post, liked_post_ids
+from .like_buffer import get_like_buffer, write_behind_enabled
+from . import export, feed, geo, purge, trending
+from .batch import create_comments, create_posts
+from .fast import CompiledSerializer, fast_serialization_enabled
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
@@ -25,21 +48,89 @@ def index(request):
     return render(request, 'index.html')
 
 
-class PostViewSet(viewsets.ModelViewSet):
+def comments_preview_queryset():
+    # Последние N комментариев каждого поста
+    return Comment.objects.annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=F('post_id'),
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )
+    ).filter(row_number__lte=settings.POSTS_COMMENTS_PREVIEW_SIZE)
+
+
+def batch_response(results):
+    # 201 — создано всё, 207 — часть элементов с ошибками, 400 — ничего не создано
+    created = sum(result['status'] == status.HTTP_201_CREATED for result in results)
+    if created == len(results):
+        code = status.HTTP_201_CREATED
+    else:
+        code = status.HTTP_207_MULTI_STATUS if created else status.HTTP_400_BAD_REQUEST
+    return Response({'created': created, 'results': results}, status=code)
+
+
+def with_comments_preview(queryset):
+    # Превью комментариев для всех постов страницы одним запросом
+    return queryset.prefetch_related(
+        Prefetch('comments', queryset=comments_preview_queryset(), to_attr='preview_comments')
+    )
+
+
+def fast_page(paginator, queryset, compiled, request, view):
+    """Страница строк .values() для CompiledSerializer (с колонкой сортировки для курсора)."""
+    columns = list(compiled.columns)
+    if hasattr(paginator, 'get_ordering'):
+        field, _ = paginator.get_ordering(request, queryset, view)
+        columns += [column for column in (field, 'id') if column not in columns]
+    # prefetch_related к словарям неприменим — связанные данные подставляет представление
+    return paginator.paginate_queryset(queryset.prefetch_related(None).values(*columns), request, view=view)
+
+
+def attach_comments_preview(rows, context):
+    # Превью комментариев, как with_comments_preview, но строками .values()
+    compiled = CompiledSerializer(CommentSerializer, context)
+    previews = {row['id']: [] for row in rows}
+    # row_number в проекции обязателен: без него Django неверно собирает фильтр по окну
+    comments = comments_preview_queryset().filter(post_id__in=previews).values(
+        *compiled.columns, 'post_id', 'row_number'
+    )
+    for comment in comments:
+        previews[comment['post_id']].append(comment)
+    for row in rows:
+        row['comments'] = compiled.many(previews[row['id']])
+
+
+class FastListMixin:
+    """list() через CompiledSerializer (posts/fast.py) при POSTS_FAST_SERIALIZATION."""
+
+    def list(self, request, *args, **kwargs):
+        if not fast_serialization_enabled():
+            return super().list(request, *args, **kwargs)
+        compiled = CompiledSerializer(self.get_serializer_class(), self.get_serializer_context())
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = fast_page(self.paginator, queryset, compiled, request, self)
+        self.attach_related(rows)
+        return self.get_paginated_response(compiled.many(rows))
+
+    def attach_related(self, rows):
+        pass
+
+
+class PostViewSet(ReplicaReadMixin, CachedPostReadMixin, FastListMixin, viewsets.ModelViewSet):
     parser_classes = [MultiPartParser, FormParser]
     queryset = Post.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = PageNumberPagination
+    pagination_class = PostPagination
     http_method_names = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options']
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PostSearchFilter, OrderingFilter]
     filterset_fields = ['created_at', 'updated_at']  # Фильтрация по датам
-    search_fields = ['title', 'description']  # Поиск по полям
+    search_fields = ['title', 'description']  # Поиск по полям (для СУБД без полнотекстового индекса)
     ordering_fields = ['created_at', 'updated_at']  # Сортировка по датам
 
     def get_permissions(self):
-        # Разрешаем анонимный доступ для GET-запросов
-        if self.request.method in ['GET', 'HEAD', 'OPTIONS']:
+        # Разрешаем анонимный доступ для GET-запросов (кроме служебных действий)
+        if self.request.method in ['GET', 'HEAD', 'OPTIONS'] and self.action != 'cache_stats':
             return [permissions.AllowAny()]
         return super().get_permissions()
 
@@ -48,51 +139,252 @@ class PostViewSet(viewsets.ModelViewSet):
             return PostDetailSerializer
         return PostSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = with_comments_preview(queryset)
+        return queryset
+
+    def attach_related(self, rows):
+        attach_comments_preview(rows, self.get_serializer_context())
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        post = serializer.save(user=self.request.user)
+        schedule_renditions(post.pk)
+        feed.schedule_fanout(post.pk)
 
-    # Удаление поста
-    def destroy(self, request, *args, **kwargs):
+    def perform_update(self, serializer):
+        post = serializer.save()
+        if 'image' in serializer.validated_data:
+            schedule_renditions(post.pk)
+
+    @action(detail=False, methods=['get'], url_path='liked')
+    def liked(self, request):
+        # GET /api/posts/liked/?ids=1,2,3 -> {"1": true, "2": false, ...} одним запросом
         try:
-            return super().destroy(request, *args, **kwargs)
-        except Exception as e:
-            return Response(
-                {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value]
+        except ValueError:
+            raise exceptions.ValidationError({'ids': 'Ожидается список id через запятую'})
+        if len(ids) > settings.POSTS_LIKED_BATCH_SIZE:
+            raise exceptions.ValidationError(
+                {'ids': f'Не больше {settings.POSTS_LIKED_BATCH_SIZE} id за запрос'}
             )
+        liked = liked_post_ids(request.user, ids)
+        return Response({str(post_id): post_id in liked for post_id in ids})
+
+    @action(detail=False, methods=['get'], url_path='nearby')
+    def nearby(self, request):
+        # GET /api/posts/nearby/?lat=55.75&lon=37.62&radius=5000 — ближайшие посты с расстоянием в метрах
+        query = NearbyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        nearest = geo.nearby_post_ids(
+            params['lat'], params['lon'],
+            params.get('radius', settings.POSTS_NEARBY_DEFAULT_RADIUS),
+            params.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE']),
+        )
+        posts = with_comments_preview(Post.objects.filter(pk__in=[pk for _, pk in nearest])).in_bulk()
+        found = [(distance, posts[pk]) for distance, pk in nearest if pk in posts]
+        data = PostSerializer([post for _, post in found], many=True, context={'request': request}).data
+        for item, (distance, _) in zip(data, found):
+            item['distance'] = round(distance, 1)
+        return Response({'results': data})
+
+    @action(detail=False, methods=['get'], url_path='trending')
+    def trending(self, request):
+        # GET /api/posts/trending/?page_size=10 — популярные посты за окно POSTS_TRENDING_WINDOW (posts/trending.py)
+        query = TrendingQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        trending.refresh_if_stale()
+        top = trending.top_post_ids(query.validated_data.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE']))
+        posts = with_comments_preview(Post.objects.filter(pk__in=[pk for _, pk in top])).in_bulk()
+        found = [(score, posts[pk]) for score, pk in top if pk in posts]
+        data = PostSerializer([post for _, post in found], many=True, context={'request': request}).data
+        for item, (score, _) in zip(data, found):
+            item['score'] = round(score, 3)
+        return Response({'results': data})
+
+    @action(detail=False, methods=['post'], url_path='batch', parser_classes=[JSONParser, MultiPartParser],
+            permission_classes=[IsAuthenticated])
+    def batch(self, request):
+        # POST /api/posts/batch/ [{"title": ..., "description": ..., "image": <загруженный файл>}, ...]
+        # или multipart: items=<тот же JSON>, image элемента — имя части с новым файлом
+        if request.content_type.startswith('multipart/'):
+            try:
+                items = json.loads(request.data.get('items', ''))
+            except ValueError:
+                raise exceptions.ValidationError({'items': ['Ожидается JSON-список элементов']})
+            return batch_response(create_posts(request.user, items, request.FILES))
+        return batch_response(create_posts(request.user, request.data))
+
+    @action(detail=False, methods=['get'], url_path='cache-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        # Счётчики попаданий в кеш ответов текущего процесса
+        return Response(get_cache_stats())
+
+    # Удаление поста
+    def perform_destroy(self, instance):
+        # Пост скрывается сразу, лайки и комментарии удаляются в фоне (posts/purge.py)
+        purge.soft_delete_post(instance)
+
 
-class LikeViewSet(viewsets.ViewSet):
+class LikeViewSet(ReplicaReadMixin, viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
-    permission_classes=PageNumberPagination
+
+    def buffered(self, request, post_id, liked):
+        # Режим отложенной записи: операция попадает в буфер, ответ 202.
+        # likes_count отстаёт от реального не больше чем на интервал сброса
+        likes_count = Post.objects.filter(pk=post_id).values_list('likes_count', flat=True).first()
+        if likes_count is None:
+            raise exceptions.NotFound('Пост не найден')
+        get_like_buffer().add(request.user.pk, int(post_id), liked)
+        return Response({'post': post_id, 'liked': liked, 'likes_count': likes_count},
+                        status=status.HTTP_202_ACCEPTED)
 
     def create(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
+        if write_behind_enabled():
+            return self.buffered(request, post_id, liked=True)
+        # Повторный лайк не ошибка: возвращаем текущее состояние
+        result = like_post(post_id, request.user.pk)
+        if result is None:
+            raise exceptions.NotFound('Пост не найден')
+        created, likes_count = result
+        return Response(
+            {'post': post_id, 'liked': True, 'likes_count': likes_count},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 
-        if Like.objects.filter(post=post, user=request.user).exists():
-            return Response({'detail': 'Вы уже поставили лайк'}, status=status.HTTP_400_BAD_REQUEST)
+    def destroy(self, request, post_id, like_id=None):
+        if like_id is not None:
+            # DELETE /api/posts/{id}/likes/{like_id}/ — снять свой лайк по его id
+            like = get_object_or_404(Like, pk=like_id, post_id=post_id, post__deleted_at__isnull=True)
+            if like.user_id != request.user.pk:
+                raise exceptions.PermissionDenied('Можно снять только свой лайк')
+        if write_behind_enabled():
+            return self.buffered(request, post_id, liked=False)
+        result = unlike_post(post_id, request.user.pk)
+        if result is None:
+            raise exceptions.NotFound('Пост не найден')
+        deleted, likes_count = result
+        return Response({'post': post_id, 'liked': False, 'likes_count': likes_count})
 
-        like = Like.objects.create(post=post, user=request.user)
-        serializer = LikeSerializer(like, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def destroy(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
-        like = get_object_or_404(Like, post=post, user=request.user)
-        like.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def retrieve(self, request, post_id, like_id):
+        like = get_object_or_404(
+            Like.objects.select_related('user', 'post'), pk=like_id, post_id=post_id, post__deleted_at__isnull=True
+        )
+        return Response(LikeSerializer(like, context={'request': request}).data)
 
     def list(self, request, post_id):
         post = get_object_or_404(Post, id=post_id)
-        likes = post.likes.all()
+        if request.query_params.get('summary') in ('1', 'true'):
+            return Response(self.summary(post, request))
+        paginator = LikePagination()
+        if fast_serialization_enabled():
+            compiled = CompiledSerializer(LikeSerializer, {'request': request})
+            rows = fast_page(paginator, post.likes.all(), compiled, request, self)
+            return paginator.get_paginated_response(compiled.many(rows))
+        # Пост у лайков из post.likes уже подставлен, пользователи — JOIN вместо запроса на строку
+        likes = paginator.paginate_queryset(post.likes.select_related('user'), request, view=self)
         serializer = LikeSerializer(likes, many=True, context={'request': request})
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+
+    def summary(self, post, request):
+        # ?summary=1 — для карточки в ленте: последние лайкнувшие и общее число (без COUNT)
+        likes = post.likes.select_related('user').order_by('-created_at', '-id')[:settings.POSTS_LIKES_SUMMARY_SIZE]
+        users = UserSerializer([like.user for like in likes], many=True, context={'request': request}).data
+        return {'count': post.likes_count, 'users': users}
+
+
+class FeedViewSet(viewsets.ViewSet):
+    """
+    Домашняя лента: посты авторов, на которых подписан пользователь, и его
+    собственные. GET /api/feed/?cursor=...&page_size=N
+    """
+    permission_classes = [IsAuthenticated]
 
+    def list(self, request):
+        page_size = PostPagination().get_page_size(request)
+        position = None
+        if request.query_params.get('cursor'):
+            try:
+                created_at, post_id = load_cursor(request.query_params['cursor'])
+                position = parse_datetime(created_at), int(post_id)
+            except (TypeError, ValueError):
+                raise exceptions.NotFound('Неверный курсор')
+            if position[0] is None:
+                raise exceptions.NotFound('Неверный курсор')
 
-class CommentViewSet(viewsets.ModelViewSet):
+        keys = feed.feed_keys(request.user, page_size, position)
+        page = keys[:page_size]
+        posts = with_comments_preview(Post.objects.filter(pk__in=[post_id for _, post_id in page])).in_bulk()
+        results = [posts[post_id] for _, post_id in page if post_id in posts]
+
+        next_link = None
+        if len(keys) > page_size:
+            created_at, post_id = page[-1]
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor',
+                                            dump_cursor([created_at.isoformat(), post_id]))
+        serializer = PostSerializer(results, many=True, context={'request': request})
+        return Response({'next': next_link, 'results': serializer.data})
+
+
+class FollowViewSet(PinOnWriteMixin, viewsets.ViewSet):
+    # POST/DELETE /api/users/{id}/follow/ — подписаться/отписаться
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, user_id):
+        if int(user_id) == request.user.pk:
+            raise exceptions.ValidationError('Нельзя подписаться на себя')
+        get_object_or_404(User, pk=user_id)
+        created = feed.follow(request.user.pk, int(user_id))
+        return Response({'user': user_id, 'following': True},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def destroy(self, request, user_id):
+        get_object_or_404(User, pk=user_id)
+        feed.unfollow(request.user.pk, int(user_id))
+        return Response({'user': user_id, 'following': False})
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Потоковая выгрузка в NDJSON (posts/export.py):
+    GET /api/export/?include=comments,likes&since=<ISO 8601>&cursor=...
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        include = [section for section in request.query_params.get('include', '').split(',') if section]
+        unknown = set(include) - set(export.SECTIONS)
+        if unknown:
+            raise exceptions.ValidationError({'include': f'Неизвестные разделы: {", ".join(sorted(unknown))}'})
+
+        since = None
+        if request.query_params.get('since'):
+            since = parse_datetime(request.query_params['since'])
+            if since is None:
+                raise exceptions.ValidationError({'since': 'Ожидается дата и время в ISO 8601'})
+
+        positions = None
+        if request.query_params.get('cursor'):
+            try:
+                positions = export.decode_cursor(request.query_params['cursor'])
+            except export.InvalidCursor as e:
+                raise exceptions.NotFound(str(e))
+
+        lines = export.export_lines(['posts', *include], positions, since)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson; charset=utf-8')
+        # Не буферизовать ответ в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class CommentViewSet(ReplicaReadMixin, FastListMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     lookup_field = 'id'  # указываем, что ищем по полю id
     lookup_url_kwarg = 'comment_id'  # указываем имя параметра в URL
-    pagination_class = PageNumberPagination
+    pagination_class = CommentPagination
 
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
     filterset_fields = ['created_at']
@@ -103,14 +395,15 @@ class CommentViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [permissions.AllowAny()]
-        elif self.action in ['create', 'update', 'partial_update', 'destroy']:
-            return [permissions.IsAuthenticated, IsAuthorOrReadOnly]
+        elif self.action in ['create', 'update', 'partial_update', 'destroy', 'batch']:
+            return [permissions.IsAuthenticated(), IsAuthorOrReadOnly()]
         return super().get_permissions()
 
     def get_queryset(self):
         try:
             post_id = self.kwargs.get('post_id')
-            return Comment.objects.filter(post_id=post_id)
+            # Комментарии удалённого поста скрыты до его окончательной очистки
+            return Comment.objects.filter(post_id=post_id, post__deleted_at__isnull=True)
         except Exception as e:
             raise exceptions.APIException(f"Ошибка при получении комментариев: {str(e)}")
 
@@ -118,16 +411,143 @@ class CommentViewSet(viewsets.ModelViewSet):
         try:
             post_id = self.kwargs.get('post_id')
             post = Post.objects.get(id=post_id)  # Проверяем существование поста
-            serializer.save(
-                user=self.request.user,
-                post_id=post_id
-            )
+            with transaction.atomic():
+                serializer.save(
+                    user=self.request.user,
+                    post_id=post_id
+                )
+                Post.objects.filter(pk=post.pk).update(comments_count=F('comments_count') + 1)
+                trending.record_activity(post.pk, comments=1)
         except Post.DoesNotExist:
             raise exceptions.NotFound("Пост не найден")
         except Exception as e:
             raise exceptions.APIException(f"Ошибка при создании комментария: {str(e)}")
 
+    def batch(self, request):
+        # POST /api/comments/batch/ [{"post": id, "text": ...}, ...]
+        return batch_response(create_comments(request.user, request.data))
+
     def perform_destroy(self, instance):
         if instance.user != self.request.user:
             raise exceptions.PermissionDenied("Только автор может удалить комментарий")
-        instance.delete()
\ No newline at end of file
+        with transaction.atomic():
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id, comments_count__gt=0).update(
+                comments_count=F('comments_count') - 1
+            )
+
+
+
+class UploadSessionViewSet(PinOnWriteMixin, viewsets.ViewSet):
+    """
+    Загрузка изображения по частям с возможностью продолжить после обрыва.
+
+    POST   /api/uploads/                 — создать сессию (filename, size, checksum)
+    PUT    /api/uploads/{id}/            — часть файла, заголовок Content-Range
+    GET    /api/uploads/{id}/            — сколько байт уже получено
+    POST   /api/uploads/{id}/finalize/   — проверить файл и создать пост
+    DELETE /api/uploads/{id}/            — отменить загрузку
+    """
+    permission_classes = [IsAuthenticated]
+    # PUT читает тело напрямую из потока, парсеры нужны только для JSON/форм
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+
+    def get_session(self, request, pk, lock=False):
+        queryset = UploadSession.objects.filter(user=request.user)
+        if lock:
+            queryset = queryset.select_for_update()
+        return get_object_or_404(queryset, pk=pk)
+
+    def create(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = serializer.save(user=request.user)
+        uploads.create_session_file(session)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(UploadSessionSerializer(self.get_session(request, pk)).data)
+
+    def chunk_conflict(self, session, start):
+        if session.status != UploadSession.STATUS_ACTIVE:
+            return Response({'detail': 'Загрузка уже завершена'}, status=status.HTTP_409_CONFLICT)
+        if start != session.received:
+            # Клиент должен продолжить с уже полученного смещения
+            return Response(
+                {'detail': 'Неверное смещение части', 'received': session.received},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return None
+
+    def update(self, request, pk=None):
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        session = self.get_session(request, pk)
+        try:
+            if 'HTTP_CONTENT_RANGE' in request.META:
+                start, end = uploads.parse_content_range(request.META['HTTP_CONTENT_RANGE'], length)
+            else:
+                start, end = session.received, session.received + length - 1
+            # Заведомо лишнюю часть отклоняем, не читая тело
+            conflict = self.chunk_conflict(session, start)
+            if conflict is not None:
+                return conflict
+            if end >= session.size:
+                raise uploads.UploadError('Часть выходит за пределы файла')
+            # Тело идёт из сети сколько угодно долго — без транзакции и блокировки сессии
+            spooled = uploads.spool_chunk(session, request.stream, length)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e), 'received': session.received},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                # Блокировка не даёт двум частям писать одновременно; пока читалось
+                # тело, другая часть могла быть принята, а загрузка — завершена
+                session = self.get_session(request, pk, lock=True)
+                conflict = self.chunk_conflict(session, start)
+                if conflict is not None:
+                    return conflict
+                with open(spooled, 'rb') as chunk:
+                    uploads.write_chunk(session, chunk, start, length)
+                session.received = start + length
+                session.save(update_fields=['received', 'updated_at'])
+        finally:
+            uploads.discard_chunk(spooled)
+        return Response(UploadSessionSerializer(session).data)
+
+    def destroy(self, request, pk=None):
+        session = self.get_session(request, pk)
+        uploads.delete_session_file(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        with transaction.atomic():
+            session = self.get_session(request, pk, lock=True)
+            if session.status != UploadSession.STATUS_ACTIVE:
+                return Response({'detail': 'Загрузка уже завершена'}, status=status.HTTP_409_CONFLICT)
+            if session.received != session.size:
+                return Response({'detail': 'Файл загружен не полностью', 'received': session.received},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if uploads.file_checksum(session) != session.checksum:
+                return Response({'detail': 'Контрольная сумма не совпадает'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            image = uploads.SessionFile(session)
+            try:
+                data = {'title': request.data.get('title'), 'description': request.data.get('description'),
+                        'image': image}
+                serializer = PostSerializer(data=data, context={'request': request})
+                serializer.is_valid(raise_exception=True)
+                post = serializer.save(user=request.user)
+            finally:
+                image.close()
+
+            session.status = UploadSession.STATUS_COMPLETED
+            session.post = post
+            session.save(update_fields=['status', 'post', 'updated_at'])
+            schedule_renditions(post.pk)
+            feed.schedule_fanout(post.pk)
+            transaction.on_commit(lambda: uploads.delete_session_file(session))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
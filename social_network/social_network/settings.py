@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы время ответа включало остальные middleware
+    'posts.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,9 +96,51 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Постоянные соединения: не открывать новое на каждый запрос.
+        # Перед повторным использованием соединение проверяется
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE') or 60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1,host2 (те же имя БД и учётные данные).
+# В тестах реплика — зеркало основной БД
+POSTS_DB_REPLICAS = []
+for number, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    POSTS_DB_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['posts.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает с основной БД (лаг репликации)
+POSTS_REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'social_network',
+    }
+}
+
+# Кеш ответов списка и деталей постов (posts/cache.py)
+POSTS_CACHE_ALIAS = 'default'
+POSTS_CACHE_TIMEOUT = 5 * 60
+
+# Где хранится закрепление за основной БД после записи (posts/db_router.py).
+# Его должны видеть все процессы, поэтому при репликах — таблица в БД
+# (manage.py createcachetable) или другой общий кеш, но не LocMemCache
+POSTS_REPLICA_PIN_CACHE_ALIAS = 'default'
+if POSTS_DB_REPLICAS:
+    CACHES['replica_pin'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'posts_replica_pin',
+    }
+    POSTS_REPLICA_PIN_CACHE_ALIAS = 'replica_pin'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -146,14 +190,126 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES':  [
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication с кешем токен -> пользователь
+        'posts.authentication.CachedTokenAuthentication',
 
     ],
+    # JSON через orjson, если он установлен (posts/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'posts.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 
 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 
 }
 
+# Сколько последних комментариев встраивать в каждый пост списка /api/posts/
+POSTS_COMMENTS_PREVIEW_SIZE = 3
+
+# Сколько последних лайкнувших отдаёт /api/posts/{id}/likes/?summary=1
+POSTS_LIKES_SUMMARY_SIZE = 3
+
+# Сколько id постов можно передать в /api/posts/liked/?ids=
+POSTS_LIKED_BATCH_SIZE = 100
+
+# Отложенная запись лайков для «горячих» постов (posts/like_buffer.py).
+# Буфер у каждого воркера свой: другие воркеры видят лайк только после сброса
+POSTS_LIKE_WRITE_BEHIND = os.getenv('LIKE_WRITE_BEHIND', '') == '1'
+POSTS_LIKE_BUFFER_DIR = os.path.join(BASE_DIR, 'like_buffer')
+POSTS_LIKE_BUFFER_FLUSH_INTERVAL = 0.5
+
+# Кеш аутентификации по токену (posts/authentication.py): записей в LRU
+# процесса и их время жизни (0 — без кеша); алиас кеша Django для общего
+# уровня между процессами (None — только LRU)
+POSTS_AUTH_CACHE_SIZE = 10000
+POSTS_AUTH_CACHE_TTL = 60
+POSTS_AUTH_CACHE_ALIAS = None
+
+# Популярные посты (posts/trending.py): окно и период полураспада в секундах,
+# размер интервала счётчиков, веса событий, как часто пересчитывать рейтинг,
+# сколько постов в нём хранить и потоков для пересчёта (0 — синхронно в запросе).
+# События копятся в памяти процесса и пишутся раз в POSTS_TRENDING_FLUSH_INTERVAL
+# секунд (0 — сразу после коммита события)
+POSTS_TRENDING_WINDOW = 24 * 60 * 60
+POSTS_TRENDING_HALF_LIFE = 6 * 60 * 60
+POSTS_TRENDING_BUCKET_SECONDS = 5 * 60
+POSTS_TRENDING_LIKE_WEIGHT = 1.0
+POSTS_TRENDING_COMMENT_WEIGHT = 2.0
+POSTS_TRENDING_RERANK_INTERVAL = 60
+POSTS_TRENDING_SIZE = 1000
+POSTS_TRENDING_WORKERS = 1
+POSTS_TRENDING_FLUSH_INTERVAL = 5
+
+# Удаление постов (posts/purge.py): строк в одном DELETE при фоновой очистке
+# и потоков для неё (0 — синхронно после коммита)
+POSTS_PURGE_BATCH_SIZE = 1000
+POSTS_PURGE_WORKERS = 1
+
+# Списки постов, комментариев и лайков через скомпилированный сериализатор
+# по .values() (posts/fast.py); False — обычные сериализаторы DRF
+POSTS_FAST_SERIALIZATION = True
+
+# Метрики (posts/metrics.py): токен для Authorization: Bearer (METRICS_TOKEN),
+# адреса, которым /metrics отдаётся без входа (за прокси на том же хосте все
+# запросы приходят с 127.0.0.1 — не указывайте его), и с какого времени ответа
+# писать запрос в лог вместе с самыми долгими SQL
+POSTS_METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+POSTS_METRICS_ALLOWED_IPS = []
+POSTS_SLOW_REQUEST_SECONDS = 1.0
+
+# Геометки (posts/geo.py): радиус поиска рядом в метрах и обратный геокодер —
+# класс с интерфейсом geopy, например geopy.geocoders.Nominatim с
+# POSTS_GEOCODER_OPTIONS = {'user_agent': '...'}
+POSTS_NEARBY_DEFAULT_RADIUS = 5000
+POSTS_NEARBY_MAX_RADIUS = 50000
+POSTS_GEOCODER = 'posts.geo.LocalGeocoder'
+POSTS_GEOCODER_OPTIONS = {}
+POSTS_GEOCODE_CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+# Пакетное создание (posts/batch.py): элементов в запросе и строк в одном INSERT
+POSTS_BATCH_MAX_COMMENTS = 1000
+POSTS_BATCH_MAX_POSTS = 100
+POSTS_BATCH_CHUNK_SIZE = 500
+
+# Выгрузка в NDJSON (posts/export.py): строк на запрос-окно и на одно
+# чтение из курсора БД
+POSTS_EXPORT_BATCH_SIZE = 10000
+POSTS_EXPORT_CHUNK_SIZE = 2000
+# На сколько секунд раньше курсора начинается следующая выгрузка: строки
+# транзакций, закоммиченных позже соседних, и отставание реплики. Записи
+# этого окна выгружаются повторно, получатель схлопывает их по id
+POSTS_EXPORT_LAG = 60
+
+# Async-представления (posts/async_views.py): запросы страницы поста
+# выполняются параллельно, каждый в своём потоке и соединении с БД.
+# Без CONN_MAX_AGE каждый запрос открывает соединение; False — по очереди
+POSTS_ASYNC_PARALLEL_QUERIES = True
+
+# Домашняя лента (posts/feed.py): у авторов с большим числом подписчиков
+# пост не раздаётся по лентам, а подмешивается при чтении
+POSTS_FANOUT_FOLLOWER_LIMIT = 10000
+POSTS_FANOUT_BATCH_SIZE = 1000
+POSTS_FANOUT_WORKERS = 2
+# Сколько последних постов автора добавить в ленту при подписке
+POSTS_FOLLOW_BACKFILL = 50
+
+# Превью изображений: имя -> ширина в пикселях (см. posts/renditions.py)
+POSTS_IMAGE_RENDITIONS = {'small': 320, 'medium': 640, 'large': 1280}
+# Потоков для генерации превью; 0 — генерировать синхронно после коммита
+POSTS_RENDITION_WORKERS = 2
+
+# Загрузка по частям: каталог временных файлов, лимит размера и время жизни сессии
+POSTS_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+POSTS_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+POSTS_UPLOAD_SESSION_TTL = 24 * 60 * 60
+
 MEDIA_URL = '/images/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'images')
+
+# Раздача медиа (posts/media.py): '' — файл отдаёт Django,
+# 'nginx' — X-Accel-Redirect на POSTS_MEDIA_ACCEL_PREFIX, 'sendfile' — X-Sendfile
+POSTS_MEDIA_ACCEL = os.getenv('MEDIA_ACCEL', '')
+POSTS_MEDIA_ACCEL_PREFIX = '/protected-media/'
+POSTS_MEDIA_CACHE_MAX_AGE = 60 * 60
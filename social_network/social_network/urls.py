@@ -1,19 +1,34 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from django.conf import settings
-from django.conf.urls.static import static
 
-from posts.views import PostViewSet, CommentViewSet, LikeViewSet, index
+from posts import async_views
+from posts.media import serve_media
+from posts.metrics import metrics_view
+from posts.views import (
+    PostViewSet, CommentViewSet, LikeViewSet, UploadSessionViewSet, FeedViewSet, FollowViewSet,
+    ExportViewSet, index
+)
 
 # Создаем роутер
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='post')  # Базовый URL для постов
+router.register(r'uploads', UploadSessionViewSet, basename='upload')  # Загрузка изображений по частям
+router.register(r'feed', FeedViewSet, basename='feed')  # Домашняя лента
+router.register(r'export', ExportViewSet, basename='export')  # Выгрузка в NDJSON
 
 # Добавляем кастомные URL для комментариев
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', index),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus
+
+    # Чтение без sync-адаптеров под ASGI (posts/async_views.py)
+    path('api/async/posts/', async_views.post_list, name='async-post-list'),
+    path('api/async/posts/<int:post_id>/', async_views.post_detail, name='async-post-detail'),
+    path('api/async/posts/<int:post_id>/comments/', async_views.comment_list, name='async-comment-list'),
+    path('api/async/posts/<int:post_id>/likes/', async_views.like_list, name='async-like-list'),
 
     # Включаем роутинг DRF
     path('api/', include(router.urls)),  # Все API начинается с /api/
@@ -38,6 +53,9 @@ urlpatterns = [
         name='comment-detail'
     ),
 
+    # Пакетное создание комментариев (posts/batch.py)
+    path('api/comments/batch/', CommentViewSet.as_view({'post': 'batch'}), name='comment-batch'),
+
 path(
         'api/posts/<int:post_id>/likes/',
         LikeViewSet.as_view({
@@ -54,7 +72,20 @@ path(
             'delete': 'destroy'
         }),
         name='like-detail'
+    ),
+
+    # Подписка на автора
+    path(
+        'api/users/<int:user_id>/follow/',
+        FollowViewSet.as_view({
+            'post': 'create',
+            'delete': 'destroy'
+        }),
+        name='follow'
     )
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Медиафайлы с ETag, Range и передачей прокси (см. posts/media.py)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+]
\ No newline at end of file